@@ -1,7 +1,12 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import FitnessClass, Booking, Profile  # Added Profile
+from django.http import HttpResponseRedirect
+from django.utils import timezone
+from .exceptions import BookingError
+from .models import FitnessClass, Booking, Profile, WaitlistEntry, OutboxEmail, ClassSeries  # Added Profile
+from . import services
 
 class FitnessClassAdmin(admin.ModelAdmin):
     list_display = ('name', 'start_time', 'end_time', 'capacity')
@@ -18,23 +23,98 @@ class FitnessClassAdmin(admin.ModelAdmin):
         }),
     )
 
+class BookingAdminForm(forms.ModelForm):
+    class Meta:
+        model = Booking
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        fitness_class = cleaned_data.get('fitness_class') or getattr(self.instance, 'fitness_class', None)
+        if fitness_class is None or cleaned_data.get('cancelled'):
+            return cleaned_data
+        # Only creating or reinstating a booking takes a seat
+        if self.instance.pk is None or self.instance.cancelled:
+            try:
+                services.check_bookable(fitness_class, allow_past=True)
+            except BookingError as exc:
+                raise forms.ValidationError(exc.message)
+        return cleaned_data
+
 class BookingAdmin(admin.ModelAdmin):
+    form = BookingAdminForm
     list_display = ('user', 'fitness_class', 'created', 'attended', 'cancelled')  # Changed booking_date to created
     list_filter = ('created', 'fitness_class', 'attended', 'cancelled')  # Changed booking_date to created
     search_fields = ('user__username', 'fitness_class__name')
     date_hierarchy = 'created'  # Changed booking_date to created
     raw_id_fields = ('user', 'fitness_class')
+    list_select_related = ('user', 'fitness_class')
     
     def get_readonly_fields(self, request, obj=None):
         if obj:  # Editing an existing booking
             return ('user', 'fitness_class', 'created')  # Changed booking_date to created
         return ()
 
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except BookingError as exc:
+            # The seat went to a concurrent booking after clean() passed; the
+            # save was rolled back with the admin's transaction
+            self.message_user(request, exc.message, messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+    def save_model(self, request, obj, form, change):
+        if change or obj.cancelled:
+            super().save_model(request, obj, form, change)
+            return
+        # New bookings go through the same seat-claiming path as the site
+        booking, _ = services.book_class(obj.user, obj.fitness_class, allow_past=True)
+        if obj.attended:
+            booking.attended = True
+            booking.save()
+        obj.pk = booking.pk
+        obj._state.adding = False
+
 # Register models
 admin.site.register(FitnessClass, FitnessClassAdmin)
 admin.site.register(Booking, BookingAdmin)
 admin.site.register(Profile)  # Register the Profile model
 
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'fitness_class', 'created')
+    search_fields = ('user__username', 'fitness_class__name')
+    raw_id_fields = ('user', 'fitness_class')
+    list_select_related = ('user', 'fitness_class')
+
+admin.site.register(WaitlistEntry, WaitlistEntryAdmin)
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('template', 'booking', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'template')
+    raw_id_fields = ('booking',)
+    # Booking.__str__ reads the user and the class
+    list_select_related = ('booking__user', 'booking__fitness_class')
+    readonly_fields = ('created', 'modified', 'sent_at', 'last_error')
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status=OutboxEmail.SENT).update(
+            status=OutboxEmail.PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} email(s) requeued.')
+    requeue.short_description = 'Requeue selected emails'
+
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
+
+class ClassSeriesAdmin(admin.ModelAdmin):
+    list_display = ('rule', 'created')
+    readonly_fields = ('created', 'modified')
+
+admin.site.register(ClassSeries, ClassSeriesAdmin)
+
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'date_joined')
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'date_joined')
@@ -0,0 +1,145 @@
+"""
+Helpers for the async read views (home, class_detail, my_bookings and
+check_class_availability), served by fitness_project.asgi under uvicorn.
+
+Django 4.2's login_required, cache_control and condition decorators only
+wrap sync views, and request.user loads with a blocking query, so the
+async views use login_required(), get_user(), not_modified() and finish()
+from here instead.
+
+gather() runs independent ORM calls at the same time. Each call runs on a
+thread from a pool of ASYNC_QUERY_THREADS threads, and each thread has its
+own database connection. A call inside a transaction has to use that
+transaction's connection, so there the calls run one after another on it
+instead (this includes tests and ATOMIC_REQUESTS). Queries on the pool
+threads count towards the request's QueryStats (booking.middleware).
+
+Under ASGI, Django 4.2 reads a sync streaming body with sync_to_async(list),
+so the whole body is built before the first byte goes out. Streaming
+responses take their chunks through streaming_content() to avoid that.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django import shortcuts
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections, connection, connections
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .middleware import active_stats
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _query_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ASYNC_QUERY_THREADS,
+                    thread_name_prefix='booking-query'
+                )
+    return _executor
+
+
+def _on_pool_thread(function, stats=None):
+    # What request_started/request_finished do for a request's own thread:
+    # apply CONN_MAX_AGE and health checks to this thread's connection
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            if stats is not None:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(stats))
+            return function()
+    finally:
+        close_old_connections()
+
+
+async def gather(*functions):
+    """Call the blocking ``functions`` concurrently and return their results in order"""
+    in_transaction = await sync_to_async(lambda: connection.in_atomic_block)()
+    if in_transaction or len(functions) < 2 or settings.ASYNC_QUERY_THREADS < 2:
+        return [await sync_to_async(function)() for function in functions]
+    stats = active_stats()
+    return await asyncio.gather(*(
+        sync_to_async(_on_pool_thread, thread_sensitive=False, executor=_query_executor())(function, stats)
+        for function in functions
+    ))
+
+
+async def get_user(request):
+    """request.user, loaded off the event loop"""
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+def login_required(view):
+    """django.contrib.auth.decorators.login_required for async views"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await get_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """The 304/412 response django.views.decorators.http.condition would return, or None"""
+    return get_conditional_response(
+        request,
+        etag=quote_etag(etag) if etag else None,
+        last_modified=int(last_modified.timestamp()) if last_modified else None
+    )
+
+
+def finish(request, response, etag=None, last_modified=None, **cache_control):
+    """Add the validators and Cache-Control headers the sync decorators would have set"""
+    if request.method in ('GET', 'HEAD'):
+        if etag and not response.has_header('ETag'):
+            response.headers['ETag'] = quote_etag(etag)
+        if last_modified and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    if cache_control:
+        patch_cache_control(response, **cache_control)
+    return response
+
+
+async def render(request, template_name, context=None):
+    """django.shortcuts.render; templates and context processors may still query"""
+    return await sync_to_async(shortcuts.render)(request, template_name, context)
+
+
+def streaming_content(request, chunks):
+    """
+    ``chunks`` as StreamingHttpResponse content that goes out as it is
+    produced: unchanged under WSGI, and under ASGI an async iterator that
+    fetches each chunk with its own sync_to_async() call. Those calls are
+    thread-sensitive, so a server-side cursor stays on the request's thread.
+    """
+    if isinstance(request, ASGIRequest):
+        return _iterate_async(chunks)
+    return chunks
+
+
+async def _iterate_async(chunks):
+    iterator = iter(chunks)
+    done = object()
+    try:
+        while (chunk := await sync_to_async(next)(iterator, done)) is not done:
+            yield chunk
+    finally:
+        # Ends the generator and its cursor if the client went away early
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
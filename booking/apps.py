@@ -1,4 +1,3 @@
-import booking.signals
 from django.apps import AppConfig
 from django.utils.translation import gettext_lazy as _
 
@@ -51,10 +50,12 @@ class BookingConfig(AppConfig):
         """
         try:
             from background_task.models import Task
-            from .tasks import send_reminders
+            from .tasks import clear_expired_sessions, send_reminders
             
             if not Task.objects.filter(task_name='booking.tasks.send_reminders').exists():
                 send_reminders(repeat=Task.DAILY, verbose_name="Daily booking reminders")
+            if not Task.objects.filter(task_name='booking.tasks.clear_expired_sessions').exists():
+                clear_expired_sessions(repeat=Task.DAILY, verbose_name="Daily expired session cleanup")
         except ImportError:
             # Background tasks not configured
             pass
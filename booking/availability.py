@@ -0,0 +1,127 @@
+"""
+Seat availability for many classes at once.
+
+Seats come from the denormalised ``booked_count`` column, so any number of
+classes costs one query, and the viewer's bookings among them cost one
+more. Seat counts are served from the two-tier read cache (booking.readcache)
+for up to AVAILABILITY_CACHE_TIMEOUT seconds, so a page full of polling
+clients does not reach the database; a seat change or a schedule change
+retires the affected entries in every worker. Listings and date windows
+cache which classes they show apart from the counts, so a booking only
+retires the entry of the class it was for.
+"""
+import copy
+
+from django.conf import settings
+
+from . import readcache
+from .models import Booking, FitnessClass
+
+# Largest batch one request may ask about
+MAX_CLASSES = 200
+
+
+def _seats(rows):
+    return {pk: max(capacity - booked_count, 0) for pk, capacity, booked_count in rows}
+
+
+def seats_for_ids(class_ids, loaded=None):
+    """
+    {class id: spots remaining} for the existing classes among ``class_ids``,
+    in that order. ``loaded`` maps ids to counts just read from the database;
+    those are cached as they are instead of queried again.
+    """
+    def factory(missing):
+        found = {pk: loaded[pk] for pk in missing if loaded and pk in loaded}
+        rest = [pk for pk in missing if pk not in found]
+        if rest:
+            found.update(_seats(
+                FitnessClass.objects.filter(
+                    pk__in=rest
+                ).order_by().values_list('pk', 'capacity', 'booked_count')
+            ))
+        return found
+
+    seats = readcache.get_many_or_set(
+        'seats',
+        class_ids,
+        lambda pk: [readcache.SCHEDULE, readcache.class_namespace(pk)],
+        factory,
+        settings.AVAILABILITY_CACHE_TIMEOUT
+    )
+    return {pk: seats[pk] for pk in class_ids if pk in seats}
+
+
+def seats_for_window(start, end):
+    """{class id: spots remaining} for active classes starting in [start, end), in start order"""
+    loaded = {}
+
+    def build():
+        loaded.update(_seats(
+            FitnessClass.objects.filter(
+                start_time__gte=start,
+                start_time__lt=end,
+                is_active=True
+            ).order_by('start_time', 'id').values_list('pk', 'capacity', 'booked_count')[:MAX_CLASSES]
+        ))
+        return list(loaded)
+
+    # The window's classes are cached until the schedule changes, their
+    # counts per class
+    class_ids = readcache.get_or_set(
+        'seats_window',
+        f'{start.isoformat()}:{end.isoformat()}',
+        [readcache.SCHEDULE],
+        build,
+        settings.AVAILABILITY_CACHE_TIMEOUT
+    )
+    return seats_for_ids(class_ids, loaded)
+
+
+def with_current_seats(classes, loaded=False):
+    """
+    Copies of ``classes`` (say, from a cached listing) whose booked_count
+    gives the current seat count, read through seats_for_ids(). ``loaded``
+    says the instances were just read, so their counts can seed the cache.
+    """
+    seats = seats_for_ids(
+        [fitness_class.pk for fitness_class in classes],
+        {fitness_class.pk: fitness_class.spots_remaining for fitness_class in classes} if loaded else None
+    )
+    fresh = []
+    for fitness_class in classes:
+        # Copied so the instances held by the local cache tier are never changed
+        fitness_class = copy.copy(fitness_class)
+        if fitness_class.pk in seats:
+            fitness_class.booked_count = fitness_class.capacity - seats[fitness_class.pk]
+        fresh.append(fitness_class)
+    return fresh
+
+
+def booked_class_ids(user, class_ids):
+    """The subset of ``class_ids`` the user holds a live booking for (one query)"""
+    if not user.is_authenticated or not class_ids:
+        return set()
+    return set(
+        Booking.objects.filter(
+            user=user,
+            fitness_class_id__in=class_ids,
+            cancelled=False
+        ).order_by().values_list('fitness_class_id', flat=True)
+    )
+
+
+def availability(user, seats, booked=None):
+    """Combine seat counts with the user's bookings (``booked``, looked up if None) into API rows"""
+    if booked is None:
+        booked = booked_class_ids(user, list(seats))
+    return [
+        {
+            'id': pk,
+            'available': spots > 0,
+            'is_booked': pk in booked,
+            'spots_remaining': spots,
+        }
+        for pk, spots in seats.items()
+    ]
+
@@ -0,0 +1,227 @@
+"""
+View benchmarks driven through the Django test client.
+
+Each scenario builds one request (who, method, URL) against the seeded
+data. run() times repeated requests and reports latency percentiles, query
+counts, database time and the peak Python memory allocated by one request.
+Query counts and database time come from the request's QueryStats, which
+also cover the queries booking.aio.gather() runs on its pool threads.
+login_writes() counts the write statements one sign-in issues. The result
+is a JSON-serialisable dict that can be compared across commits.
+"""
+import math
+import platform
+import random
+import re
+import subprocess
+import time
+import tracemalloc
+from collections import Counter
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Booking, FitnessClass
+
+
+def _upcoming_class(rng, data):
+    return rng.choice(data['upcoming_class_ids'])
+
+
+def _member(rng, data):
+    return rng.choice(data['member_ids'])
+
+
+# name: callable(rng, data) -> (user id or None, method, url)
+SCENARIOS = {
+    'home': lambda rng, data: (
+        None, 'get', reverse('booking:home')
+    ),
+    'class_detail': lambda rng, data: (
+        _member(rng, data), 'get', reverse('booking:class_detail', args=[_upcoming_class(rng, data)])
+    ),
+    'book_class': lambda rng, data: (
+        _member(rng, data), 'post', reverse('booking:book_class', args=[_upcoming_class(rng, data)])
+    ),
+    'my_bookings': lambda rng, data: (
+        _member(rng, data), 'get', reverse('booking:my_bookings')
+    ),
+    'profile': lambda rng, data: (
+        _member(rng, data), 'get', reverse('booking:profile')
+    ),
+    'manage_classes': lambda rng, data: (
+        data['staff_id'], 'get', reverse('booking:manage_classes')
+    ),
+    'check_class_availability': lambda rng, data: (
+        _member(rng, data), 'get', reverse('booking:check_class_availability', args=[_upcoming_class(rng, data)])
+    ),
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def benchmark_data(staff_username='benchmark_staff', sample_size=1000, seed=0):
+    """Ids the scenarios draw from: members with bookings, upcoming classes and a staff user"""
+    staff, _created = User.objects.get_or_create(
+        username=staff_username,
+        defaults={'is_staff': True, 'email': f'{staff_username}@example.com'}
+    )
+    member_ids = list(
+        Booking.objects.order_by().values_list('user_id', flat=True).distinct()[:sample_size]
+    )
+    upcoming_class_ids = list(
+        FitnessClass.objects.filter(
+            start_time__gte=timezone.now(),
+            is_active=True
+        ).order_by('start_time').values_list('pk', flat=True)[:sample_size]
+    )
+    rng = random.Random(seed)
+    rng.shuffle(member_ids)
+    return {
+        'staff_id': staff.pk,
+        'member_ids': member_ids or [staff.pk],
+        'upcoming_class_ids': upcoming_class_ids or [0],
+    }
+
+
+def _request(client, users, user_id, method, url):
+    client.logout()
+    if user_id is not None:
+        if user_id not in users:
+            users[user_id] = User.objects.get(pk=user_id)
+        client.force_login(users[user_id])
+    start = time.perf_counter()
+    response = getattr(client, method)(url)
+    elapsed = time.perf_counter() - start
+    # Set by QueryStatsMiddleware; a CaptureQueriesContext here would only
+    # see this thread's connection
+    stats = response.wsgi_request.query_stats
+    return response, elapsed, stats.count, stats.duration
+
+
+def run_view(name, data, iterations=50, warmup=3, seed=0):
+    """Benchmark one scenario; failures are counted, not raised"""
+    rng = random.Random(f'{seed}:{name}')
+    client = Client()
+    users = {}
+    latencies, query_counts, db_times = [], [], []
+    errors, error, statuses = 0, None, {}
+
+    for number in range(warmup + iterations):
+        user_id, method, url = SCENARIOS[name](rng, data)
+        try:
+            response, elapsed, query_count, db_time = _request(client, users, user_id, method, url)
+        except Exception as exc:
+            errors += 1
+            error = error or f'{type(exc).__name__}: {exc}'
+            continue
+        if number < warmup:
+            continue
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        latencies.append(elapsed * 1000)
+        query_counts.append(query_count)
+        db_times.append(db_time * 1000)
+
+    # Peak allocation for one request, measured apart from the timed runs
+    peak_memory_kb = None
+    user_id, method, url = SCENARIOS[name](rng, data)
+    tracemalloc.start()
+    try:
+        _request(client, users, user_id, method, url)
+        peak_memory_kb = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    except Exception:
+        pass
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'error': error,
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+        'p50_ms': _round(percentile(latencies, 50)),
+        'p95_ms': _round(percentile(latencies, 95)),
+        'p99_ms': _round(percentile(latencies, 99)),
+        'max_ms': _round(max(latencies, default=None)),
+        'queries_p50': percentile(query_counts, 50),
+        'queries_max': max(query_counts, default=None),
+        'db_time_p50_ms': _round(percentile(db_times, 50)),
+        'peak_memory_kb': peak_memory_kb,
+    }
+
+
+WRITE_STATEMENT = re.compile(r'^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)"?', re.IGNORECASE)
+
+
+def login_writes(user):
+    """
+    Write statements issued by signing ``user`` in, by table. Session
+    writes are reported apart; ``writes`` counts everything else.
+    """
+    client = Client()
+    with CaptureQueriesContext(connection) as queries:
+        client.force_login(user)
+    tables = Counter()
+    for query in queries.captured_queries:
+        match = WRITE_STATEMENT.match(query['sql'])
+        if match:
+            tables[match.group(1)] += 1
+    session_writes = tables.pop('django_session', 0)
+    return {
+        'queries': len(queries),
+        'writes': sum(tables.values()),
+        'session_writes': session_writes,
+        'tables': dict(sorted(tables.items())),
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(views=None, iterations=50, warmup=3, seed=0, dataset=None):
+    """Benchmark ``views`` (default: every scenario) and return the report dict"""
+    data = benchmark_data(seed=seed)
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'iterations': iterations,
+            'warmup': warmup,
+            'seed': seed,
+            'dataset': dataset or {
+                'members': User.objects.count(),
+                'classes': FitnessClass.objects.count(),
+                'bookings': Booking.objects.count(),
+            },
+        },
+        'views': {
+            name: run_view(name, data, iterations=iterations, warmup=warmup, seed=seed)
+            for name in (views or SCENARIOS)
+        },
+        'login': login_writes(User.objects.get(pk=data['member_ids'][0])),
+    }
@@ -0,0 +1,118 @@
+"""
+Conditional GET support for class pages.
+
+A class page changes when the class row changes (``modified``), when one of
+its bookings changes (the newest ``Booking.modified`` plus ``booked_count``,
+which also catches deletions), or when the schedule shown beside it
+changes. The schedule side is tracked as one cached "schedule changed at"
+timestamp, bumped whenever any class is saved or deleted. A time bucket
+is added so that similar classes that have started drop off within
+CLASS_DETAIL_CACHE_TIMEOUT seconds. Together these give Last-Modified and,
+with the viewer's own booking state, the ETag.
+
+The pieces are separate functions so the async class_detail view can run
+the booking lookup and the similar-classes query side by side.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import OuterRef, Subquery
+from django.http import Http404
+from django.utils import timezone
+
+from . import readcache
+from .models import Booking, FitnessClass
+
+SCHEDULE_KEY = 'booking:schedule_changed_at'
+
+
+def touch_schedule():
+    """Record that the class schedule changed (any class added, edited or removed)"""
+    cache.set(SCHEDULE_KEY, timezone.now(), None)
+    readcache.bump(readcache.SCHEDULE)
+
+
+def schedule_changed_at():
+    """When the schedule last changed; a lost entry counts as a change now"""
+    changed_at = cache.get(SCHEDULE_KEY)
+    if changed_at is None:
+        changed_at = timezone.now()
+        cache.add(SCHEDULE_KEY, changed_at, None)
+    return changed_at
+
+
+def _bucket_start(now):
+    timeout = max(settings.CLASS_DETAIL_CACHE_TIMEOUT, 1)
+    return datetime.fromtimestamp(int(now.timestamp()) // timeout * timeout, tz=dt_timezone.utc)
+
+
+def _load_class(pk):
+    """The class with its newest booking change, or None"""
+    last_booking_change = Booking.objects.filter(
+        fitness_class=OuterRef('pk')
+    ).order_by('-modified').values('modified')[:1]
+    return FitnessClass.objects.defer('search_vector').annotate(
+        last_booking_change=Subquery(last_booking_change)
+    ).filter(pk=pk).first()
+
+
+def get_class(pk):
+    """The class for its detail page (from the read cache), or Http404"""
+    fitness_class = readcache.get_or_set(
+        'class_detail',
+        pk,
+        [readcache.SCHEDULE, readcache.class_namespace(pk)],
+        lambda: _load_class(pk)
+    )
+    if fitness_class is None:
+        raise Http404('No fitness class matches the given query.')
+    return fitness_class
+
+
+def schedule_version():
+    return max(schedule_changed_at(), _bucket_start(timezone.now()))
+
+
+def fragment_version(fitness_class, version):
+    """
+    Keys the cached description/similar-classes fragment, which does not
+    depend on bookings
+    """
+    return f"{fitness_class.modified.timestamp()}:{version.timestamp()}"
+
+
+def fragment_cached(pk, fragment):
+    """Whether the class page's shared fragment is cached, so similar classes need no query"""
+    # {% cache %} uses the default cache unless a 'template_fragments' one exists
+    return cache.has_key(make_template_fragment_key('class_detail_body', [pk, fragment]))
+
+
+def booking_state(user, pk):
+    """None: never booked, False: booked, True: booked then cancelled"""
+    if not user.is_authenticated:
+        return None
+    return Booking.objects.filter(
+        user=user,
+        fitness_class_id=pk
+    ).order_by().values_list('cancelled', flat=True).first()
+
+
+def validators(request, fitness_class, version, booking_cancelled):
+    """(etag, last_modified) for the viewer's class page; (None, None) when it must be rendered"""
+    # A page carrying flash messages has to be rendered
+    if len(messages.get_messages(request)):
+        return None, None
+    last_modified = max(
+        fitness_class.modified,
+        fitness_class.last_booking_change or fitness_class.modified,
+        version
+    )
+    etag = hashlib.md5(
+        f"{fitness_class.pk}:{last_modified.isoformat()}:{fitness_class.booked_count}:"
+        f"{request.user.pk}:{booking_cancelled}".encode()
+    ).hexdigest()
+    return etag, last_modified
@@ -0,0 +1,134 @@
+"""
+Database connection reuse and its statistics.
+
+Two production modes, picked with DB_CONN_MODE (see settings.py):
+
+* ``persistent``: Django's own persistent connections. Each worker thread
+  keeps one connection for DB_CONN_MAX_AGE seconds and health-checks it
+  before reuse. This suits sync and gthread gunicorn workers, which use at
+  most one connection per thread.
+* ``pool``: ENGINE ``booking.dbpool``. This is django-db-geventpool with
+  wait-time accounting, giving one bounded pool of DB_POOL_MAX_CONNS
+  connections per process that greenlets borrow for a request. It is for
+  gevent workers, where a thread-per-connection budget does not apply.
+
+stats() reports connection usage for this process in either mode;
+timed_checkout() and record_connect() feed it.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+class WaitStats:
+    """Connections handed out, and how long each request waited for one"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.count = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def record(self, wait=0.0):
+        with self.lock:
+            self.count += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'count': self.count,
+                'wait_avg_ms': round(self.total_wait / self.count * 1000, 2) if self.count else None,
+                'wait_max_ms': round(self.max_wait * 1000, 2),
+            }
+
+
+# alias: WaitStats
+_wait_stats = {}
+_wait_stats_lock = threading.Lock()
+
+
+def wait_stats(alias):
+    with _wait_stats_lock:
+        return _wait_stats.setdefault(alias, WaitStats())
+
+
+def _pool(connection):
+    # A property on pooled wrappers only; reading it never opens a connection
+    return connection.pool if hasattr(type(connection), 'pool') else None
+
+
+def record_connect(connection):
+    """Count a new DB-API connection (connection_created); pooled checkouts time themselves"""
+    if _pool(connection) is None:
+        wait_stats(connection.alias).record()
+
+
+class timed_checkout:
+    """Context manager timing a pooled checkout for ``alias``"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        wait_stats(self.alias).record(time.perf_counter() - self.start)
+
+
+def stats(alias='default'):
+    """Connection usage for ``alias`` in this process"""
+    connection = connections[alias]
+    settings_dict = connection.settings_dict
+    result = {'alias': alias, 'vendor': connection.vendor}
+    pool = _pool(connection)
+    counts = wait_stats(alias).as_dict()
+    if pool is not None:
+        idle = pool.pool.qsize()
+        result.update({
+            'mode': 'pool',
+            'max_connections': pool.maxsize,
+            'open': pool.size,
+            'idle': idle,
+            'in_use': max(pool.size - idle, 0),
+            'checkouts': counts['count'],
+            'wait_avg_ms': counts['wait_avg_ms'],
+            'wait_max_ms': counts['wait_max_ms'],
+        })
+    else:
+        result.update({
+            'mode': 'persistent' if settings_dict.get('CONN_MAX_AGE') else 'per-request',
+            'conn_max_age': settings_dict.get('CONN_MAX_AGE'),
+            'health_checks': settings_dict.get('CONN_HEALTH_CHECKS', False),
+            # Only the calling thread's connection is visible from here
+            'in_use': int(connection.connection is not None),
+            # New connections opened; stays low while reuse works
+            'connects': counts['count'],
+        })
+    result['budget'] = connection_budget()
+    return result
+
+
+def connection_budget():
+    """Most connections this deployment can open, to compare with Postgres max_connections"""
+    workers = settings.GUNICORN_WORKERS
+    if settings.DB_CONN_MODE == 'pool':
+        per_worker = settings.DB_POOL_MAX_CONNS
+    else:
+        if settings.GUNICORN_WORKER_CLASS == 'uvicorn':
+            per_worker = settings.GUNICORN_WORKER_CONNECTIONS
+        else:
+            per_worker = settings.GUNICORN_THREADS
+        # booking.aio's query threads keep a connection each under any worker
+        # class, since the async views run under WSGI workers too
+        if settings.ASYNC_QUERY_THREADS > 1:
+            per_worker += settings.ASYNC_QUERY_THREADS
+    return {'workers': workers, 'per_worker': per_worker, 'total': workers * per_worker}
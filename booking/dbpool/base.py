@@ -0,0 +1,23 @@
+"""
+ENGINE ``booking.dbpool``: django-db-geventpool's PostgreSQL pool, with the
+time spent waiting for a free connection recorded for booking.dbpool.stats().
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    from django_db_geventpool.backends.postgresql_psycopg2 import base
+except ImportError as exc:
+    raise ImproperlyConfigured(
+        'DB_CONN_MODE=pool requires django-db-geventpool and gevent'
+    ) from exc
+
+from . import timed_checkout
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        if self.connection is not None:
+            return self.connection
+        # Blocks (yielding to other greenlets) while all MAX_CONNS are in use
+        with timed_checkout(self.alias):
+            return super().get_new_connection(conn_params)
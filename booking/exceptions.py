@@ -0,0 +1,22 @@
+from django.utils.translation import gettext_lazy as _
+
+
+class BookingError(Exception):
+    """Base class for booking failures that should be reported to the user"""
+    default_message = _('This class cannot be booked.')
+
+    def __init__(self, message=None):
+        self.message = message or self.default_message
+        super().__init__(self.message)
+
+
+class ClassNotBookableError(BookingError):
+    default_message = _('Cannot book a class that has already occurred.')
+
+
+class ClassFullError(BookingError):
+    default_message = _('This class is full.')
+
+
+class AlreadyBookedError(BookingError):
+    default_message = _('You have already booked this class!')
@@ -0,0 +1,228 @@
+"""
+Streaming attendance and roster exports.
+
+Rows come from ``values_list().iterator()`` (a server-side cursor on Postgres)
+and are encoded as they are read, so an export holds one chunk of bookings in
+memory at a time and the first bytes go out before the query has finished.
+Under ASGI the chunks go through aio.streaming_content(), which keeps that
+true there too.
+"""
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from . import aio
+from .models import Booking
+
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_CONTENT_TYPE = 'text/csv'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+FORMATS = ('csv', 'xlsx')
+
+ATTENDANCE_HEADER = ('Participant', 'Username', 'Email', 'Booked at', 'Attended')
+ROSTER_HEADER = (
+    'Class', 'Class type', 'Instructor', 'Start', 'End',
+    'Participant', 'Username', 'Email', 'Booked at', 'Attended',
+)
+
+USER_FIELDS = ('user__first_name', 'user__last_name', 'user__username', 'user__email')
+
+# Cells starting with these are evaluated as formulas by spreadsheet apps.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _format_time(value):
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M') if value else ''
+
+
+def _participant(first_name, last_name, username):
+    return f'{first_name} {last_name}'.strip() or username
+
+
+def attendance_rows(fitness_class):
+    """Header plus one row per live booking of ``fitness_class``."""
+    yield ATTENDANCE_HEADER
+    rows = Booking.objects.filter(
+        fitness_class=fitness_class,
+        cancelled=False
+    ).order_by('user__last_name', 'user__first_name', 'pk').values_list(
+        *USER_FIELDS, 'created', 'attended'
+    )
+    for first_name, last_name, username, email, created, attended in rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield (
+            _participant(first_name, last_name, username),
+            username,
+            email,
+            _format_time(created),
+            attended,
+        )
+
+
+def roster_rows(start, end):
+    """Header plus one row per live booking in classes starting in ``[start, end)``."""
+    yield ROSTER_HEADER
+    rows = Booking.objects.filter(
+        cancelled=False,
+        fitness_class__start_time__gte=start,
+        fitness_class__start_time__lt=end
+    ).order_by('fitness_class__start_time', 'fitness_class_id', 'pk').values_list(
+        'fitness_class__name',
+        'fitness_class__class_type',
+        'fitness_class__instructor',
+        'fitness_class__start_time',
+        'fitness_class__end_time',
+        *USER_FIELDS,
+        'created',
+        'attended'
+    )
+    for (name, class_type, instructor, start_time, end_time,
+         first_name, last_name, username, email, created, attended) in rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        yield (
+            name,
+            class_type,
+            instructor,
+            _format_time(start_time),
+            _format_time(end_time),
+            _participant(first_name, last_name, username),
+            username,
+            email,
+            _format_time(created),
+            attended,
+        )
+
+
+class _Echo:
+    """Write target that hands each write straight back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+class _ChunkBuffer:
+    """Unseekable sink for ZipFile; the bytes written so far are collected with drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+XLSX_STATIC_PARTS = (
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+     'Target="xl/workbook.xml"/>'
+     '</Relationships>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+     'Target="worksheets/sheet1.xml"/>'
+     '</Relationships>'),
+)
+
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+
+def _xlsx_cell(value):
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    text = escape(ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def stream_xlsx(rows, sheet_name='Sheet1'):
+    """
+    Minimal single-sheet workbook (inline strings, no styles) written through
+    zipfile as rows arrive, so no spreadsheet library or temp file is needed.
+    """
+    buffer = _ChunkBuffer()
+    sheet_name = escape(re.sub(r'[\[\]:*?/\\]', '', sheet_name)[:31] or 'Sheet1')
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC_PARTS:
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(name=sheet_name))
+        yield buffer.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>'
+            )
+            for row in rows:
+                sheet.write(
+                    ('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>').encode()
+                )
+                data = buffer.drain()
+                if data:
+                    yield data
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+
+def export_response(request, rows, filename, export_format='csv', sheet_name='Sheet1'):
+    """StreamingHttpResponse for ``rows`` as ``<filename>.csv`` or ``.xlsx``."""
+    if export_format == 'xlsx':
+        chunks, content_type = stream_xlsx(rows, sheet_name), XLSX_CONTENT_TYPE
+    else:
+        export_format = 'csv'
+        chunks, content_type = stream_csv(rows), CSV_CONTENT_TYPE
+    response = StreamingHttpResponse(aio.streaming_content(request, chunks), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
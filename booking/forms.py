@@ -1,7 +1,10 @@
+from datetime import date
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .models import Profile, FitnessClass
+from . import recurrence
 
 class CustomUserCreationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -20,6 +23,50 @@ class CustomUserCreationForm(UserCreationForm):
         return user
 
 class FitnessClassForm(forms.ModelForm):
+    REPEAT_CHOICES = (
+        ('', 'Does not repeat'),
+        ('weekly', 'Weekly'),
+        ('custom', 'Custom rule'),
+    )
+    APPLY_TO_CHOICES = (
+        ('this', 'This class only'),
+        ('following', 'This and all following classes'),
+    )
+    # Only offered when adding a class
+    RECURRENCE_FIELDS = (
+        'repeat', 'repeat_days', 'repeat_interval', 'repeat_count',
+        'repeat_until', 'repeat_rule', 'repeat_exceptions',
+    )
+
+    repeat = forms.ChoiceField(choices=REPEAT_CHOICES, required=False)
+    repeat_days = forms.MultipleChoiceField(
+        choices=recurrence.WEEKDAYS,
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        help_text='Defaults to the weekday of the first class'
+    )
+    repeat_interval = forms.IntegerField(min_value=1, initial=1, required=False, help_text='Every N weeks')
+    repeat_count = forms.IntegerField(
+        min_value=1,
+        max_value=recurrence.MAX_OCCURRENCES,
+        required=False,
+        help_text='Number of classes in the series'
+    )
+    repeat_until = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        help_text='Last date of the series (ignored when a number of classes is set)'
+    )
+    repeat_rule = forms.CharField(
+        required=False,
+        help_text='RRULE, e.g. FREQ=WEEKLY;BYDAY=TU,TH;COUNT=12'
+    )
+    repeat_exceptions = forms.CharField(
+        required=False,
+        help_text='Dates to skip, comma separated (YYYY-MM-DD)'
+    )
+    apply_to = forms.ChoiceField(choices=APPLY_TO_CHOICES, initial='this', required=False)
+
     class Meta:
         model = FitnessClass
         fields = '__all__'
@@ -28,6 +75,69 @@ class FitnessClassForm(forms.ModelForm):
             'end_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recurrence_rule = None
+        self.occurrences = []
+        if self.instance.pk is None:
+            del self.fields['apply_to']
+        else:
+            for name in self.RECURRENCE_FIELDS:
+                del self.fields[name]
+            if self.instance.series_id is None:
+                del self.fields['apply_to']
+
+    def clean_repeat_exceptions(self):
+        skipped = []
+        for value in self.cleaned_data.get('repeat_exceptions', '').split(','):
+            value = value.strip()
+            if not value:
+                continue
+            try:
+                skipped.append(date.fromisoformat(value))
+            except ValueError:
+                raise forms.ValidationError(f'"{value}" is not a YYYY-MM-DD date.')
+        return skipped
+
+    def clean(self):
+        cleaned_data = super().clean()
+        repeat = cleaned_data.get('repeat')
+        start_time = cleaned_data.get('start_time')
+        end_time = cleaned_data.get('end_time')
+        # A single bad time is reported by the end_time_after_start_time check
+        if not repeat or start_time is None or end_time is None or end_time <= start_time:
+            return cleaned_data
+
+        if repeat == 'weekly':
+            count = cleaned_data.get('repeat_count')
+            until = cleaned_data.get('repeat_until')
+            if not count and not until:
+                self.add_error('repeat_count', 'Set the number of classes or an end date.')
+                return cleaned_data
+            weekday = recurrence.WEEKDAYS[timezone.localtime(start_time).weekday()][0]
+            rule = recurrence.weekly_rule(
+                cleaned_data.get('repeat_days') or [weekday],
+                cleaned_data.get('repeat_interval') or 1,
+                until,
+                count
+            )
+        else:
+            rule = cleaned_data.get('repeat_rule', '').strip()
+            if not rule:
+                self.add_error('repeat_rule', 'Enter a recurrence rule.')
+                return cleaned_data
+
+        # Every occurrence is checked before anything is written
+        try:
+            self.occurrences = recurrence.expand(
+                rule, start_time, end_time, cleaned_data.get('repeat_exceptions', [])
+            )
+        except forms.ValidationError as error:
+            self.add_error('repeat_rule' if repeat == 'custom' else 'repeat', error)
+        else:
+            self.recurrence_rule = rule
+        return cleaned_data
+
 class ProfileForm(forms.ModelForm):
     class Meta:
         model = Profile
@@ -0,0 +1,241 @@
+"""
+iCalendar (.ics) feeds that calendar apps subscribe to: a member's booked
+classes and the classes an instructor teaches.
+
+Feed URLs carry a signed token naming the owner, the feed and the owner's
+Profile.calendar_feed_key, so a calendar app needs no session, and a member
+who shared a URL by mistake can revoke it by resetting that key.
+
+Apps poll every few minutes, so a feed is built once and then served from
+the read cache until something it shows changes: any
+class (``schedule``) or, for a member feed, the member's bookings
+(``member:<user_id>``). The ETag is derived from those versions, so a poll
+that matches it is answered 304 without loading any classes. A cache miss
+streams the calendar as rows are read, like the exports, and stores the
+whole body once the last line has gone out (a chunk at a time under ASGI
+too, through aio.streaming_content()).
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.utils.crypto import constant_time_compare
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from . import aio, readcache
+from .models import Booking, FitnessClass, Profile
+
+MEMBER = 'bookings'
+INSTRUCTOR = 'classes'
+FEEDS = (MEMBER, INSTRUCTOR)
+
+FEED_CHUNK_SIZE = 2000
+CONTENT_TYPE = 'text/calendar; charset=utf-8'
+PRODID = '-//Fitness Booking//Class Schedule//EN'
+
+CLASS_FIELDS = (
+    'id', 'name', 'instructor', 'location', 'description',
+    'start_time', 'end_time', 'modified', 'is_active',
+)
+
+# Lines longer than this many octets are folded (RFC 5545, 3.1)
+LINE_LIMIT = 75
+
+_signer = signing.Signer(salt='booking.ical')
+
+
+def instructor_name(user):
+    """The FitnessClass.instructor value for classes ``user`` teaches"""
+    return user.get_full_name() or user.username
+
+
+def feed_token(user, feed):
+    return _signer.sign(f'{user.pk}:{feed}:{Profile.for_user(user).calendar_feed_key}')
+
+
+def feed_url(request, user, feed):
+    """Absolute URL of ``user``'s ``feed``, for pasting into a calendar app"""
+    return request.build_absolute_uri(
+        reverse('booking:calendar_feed', args=[feed_token(user, feed)])
+    )
+
+
+def read_token(token):
+    """(user_id, feed, feed key) for a token from feed_token(); Http404 if it was tampered with"""
+    try:
+        user_id, feed, key = _signer.unsign(token).split(':')
+        user_id = int(user_id)
+    except (signing.BadSignature, ValueError):
+        raise Http404('Unknown calendar feed')
+    if feed not in FEEDS:
+        raise Http404('Unknown calendar feed')
+    return user_id, feed, key
+
+
+def _current_key(owner):
+    try:
+        return owner.profile.calendar_feed_key
+    except Profile.DoesNotExist:
+        # No profile, so no feed URL was ever handed out
+        return None
+
+
+def window_start():
+    """Midnight CALENDAR_FEED_PAST_DAYS ago; older classes are left out of feeds"""
+    since = timezone.localdate() - timedelta(days=settings.CALENDAR_FEED_PAST_DAYS)
+    return timezone.make_aware(datetime.combine(since, time.min))
+
+
+def feed_state(request, token):
+    """
+    The feed owner and its versioned cache key, memoised on the request so
+    the etag function and the view share one lookup.
+    """
+    state = getattr(request, '_calendar_feed', None)
+    if state is None:
+        user_id, feed, key = read_token(token)
+        owner = get_user_model().objects.select_related('profile').filter(pk=user_id, is_active=True).first()
+        if owner is None or (feed == INSTRUCTOR and not owner.is_staff):
+            raise Http404('Unknown calendar feed')
+        current_key = _current_key(owner)
+        if not current_key or not constant_time_compare(key, current_key):
+            # Revoked by reset_calendar_feed
+            raise Http404('Unknown calendar feed')
+
+        since = window_start()
+        if feed == MEMBER:
+            namespaces = [readcache.SCHEDULE, readcache.member_namespace(owner.pk)]
+            key = f'{feed}:{owner.pk}:{since:%Y%m%d}'
+        else:
+            namespaces = [readcache.SCHEDULE]
+            key = f'{feed}:{instructor_name(owner)}:{since:%Y%m%d}'
+        state = request._calendar_feed = {
+            'owner': owner,
+            'feed': feed,
+            'since': since,
+            'cache_key': readcache.read_cache.entry_key('calendar', key, namespaces),
+        }
+    return state
+
+
+def feed_etag(request, token):
+    """The entry key changes whenever the feed's content can, so it doubles as the ETag"""
+    return feed_state(request, token)['cache_key'].rsplit(':', 1)[-1]
+
+
+def escape_text(value):
+    """Escape a TEXT property value (RFC 5545, 3.3.11)"""
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+        .replace('\r', '\\n')
+    )
+
+
+def fold(line):
+    """``line`` plus CRLF, folded so no physical line exceeds 75 octets"""
+    parts = []
+    current, size = [], 0
+    for char in line:
+        width = len(char.encode())
+        # Continuation lines start with a space, which counts towards the limit
+        if size + width > LINE_LIMIT - (1 if parts else 0):
+            parts.append(''.join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    parts.append(''.join(current))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_time(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event(pk, name, instructor, location, description, start_time, end_time, modified, is_active):
+    details = f'Instructor: {instructor}\n\n{description}'
+    status = 'CONFIRMED' if is_active else 'CANCELLED'
+    return ''.join(fold(line) for line in (
+        'BEGIN:VEVENT',
+        f'UID:fitness-class-{pk}@{settings.CALENDAR_FEED_UID_DOMAIN}',
+        f'DTSTAMP:{format_time(modified)}',
+        f'LAST-MODIFIED:{format_time(modified)}',
+        f'DTSTART:{format_time(start_time)}',
+        f'DTEND:{format_time(end_time)}',
+        f'SUMMARY:{escape_text(name)}',
+        f'LOCATION:{escape_text(location)}',
+        f'DESCRIPTION:{escape_text(details)}',
+        f'STATUS:{status}',
+        'END:VEVENT',
+    ))
+
+
+def _rows(owner, feed, since):
+    if feed == MEMBER:
+        # my_bookings' live bookings, plus the recent past
+        return Booking.objects.filter(
+            user=owner,
+            cancelled=False,
+            fitness_class__start_time__gte=since
+        ).order_by('fitness_class__start_time', 'fitness_class_id').values_list(
+            *(f'fitness_class__{field}' for field in CLASS_FIELDS)
+        )
+    # manage_classes' classes; cancelled ones stay so apps mark them cancelled
+    return FitnessClass.objects.filter(
+        instructor=instructor_name(owner),
+        start_time__gte=since
+    ).order_by('start_time', 'id').values_list(*CLASS_FIELDS)
+
+
+def calendar_lines(owner, feed, since):
+    """The feed as text chunks: the header, one chunk per event, the footer"""
+    if feed == MEMBER:
+        title = 'My fitness class bookings'
+    else:
+        title = f'Classes taught by {instructor_name(owner)}'
+    yield ''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(title)}',
+    ))
+    for row in _rows(owner, feed, since).iterator(chunk_size=FEED_CHUNK_SIZE):
+        yield _event(*row)
+    yield fold('END:VCALENDAR')
+
+
+def _stream_and_store(chunks, cache_key):
+    body = []
+    for chunk in chunks:
+        body.append(chunk)
+        yield chunk
+    # Only a feed that was sent in full is cached
+    readcache.read_cache.set(cache_key, ''.join(body), settings.CALENDAR_FEED_CACHE_TIMEOUT)
+
+
+def feed_response(request, state):
+    """The cached feed, or a response that streams and caches it"""
+    cached = readcache.read_cache.get(
+        'calendar', state['cache_key'], timeout=settings.CALENDAR_FEED_CACHE_TIMEOUT
+    )
+    if cached is not None:
+        response = HttpResponse(cached, content_type=CONTENT_TYPE)
+    else:
+        response = StreamingHttpResponse(
+            aio.streaming_content(request, _stream_and_store(
+                calendar_lines(state['owner'], state['feed'], state['since']),
+                state['cache_key']
+            )),
+            content_type=CONTENT_TYPE
+        )
+    response['Content-Disposition'] = f'inline; filename="{state["feed"]}.ics"'
+    return response
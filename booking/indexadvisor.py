@@ -0,0 +1,337 @@
+"""
+Index advisor for the app's hot queries.
+
+QUERIES registers the querysets behind the busiest pages, background tasks
+and admin lists. explain() runs EXPLAIN (ANALYZE, BUFFERS) on PostgreSQL,
+or EXPLAIN QUERY PLAN on SQLite, and reduces the plan to its steps: what
+each step does, which table it reads and through which index. A step that
+reads every row of a table is a full scan. advise() flags those and
+proposes the indexes from INDEXES that the queries want and the database
+lacks.
+
+A plan's steps are its shape. ``manage.py advise_indexes --snapshot``
+stores the shapes per database vendor in plan_snapshots/, and the tests
+compare against them. A dropped index, or a query rewritten so it no
+longer uses one, then fails a test instead of slowing production.
+"""
+import json
+import re
+from datetime import timedelta
+from pathlib import Path
+
+from django.db import connection
+from django.db.models import Count, Q
+from django.db.models import Index
+from django.utils import timezone
+
+from .leaderboard import BOARD_SIZE
+from .models import Booking, FitnessClass, OutboxEmail
+from .pagination import DEFAULT_PAGE_SIZE
+from .reminders import due_reminders
+
+SNAPSHOT_DIR = Path(__file__).resolve().parent / 'plan_snapshots'
+# seeding.seed() arguments the stored snapshots were taken with; plans on
+# PostgreSQL depend on table sizes, so the tests seed the same
+SNAPSHOT_DATASET = {'members': 100, 'classes': 200, 'bookings': 1500, 'seed': 0}
+ADMIN_PAGE_SIZE = 100
+
+
+def refresh_statistics():
+    """Let the planner see the current table sizes (PostgreSQL only)"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for model in (FitnessClass, Booking, OutboxEmail):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def sample(now=None):
+    """Values the hot queries run with: the busiest member and class, and its instructor"""
+    now = now or timezone.now()
+    busiest_member = Booking.objects.values('user').annotate(
+        total=Count('id')
+    ).order_by('-total', 'user').values_list('user', flat=True).first()
+    busiest_class = FitnessClass.objects.order_by('-booked_count', 'pk').values_list(
+        'pk', 'instructor'
+    ).first() or (0, '')
+    return {
+        'now': now,
+        'user_id': busiest_member or 0,
+        'class_id': busiest_class[0],
+        'instructor': busiest_class[1],
+    }
+
+
+def _past_class_ids(data):
+    # An empty IN () never reaches the database, so there would be no plan
+    return list(
+        FitnessClass.objects.filter(
+            instructor=data['instructor'],
+            start_time__lt=data['now']
+        ).order_by('-start_time', '-id').values_list('pk', flat=True)[:DEFAULT_PAGE_SIZE]
+    ) or [0]
+
+
+# name: (where it runs, callable(sample data) -> queryset)
+QUERIES = {
+    'class_listing': ('views.home', lambda data: (
+        FitnessClass.objects.filter(start_time__gte=data['now'], is_active=True)
+        .defer('search_vector').order_by('start_time', 'id')[:DEFAULT_PAGE_SIZE + 1]
+    )),
+    'popular_classes': ('leaderboard.compute_board', lambda data: (
+        FitnessClass.objects.filter(start_time__gte=data['now'], is_active=True)
+        .defer('search_vector').order_by('-booked_count', 'start_time')[:BOARD_SIZE]
+    )),
+    'similar_classes': ('views.class_detail', lambda data: (
+        FitnessClass.objects.filter(class_type='yoga', start_time__gte=data['now'], is_active=True)
+        .exclude(pk=data['class_id']).order_by('start_time')[:3]
+    )),
+    'availability_window': ('views.class_availability_api', lambda data: (
+        FitnessClass.objects.filter(
+            start_time__gte=data['now'],
+            start_time__lt=data['now'] + timedelta(days=7),
+            is_active=True
+        ).order_by('start_time', 'id').values_list('pk', 'capacity', 'booked_count')
+    )),
+    'member_upcoming_bookings': ('views.my_bookings', lambda data: (
+        Booking.objects.filter(
+            user_id=data['user_id'],
+            cancelled=False,
+            fitness_class__start_time__gte=data['now']
+        ).select_related('fitness_class').order_by('fitness_class__start_time', 'id')[:DEFAULT_PAGE_SIZE + 1]
+    )),
+    'member_past_bookings': ('views.my_bookings', lambda data: (
+        Booking.objects.filter(user_id=data['user_id'], fitness_class__start_time__lt=data['now'])
+        .select_related('fitness_class').order_by('-fitness_class__start_time', '-id')[:11]
+    )),
+    'member_attended': ('views.profile', lambda data: (
+        Booking.objects.filter(user_id=data['user_id'], attended=True)
+        .select_related('fitness_class').order_by('-fitness_class__start_time')[:5]
+    )),
+    'member_stats': ('stats.compute_member_stats', lambda data: (
+        Booking.objects.filter(user_id=data['user_id']).values('user').annotate(
+            total_bookings=Count('id'),
+            upcoming_bookings=Count(
+                'id', filter=Q(cancelled=False, fitness_class__start_time__gte=data['now'])
+            ),
+        ).order_by()
+    )),
+    'instructor_upcoming': ('views.manage_classes', lambda data: (
+        FitnessClass.objects.filter(instructor=data['instructor'], start_time__gte=data['now'])
+        .order_by('start_time', 'id')[:DEFAULT_PAGE_SIZE + 1]
+    )),
+    'instructor_past': ('views.manage_classes', lambda data: (
+        FitnessClass.objects.filter(instructor=data['instructor'], start_time__lt=data['now'])
+        .order_by('-start_time', '-id')[:DEFAULT_PAGE_SIZE + 1]
+    )),
+    'instructor_attendance': ('views.manage_classes', lambda data: (
+        Booking.objects.filter(fitness_class__in=_past_class_ids(data), attended=True)
+        .values_list('fitness_class').annotate(total=Count('id')).order_by()
+    )),
+    'class_roster': ('views.class_attendance, exports.attendance_rows', lambda data: (
+        Booking.objects.filter(fitness_class_id=data['class_id'], cancelled=False).select_related('user')
+    )),
+    'roster_export': ('exports.roster_rows', lambda data: (
+        Booking.objects.filter(
+            cancelled=False,
+            fitness_class__start_time__gte=data['now'],
+            fitness_class__start_time__lt=data['now'] + timedelta(days=7)
+        ).order_by('fitness_class__start_time', 'fitness_class_id', 'pk')
+    )),
+    'due_reminders': ('tasks.send_reminders', lambda data: (
+        due_reminders(data['now'])[:500]
+    )),
+    'pending_outbox': ('outbox.dispatch_batch', lambda data: (
+        OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt_at__lte=data['now'])
+        .order_by('next_attempt_at', 'id')[:50]
+    )),
+    'admin_bookings': ('admin.BookingAdmin', lambda data: (
+        Booking.objects.filter(cancelled=False).select_related('user', 'fitness_class')
+        .order_by('-created', '-pk')[:ADMIN_PAGE_SIZE]
+    )),
+    'admin_classes': ('admin.FitnessClassAdmin', lambda data: (
+        FitnessClass.objects.order_by('start_time', '-pk')[:ADMIN_PAGE_SIZE]
+    )),
+}
+
+
+def _model_index(model, name):
+    return next(index for index in model._meta.indexes if index.name == name)
+
+
+# Indexes the hot queries want, as (model, index, queries it serves). The
+# first three are in the models; the rest are proposals for larger data.
+INDEXES = [
+    (FitnessClass, _model_index(FitnessClass, 'booking_fit_upcoming_idx'), [
+        'class_listing', 'popular_classes', 'similar_classes', 'availability_window',
+    ]),
+    (FitnessClass, _model_index(FitnessClass, 'booking_fit_instructor_idx'), [
+        'instructor_upcoming', 'instructor_past',
+    ]),
+    (Booking, _model_index(Booking, 'booking_created_idx'), ['admin_bookings']),
+    # Roster reads skip cancelled rows
+    (Booking, Index(
+        fields=['fitness_class', 'user'],
+        condition=Q(cancelled=False),
+        name='booking_live_class_idx'
+    ), ['class_roster', 'roster_export', 'member_upcoming_bookings']),
+    # Attended bookings are a minority of a class's rows
+    (Booking, Index(
+        fields=['fitness_class', 'user'],
+        condition=Q(attended=True),
+        name='booking_attended_idx'
+    ), ['instructor_attendance', 'member_attended']),
+    # Covering: the availability window reads seat counts from the index alone
+    (FitnessClass, Index(
+        fields=['start_time'],
+        include=['capacity', 'booked_count'],
+        condition=Q(is_active=True),
+        name='booking_fit_seats_idx'
+    ), ['availability_window']),
+]
+
+
+_SQLITE_STEP = re.compile(
+    r'^(?P<op>SCAN|SEARCH)\s+(?P<relation>\w+)'
+    r'(?:\s+USING\s+(?:COVERING\s+)?INDEX\s+(?P<index>\w+)|\s+USING\s+(?P<pk>INTEGER PRIMARY KEY))?'
+)
+
+
+def parse_sqlite(output):
+    """Steps of an EXPLAIN QUERY PLAN result"""
+    steps = []
+    for line in output.splitlines():
+        # Each line is "id parent notused detail"
+        detail = line.split(None, 3)[-1].strip()
+        match = _SQLITE_STEP.match(detail)
+        if match is None:
+            steps.append({'node': detail, 'relation': None, 'index': None, 'full_scan': False})
+            continue
+        index = match['index'] or ('PRIMARY KEY' if match['pk'] else None)
+        steps.append({
+            'node': match['op'],
+            'relation': match['relation'],
+            'index': index,
+            # SCAN with an index walks it in ORDER BY order and stops at the LIMIT
+            'full_scan': match['op'] == 'SCAN' and index is None,
+        })
+    return steps
+
+
+def parse_postgresql(output):
+    """Steps and totals of an EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) result"""
+    result = json.loads(output)[0]
+    steps = []
+
+    def walk(node):
+        steps.append({
+            'node': node['Node Type'],
+            'relation': node.get('Relation Name'),
+            'index': node.get('Index Name'),
+            'full_scan': node['Node Type'] == 'Seq Scan',
+        })
+        for child in node.get('Plans', ()):
+            walk(child)
+
+    root = result['Plan']
+    walk(root)
+    return steps, {
+        'execution_ms': result.get('Execution Time'),
+        'buffers_hit': root.get('Shared Hit Blocks'),
+        'buffers_read': root.get('Shared Read Blocks'),
+    }
+
+
+def explain(queryset):
+    """The plan of ``queryset``: {'steps', 'full_scans', 'execution_ms', 'buffers_hit', 'buffers_read'}"""
+    totals = {'execution_ms': None, 'buffers_hit': None, 'buffers_read': None}
+    if connection.vendor == 'postgresql':
+        steps, totals = parse_postgresql(queryset.explain(format='json', analyze=True, buffers=True))
+    elif connection.vendor == 'sqlite':
+        steps = parse_sqlite(queryset.explain())
+    else:
+        raise NotImplementedError(f'No plan parser for {connection.vendor}')
+    return {
+        'steps': steps,
+        'full_scans': sorted({step['relation'] for step in steps if step['full_scan']}),
+        **totals,
+    }
+
+
+def shape(plan):
+    """The comparable part of a plan: one 'node relation index' string per step"""
+    return [
+        ' '.join(part for part in (step['node'], step['relation'], step['index']) if part)
+        for step in plan['steps']
+    ]
+
+
+def existing_indexes():
+    """Names of the indexes the database has on the booking tables"""
+    names = set()
+    with connection.cursor() as cursor:
+        for model in (FitnessClass, Booking):
+            names.update(connection.introspection.get_constraints(cursor, model._meta.db_table))
+    return names
+
+
+def index_sql(model, index):
+    # Only renders the statement, so the editor is never entered (SQLite
+    # refuses that inside a transaction)
+    return str(index.create_sql(model, connection.schema_editor(collect_sql=True)))
+
+
+def advise(names=None, data=None):
+    """
+    Explain the hot queries (all of QUERIES by default) and return
+    {'queries': {name: plan}, 'proposals': [...]}. A proposal is a missing
+    index from INDEXES wanted by a query that does a full scan.
+    """
+    data = data or sample()
+    queries = {}
+    for name in names or QUERIES:
+        source, build = QUERIES[name]
+        plan = explain(build(data))
+        queries[name] = {'source': source, 'shape': shape(plan), **plan}
+
+    present = existing_indexes()
+    proposals = []
+    for model, index, wanted_by in INDEXES:
+        flagged = [
+            name for name in wanted_by
+            if name in queries and model._meta.db_table in queries[name]['full_scans']
+        ]
+        if flagged and index.name not in present:
+            proposals.append({
+                'index': index.name,
+                'table': model._meta.db_table,
+                'queries': flagged,
+                'sql': index_sql(model, index),
+            })
+    return {'vendor': connection.vendor, 'queries': queries, 'proposals': proposals}
+
+
+def snapshot_path(vendor=None):
+    return SNAPSHOT_DIR / f'{vendor or connection.vendor}.json'
+
+
+def load_snapshot(vendor=None):
+    """{query name: shape} stored for the vendor, or None"""
+    path = snapshot_path(vendor)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def save_snapshot(report):
+    SNAPSHOT_DIR.mkdir(exist_ok=True)
+    shapes = {name: plan['shape'] for name, plan in sorted(report['queries'].items())}
+    snapshot_path(report['vendor']).write_text(json.dumps(shapes, indent=2) + '\n')
+
+
+def compare(report, snapshot):
+    """{query name: (stored shape, current shape)} for every plan that changed"""
+    return {
+        name: (snapshot.get(name), plan['shape'])
+        for name, plan in report['queries'].items()
+        if snapshot.get(name) != plan['shape']
+    }
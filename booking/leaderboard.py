@@ -0,0 +1,77 @@
+"""
+Cached "popular classes" leaderboard for the home page.
+
+The board is the top BOARD_SIZE upcoming classes by booked_count, kept in
+the cache framework. Seat changes adjust cached entries in place; a change
+that could reshuffle the board from outside it drops the entry so the next
+read recomputes it, and a short TTL bounds any drift between workers.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import FitnessClass
+
+CACHE_KEY = 'booking:popular_classes'
+# Track a few more classes than are shown so small reshuffles stay in cache
+BOARD_SIZE = 10
+
+
+def _sort_key(fitness_class):
+    return (-fitness_class.booked_count, fitness_class.start_time)
+
+
+def compute_board():
+    """Rank upcoming active classes by live bookings (a column read, no aggregate)"""
+    return list(
+        FitnessClass.objects.filter(
+            start_time__gte=timezone.now(),
+            is_active=True
+        ).defer('search_vector').order_by('-booked_count', 'start_time')[:BOARD_SIZE]
+    )
+
+
+def get_popular_classes(limit=3):
+    """Return the ``limit`` most-booked upcoming classes, from cache when possible"""
+    board = cache.get(CACHE_KEY)
+    if board is None:
+        board = compute_board()
+        cache.set(CACHE_KEY, board, settings.POPULAR_CLASSES_CACHE_TIMEOUT)
+
+    now = timezone.now()
+    upcoming = [fitness_class for fitness_class in board if fitness_class.start_time >= now]
+    if len(upcoming) < min(limit, len(board)):
+        # Classes on the board have started; rebuild rather than show a short list
+        invalidate()
+        return get_popular_classes(limit)
+    return upcoming[:limit]
+
+
+def record_seat_change(fitness_class_id, delta, booked_count=None):
+    """Fold a booking or cancellation into the cached board without a query"""
+    board = cache.get(CACHE_KEY)
+    if board is None:
+        return
+
+    for fitness_class in board:
+        if fitness_class.pk == fitness_class_id:
+            fitness_class.booked_count = max(fitness_class.booked_count + delta, 0)
+            board.sort(key=_sort_key)
+            if delta < 0 and board[-1] is fitness_class and len(board) == BOARD_SIZE:
+                # A class outside the board may now outrank it
+                invalidate()
+            else:
+                cache.set(CACHE_KEY, board, settings.POPULAR_CLASSES_CACHE_TIMEOUT)
+            return
+
+    could_enter = (
+        booked_count is None
+        or len(board) < BOARD_SIZE
+        or booked_count >= board[-1].booked_count
+    )
+    if delta > 0 and could_enter:
+        invalidate()
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
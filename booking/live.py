@@ -0,0 +1,236 @@
+"""
+Live seat counts pushed to browsers.
+
+Bookings and cancellations publish the class's new seat count once they
+commit (see booking.signals). Each process keeps one broker that fans a
+message out to the streams watching that class. Streams are asyncio
+tasks under ASGI, so an idle watcher is a parked coroutine instead of a
+poll every few seconds. WSGI would buffer a stream until it ends, so class
+pages only open one where LIVE_SEATS_ENABLED (docker-compose.asgi.yml).
+
+LocalBroker only reaches watchers in the publishing process. That is
+enough for a single worker and for tests. RedisBroker publishes through
+Redis pub/sub and runs one subscriber per process, so every worker
+hears every change. Pick a broker with LIVE_SEATS_BROKER.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from . import availability
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'booking:seats:'
+# How soon a browser reconnects once a stream ends (milliseconds)
+RETRY_MS = 2000
+
+
+class Subscription:
+    """
+    One stream's view of the broker. Messages for the same class coalesce,
+    because only the newest seat count matters to a watcher that fell behind.
+    """
+
+    def __init__(self, broker, class_ids):
+        self.broker = broker
+        self.class_ids = set(class_ids)
+        self.loop = asyncio.get_running_loop()
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, class_id, message):
+        # Always called on self.loop
+        self.pending[class_id] = message
+        self.ready.set()
+
+    async def get(self, timeout):
+        """Wait up to ``timeout`` seconds and return the pending messages (maybe none)"""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.ready.clear()
+        messages, self.pending = list(self.pending.values()), {}
+        return messages
+
+    async def __aenter__(self):
+        await self.broker.add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.broker.release(self)
+
+
+class LocalBroker:
+    """In-process fan-out; publish() only reaches this process's watchers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, class_ids):
+        return Subscription(self, class_ids)
+
+    async def add(self, subscription):
+        with self.lock:
+            for class_id in subscription.class_ids:
+                self.subscriptions.setdefault(class_id, set()).add(subscription)
+
+    def remove(self, subscription):
+        with self.lock:
+            for class_id in subscription.class_ids:
+                watchers = self.subscriptions.get(class_id)
+                if watchers is not None:
+                    watchers.discard(subscription)
+                    if not watchers:
+                        del self.subscriptions[class_id]
+
+    async def release(self, subscription):
+        """remove() from the subscription's own event loop, as the stream ends"""
+        self.remove(subscription)
+
+    def wants(self, class_id):
+        """Whether a change to this class has anyone to go to"""
+        return class_id in self.subscriptions
+
+    def deliver(self, class_id, message):
+        """Hand ``message`` to every local watcher of the class; safe from any thread"""
+        with self.lock:
+            watchers = list(self.subscriptions.get(class_id, ()))
+        for subscription in watchers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, class_id, message)
+            except RuntimeError:
+                # The watcher's event loop has shut down
+                self.remove(subscription)
+
+    def publish(self, class_id, message):
+        self.deliver(class_id, message)
+
+
+class RedisBroker(LocalBroker):
+    """Fan-out across processes through Redis PUBLISH/PSUBSCRIBE"""
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError as exc:
+            raise ImproperlyConfigured('RedisBroker requires the redis package') from exc
+        if not settings.LIVE_SEATS_REDIS_URL:
+            raise ImproperlyConfigured('RedisBroker requires LIVE_SEATS_REDIS_URL')
+        self.client = redis.Redis.from_url(settings.LIVE_SEATS_REDIS_URL)
+        self.async_redis = redis.asyncio
+        # Per event loop: its Redis subscriber task and the watchers it feeds
+        self.listeners = {}
+        self.loop_subscriptions = {}
+
+    async def add(self, subscription):
+        await super().add(subscription)
+        # One Redis subscriber per event loop feeds every local watcher
+        loop = subscription.loop
+        with self.lock:
+            self.loop_subscriptions.setdefault(loop, set()).add(subscription)
+            listener = self.listeners.get(loop)
+            if listener is None or listener.done():
+                self.listeners[loop] = loop.create_task(self.listen())
+
+    def remove(self, subscription):
+        """
+        Also stop the loop's subscriber once its last watcher leaves: under
+        WSGI every stream runs on a new event loop, which would otherwise
+        strand a task and a Redis connection per request. Returns that task.
+        """
+        super().remove(subscription)
+        loop = subscription.loop
+        with self.lock:
+            watchers = self.loop_subscriptions.get(loop)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if watchers:
+                    return None
+                del self.loop_subscriptions[loop]
+            listener = self.listeners.pop(loop, None)
+        if listener is not None:
+            try:
+                loop.call_soon_threadsafe(listener.cancel)
+            except RuntimeError:
+                # The loop has shut down and its tasks with it
+                pass
+        return listener
+
+    async def release(self, subscription):
+        listener = self.remove(subscription)
+        if listener is not None:
+            # Let it close its Redis connection before the loop can go away
+            await asyncio.gather(listener, return_exceptions=True)
+
+    async def listen(self):
+        client = self.async_redis.Redis.from_url(settings.LIVE_SEATS_REDIS_URL)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+            async for item in pubsub.listen():
+                try:
+                    class_id = int(item['channel'].decode().removeprefix(CHANNEL_PREFIX))
+                    self.deliver(class_id, json.loads(item['data']))
+                except (ValueError, KeyError, AttributeError):
+                    logger.warning('Ignoring malformed seat message %r', item)
+        finally:
+            await pubsub.close()
+            await client.close()
+
+    def wants(self, class_id):
+        # Watchers may be connected to any worker
+        return True
+
+    def publish(self, class_id, message):
+        self.client.publish(f'{CHANNEL_PREFIX}{class_id}', json.dumps(message))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process-wide broker named by LIVE_SEATS_BROKER"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.LIVE_SEATS_BROKER)()
+    return _broker
+
+
+def seat_message(class_id, spots_remaining):
+    return {
+        'id': class_id,
+        'available': spots_remaining > 0,
+        'spots_remaining': spots_remaining,
+    }
+
+
+def publish_seats(class_id):
+    """Broadcast a class's current seat count, if anyone could be watching it"""
+    broker = get_broker()
+    if not broker.wants(class_id):
+        return
+    spots = availability.seats_for_ids([class_id]).get(class_id)
+    if spots is None:
+        return
+    try:
+        broker.publish(class_id, seat_message(class_id, spots))
+    except Exception:
+        # Runs after the booking committed; watchers catch up on reconnect
+        logger.exception('Could not publish seat count for class %s', class_id)
+
+
+def sse_event(message, event='seats'):
+    return f'event: {event}\ndata: {json.dumps(message)}\n\n'
@@ -0,0 +1,113 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from booking import indexadvisor, seeding
+from booking.models import FitnessClass
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the hot booking queries against a seeded database, flag full table scans, '
+        'propose missing indexes and store or check plan snapshots'
+    )
+
+    def add_arguments(self, parser):
+        dataset = indexadvisor.SNAPSHOT_DATASET
+        parser.add_argument('--members', type=int, default=dataset['members'], help='Members to seed')
+        parser.add_argument('--classes', type=int, default=dataset['classes'], help='Classes to seed')
+        parser.add_argument('--bookings', type=int, default=dataset['bookings'], help='Approximate bookings to seed')
+        parser.add_argument('--seed', type=int, default=dataset['seed'], help='Random seed for the data')
+        parser.add_argument(
+            '--queries',
+            nargs='+',
+            choices=sorted(indexadvisor.QUERIES),
+            help='Only explain these queries',
+        )
+        parser.add_argument(
+            '--current-db',
+            action='store_true',
+            help='Explain against the configured database instead of a seeded copy',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the seeded database for the next run',
+        )
+        parser.add_argument(
+            '--snapshot',
+            action='store_true',
+            help='Store the plan shapes as the snapshot for this database vendor',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Fail if a plan differs from the stored snapshot',
+        )
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['snapshot'] and options['queries']:
+            raise CommandError('--snapshot records every query; drop --queries')
+        query_log = logging.getLogger('booking.queries')
+        was_disabled, query_log.disabled = query_log.disabled, options['verbosity'] < 2
+        try:
+            report = self.explain(options)
+        finally:
+            query_log.disabled = was_disabled
+
+        output = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        self.summarise(report)
+
+        if options['snapshot']:
+            indexadvisor.save_snapshot(report)
+            self.stderr.write(f"Stored {indexadvisor.snapshot_path(report['vendor'])}")
+        if options['check']:
+            snapshot = indexadvisor.load_snapshot(report['vendor'])
+            if snapshot is None:
+                raise CommandError(f"No plan snapshot for {report['vendor']}; run with --snapshot first")
+            changed = indexadvisor.compare(report, snapshot)
+            for name, (stored, current) in changed.items():
+                self.stderr.write(f'{name}: plan changed\n  was {stored}\n  now {current}')
+            if changed:
+                raise CommandError(f'{len(changed)} plan(s) differ from the snapshot')
+
+    def explain(self, options):
+        if options['current_db']:
+            return self.advise(options)
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not FitnessClass.objects.exists():
+                seeding.seed(
+                    members=options['members'],
+                    classes=options['classes'],
+                    bookings=options['bookings'],
+                    seed=options['seed'],
+                    prefix='plan'
+                )
+            return self.advise(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+    def advise(self, options):
+        indexadvisor.refresh_statistics()
+        return indexadvisor.advise(options['queries'])
+
+    def summarise(self, report):
+        for name, plan in report['queries'].items():
+            scans = f"FULL SCAN {', '.join(plan['full_scans'])}" if plan['full_scans'] else 'indexed'
+            timing = f"  {plan['execution_ms']}ms" if plan['execution_ms'] is not None else ''
+            self.stderr.write(f'{name:<26} {scans}{timing}')
+        for proposal in report['proposals']:
+            self.stderr.write(f"Proposed for {', '.join(proposal['queries'])}:\n  {proposal['sql']};")
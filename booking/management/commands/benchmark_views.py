@@ -0,0 +1,96 @@
+import json
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from booking import benchmarks, seeding
+from booking.models import FitnessClass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and report latency percentiles, query counts '
+        'and peak memory for the hot booking views as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=5000, help='Members to seed')
+        parser.add_argument('--classes', type=int, default=20000, help='Classes to seed')
+        parser.add_argument('--bookings', type=int, default=200000, help='Approximate bookings to seed')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and request mix')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per view')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per view first')
+        parser.add_argument(
+            '--views',
+            nargs='+',
+            choices=sorted(benchmarks.SCENARIOS),
+            help='Only benchmark these views',
+        )
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the benchmark database (and its seeded data) for the next run',
+        )
+
+    def handle(self, *args, **options):
+        # Per-request query lines and failed-view tracebacks would drown the
+        # report; failures are summarised per view instead
+        for name in ('booking.queries', 'django.request'):
+            logging.getLogger(name).disabled = options['verbosity'] < 2
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            dataset = None
+            if not FitnessClass.objects.exists():
+                started = time.perf_counter()
+                dataset = seeding.seed(
+                    members=options['members'],
+                    classes=options['classes'],
+                    bookings=options['bookings'],
+                    seed=options['seed'],
+                    prefix='bench'
+                )
+                self.stderr.write(
+                    f"Seeded {dataset['members']} members, {dataset['classes']} classes and "
+                    f"{dataset['bookings']} bookings in {time.perf_counter() - started:.1f}s"
+                )
+            report = benchmarks.run(
+                views=options['views'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                seed=options['seed'],
+                dataset=dataset
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        for name, result in report['views'].items():
+            if result['requests']:
+                self.stderr.write(
+                    f"{name:<26} p50 {result['p50_ms']:>8}ms  p95 {result['p95_ms']:>8}ms  "
+                    f"p99 {result['p99_ms']:>8}ms  queries {result['queries_p50']:>3}  "
+                    f"peak {result['peak_memory_kb']}KB"
+                )
+            else:
+                self.stderr.write(f"{name:<26} failed: {result['error']}")
+        login = report['login']
+        self.stderr.write(
+            f"{'login':<26} writes {login['writes']} (plus {login['session_writes']} session)  "
+            f"queries {login['queries']}"
+        )
+        if not any(result['requests'] for result in report['views'].values()):
+            raise CommandError('Every benchmarked view failed')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from booking.models import FitnessClass
+from booking.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for every fitness class'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Classes re-indexed per UPDATE (PostgreSQL only)',
+        )
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Database alias to rebuild',
+        )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options['database'])
+        indexed = backend.rebuild(
+            FitnessClass,
+            using=options['database'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} class(es) with {backend.__class__.__name__}'
+        ))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from booking.models import Booking, FitnessClass
+
+
+class Command(BaseCommand):
+    help = 'Recompute FitnessClass.booked_count from non-cancelled bookings and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted classes without updating them',
+        )
+        parser.add_argument(
+            '--upcoming-only',
+            action='store_true',
+            help='Only reconcile classes that have not started yet',
+        )
+
+    def handle(self, *args, **options):
+        live_bookings = Booking.objects.filter(
+            fitness_class=OuterRef('pk'),
+            cancelled=False
+        ).order_by().values('fitness_class').annotate(
+            total=Count('pk')
+        ).values('total')
+        actual = Coalesce(
+            Subquery(live_bookings, output_field=IntegerField()),
+            Value(0)
+        )
+
+        classes = FitnessClass.objects.all()
+        if options['upcoming_only']:
+            classes = classes.filter(start_time__gte=timezone.now())
+
+        drifted = classes.annotate(actual_count=actual).exclude(
+            booked_count=F('actual_count')
+        )
+
+        if options['dry_run']:
+            count = 0
+            for cls_id, stored, real in drifted.values_list('pk', 'booked_count', 'actual_count').iterator():
+                count += 1
+                self.stdout.write(f'Class {cls_id}: booked_count={stored}, actual={real}')
+            self.stdout.write(self.style.WARNING(f'{count} class(es) have drifted'))
+            return
+
+        # One set-based UPDATE for every drifted row instead of a save() per class
+        with transaction.atomic():
+            fixed = FitnessClass.objects.filter(
+                pk__in=drifted.values('pk')
+            ).update(booked_count=actual)
+
+        self.stdout.write(self.style.SUCCESS(f'Reconciled booked_count on {fixed} class(es)'))
@@ -0,0 +1,71 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic members, profiles, classes, bookings, cancellations and attendance '
+        'with batched bulk inserts (no signals, no emails)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=1000, help='Members (with profiles) to create')
+        parser.add_argument('--classes', type=int, default=2000, help='Classes to create, across every class type')
+        parser.add_argument('--bookings', type=int, default=20000, help='Approximate bookings to create')
+        parser.add_argument(
+            '--cancellation-rate',
+            type=float,
+            default=0.1,
+            help='Share of bookings that are cancelled',
+        )
+        parser.add_argument(
+            '--attendance-rate',
+            type=float,
+            default=0.8,
+            help='Share of live bookings for past classes marked attended',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk INSERT')
+        parser.add_argument(
+            '--prefix',
+            default='seed',
+            help='Username prefix; use a new one to add more members to a seeded database',
+        )
+        parser.add_argument(
+            '--anchor',
+            type=date.fromisoformat,
+            help='Date (YYYY-MM-DD) the schedule is centred on; defaults to today',
+        )
+        parser.add_argument('--past-days', type=int, default=90, help='Days of class history before the anchor')
+        parser.add_argument('--future-days', type=int, default=90, help='Days of schedule after the anchor')
+
+    def handle(self, *args, **options):
+        for rate in ('cancellation_rate', 'attendance_rate'):
+            if not 0 <= options[rate] <= 1:
+                raise CommandError(f"--{rate.replace('_', '-')} must be between 0 and 1")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        started = time.perf_counter()
+        created = seeding.seed(
+            members=options['members'],
+            classes=options['classes'],
+            bookings=options['bookings'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            anchor=options['anchor'],
+            past_days=options['past_days'],
+            future_days=options['future_days'],
+            cancellation_rate=options['cancellation_rate'],
+            attendance_rate=options['attendance_rate']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created['members']} members, {created['classes']} classes and "
+            f"{created['bookings']} bookings ({created['cancelled']} cancelled, "
+            f"{created['attended']} attended) in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from booking.reminders import send_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Email reminders for bookings whose class starts within the next day'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.BOOKING_REMINDER_CHUNK_SIZE,
+            help='Bookings loaded, sent and flagged per chunk',
+        )
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Remind bookings for classes starting within this many hours',
+        )
+
+    def handle(self, *args, **options):
+        sent, failed = send_due_reminders(
+            chunk_size=options['chunk_size'],
+            window=timedelta(hours=options['hours'])
+        )
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} reminder(s), {failed} failed'))
@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from booking.models import OutboxEmail
+from booking.outbox import dispatch_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued booking emails from the outbox in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.EMAIL_OUTBOX_BATCH_SIZE,
+            help='Emails sent per SMTP connection',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+            help='Attempts before an email is moved to dead letters',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the outbox instead of exiting once it is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to sleep between polls when the outbox is empty (with --loop)',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Move dead-lettered emails back to pending before dispatching',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            requeued = OutboxEmail.objects.filter(status=OutboxEmail.FAILED).update(
+                status=OutboxEmail.PENDING,
+                attempts=0,
+                next_attempt_at=timezone.now(),
+                modified=timezone.now(),
+            )
+            self.stdout.write(f'Requeued {requeued} failed email(s)')
+
+        total_sent = total_failed = 0
+        while True:
+            try:
+                sent, failed = dispatch_batch(options['batch_size'], options['max_attempts'])
+            except Exception as exc:
+                # Typically the mail server is unreachable; nothing was marked
+                if not options['loop']:
+                    raise
+                self.stderr.write(f'Outbox dispatch failed: {exc}')
+                time.sleep(options['interval'])
+                continue
+
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {total_sent} email(s), {total_failed} failed attempt(s)'
+        ))
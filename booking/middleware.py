@@ -0,0 +1,165 @@
+"""
+Per-request database instrumentation.
+
+QueryStatsMiddleware counts the statements each request runs, their total
+time and the slowest one, using connection.execute_wrapper() so it works
+with DEBUG off. The numbers go into X-DB-* response headers where
+QUERY_STATS_HEADERS is on (debug and staging) and into one structured log
+line on the ``booking.queries`` logger for every request. The slowest
+statement's text, which shows the schema to whoever gets the response, is
+only sent as a header where QUERY_STATS_SQL_HEADER is on too (debug).
+
+The middleware runs natively in async mode, so the async views are not
+pushed through a sync thread. Their ORM calls run on sync_to_async's shared
+thread, whose connection carries the wrapper of every request in flight;
+each wrapper only counts queries made in its own request's context
+(active_stats()). booking.aio.gather() wraps its pool threads' connections
+with the request's stats too.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger('booking.queries')
+
+_active_stats = ContextVar('booking_query_stats', default=None)
+
+# Longest SQL text carried in a header or log line
+SQL_PREVIEW_LENGTH = 200
+
+
+class QueryStats:
+    """Database work done while the stats are active, usable as an execute wrapper"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = ''
+        # gather() can run a request's queries on several threads at once
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if _active_stats.get() is not self:
+            # Another request's query on a shared connection
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.count += 1
+                self.duration += elapsed
+                if elapsed >= self.slowest_duration:
+                    self.slowest_duration = elapsed
+                    self.slowest_sql = sql
+
+    def attach(self):
+        """Wrap this thread's connections; detach() removes exactly these wrappers"""
+        for alias in connections:
+            connections[alias].execute_wrappers.append(self)
+
+    def detach(self):
+        # By identity rather than pop(): concurrent requests leave in any order
+        for alias in connections:
+            connections[alias].execute_wrappers.remove(self)
+
+    @contextmanager
+    def record(self):
+        """Count this context's queries on this thread's connections until the block exits"""
+        token = _active_stats.set(self)
+        self.attach()
+        try:
+            yield self
+        finally:
+            self.detach()
+            _active_stats.reset(token)
+
+    @property
+    def slowest_sql_preview(self):
+        # Placeholders only, never parameters, so no member data leaks
+        return ' '.join(self.slowest_sql.split())[:SQL_PREVIEW_LENGTH]
+
+    def as_dict(self):
+        return {
+            'db_queries': self.count,
+            'db_time_ms': round(self.duration * 1000, 2),
+            'db_slowest_ms': round(self.slowest_duration * 1000, 2),
+            'db_slowest_sql': self.slowest_sql_preview,
+        }
+
+
+def active_stats():
+    """The QueryStats of the request being handled in this context, if any"""
+    return _active_stats.get()
+
+
+@sync_and_async_middleware
+class QueryStatsMiddleware:
+    """
+    Attach query counts and database time to each request.
+
+    Streaming responses are measured up to the point the response object is
+    returned; queries run while the body is being streamed are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = request.query_stats = QueryStats()
+        with stats.record():
+            response = self.get_response(request)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = request.query_stats = QueryStats()
+        token = _active_stats.set(stats)
+        # The ORM runs on sync_to_async's thread, so wrap that thread's connections
+        await sync_to_async(stats.attach)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stats.detach)()
+            _active_stats.reset(token)
+        return self.report(request, response, stats)
+
+    def report(self, request, response, stats):
+        if settings.QUERY_STATS_HEADERS:
+            response['X-DB-Query-Count'] = str(stats.count)
+            response['X-DB-Time-Ms'] = f'{stats.duration * 1000:.2f}'
+            response['X-DB-Slowest-Ms'] = f'{stats.slowest_duration * 1000:.2f}'
+            if settings.QUERY_STATS_SQL_HEADER and stats.slowest_sql:
+                response['X-DB-Slowest-SQL'] = stats.slowest_sql_preview
+
+        fields = dict(
+            stats.as_dict(),
+            method=request.method,
+            path=request.path,
+            status=response.status_code
+        )
+        level = logging.INFO
+        if (stats.count > settings.QUERY_STATS_WARN_COUNT
+                or stats.duration * 1000 > settings.QUERY_STATS_WARN_MS):
+            level = logging.WARNING
+        logger.log(
+            level,
+            '%(method)s %(path)s status=%(status)s queries=%(db_queries)s '
+            'db_ms=%(db_time_ms)s slowest_ms=%(db_slowest_ms)s slowest_sql="%(db_slowest_sql)s"',
+            fields,
+            extra=fields
+        )
+        return response
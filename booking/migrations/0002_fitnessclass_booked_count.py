@@ -0,0 +1,42 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:22
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_booked_count(apps, schema_editor):
+    FitnessClass = apps.get_model("booking", "FitnessClass")
+    Booking = apps.get_model("booking", "Booking")
+    live_bookings = (
+        Booking.objects.filter(fitness_class=OuterRef("pk"), cancelled=False)
+        .order_by()
+        .values("fitness_class")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    FitnessClass.objects.update(
+        booked_count=Coalesce(
+            Subquery(live_bookings, output_field=IntegerField()), Value(0)
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booking", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fitnessclass",
+            name="booked_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of non-cancelled bookings, maintained by Booking.save()",
+                verbose_name="booked count",
+            ),
+        ),
+        migrations.RunPython(backfill_booked_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booking", "0004_outboxemail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="booking",
+            name="reminder_sent",
+            field=models.BooleanField(default=False, verbose_name="reminder sent"),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                condition=models.Q(("cancelled", False), ("reminder_sent", False)),
+                fields=["fitness_class", "id"],
+                name="booking_reminder_due_idx",
+            ),
+        ),
+    ]
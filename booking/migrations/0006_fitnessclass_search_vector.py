@@ -0,0 +1,55 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:40
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+FTS_TABLE = "booking_fitnessclass_fts"
+
+
+def create_search_index(apps, schema_editor):
+    """Create the vendor-specific full-text index and fill it from existing rows"""
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX booking_fit_search_gin ON booking_fitnessclass "
+            "USING gin (search_vector)"
+        )
+        schema_editor.execute(
+            "UPDATE booking_fitnessclass SET search_vector = "
+            "setweight(to_tsvector(COALESCE(name, '')), 'A') || "
+            "setweight(to_tsvector(COALESCE(instructor, '')), 'B') || "
+            "setweight(to_tsvector(COALESCE(description, '')), 'C')"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, instructor, description)"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, instructor, description) "
+            "SELECT id, name, instructor, description FROM booking_fitnessclass"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS booking_fit_search_gin")
+    elif vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booking", "0005_booking_reminder_sent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fitnessclass",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booking", "0006_fitnessclass_search_vector"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="fitnessclass",
+            name="booking_fit_start_t_05378e_idx",
+        ),
+        migrations.AddIndex(
+            model_name="fitnessclass",
+            index=models.Index(
+                fields=["start_time", "id"], name="booking_fit_start_t_8d6d74_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.6 on 2026-10-18 10:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booking", "0007_fitnessclass_start_time_id_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClassSeries",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("modified", models.DateTimeField(auto_now=True)),
+                (
+                    "rule",
+                    models.TextField(
+                        help_text="RFC 5545 RRULE, e.g. FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10",
+                        verbose_name="recurrence rule",
+                    ),
+                ),
+                (
+                    "exceptions",
+                    models.JSONField(
+                        blank=True,
+                        default=list,
+                        help_text="ISO dates (YYYY-MM-DD) the rule would produce but which were left out",
+                        verbose_name="skipped dates",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "class series",
+                "verbose_name_plural": "class series",
+            },
+        ),
+        migrations.AddField(
+            model_name="fitnessclass",
+            name="series",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="occurrences",
+                to="booking.classseries",
+                verbose_name="series",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fitnessclass",
+            index=models.Index(
+                fields=["series", "start_time"], name="booking_fit_series__40581f_idx"
+            ),
+        ),
+    ]
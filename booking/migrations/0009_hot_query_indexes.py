@@ -0,0 +1,31 @@
+# Generated by Django 4.2.6 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booking", "0008_class_series"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(fields=["-created", "-id"], name="booking_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="fitnessclass",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["start_time", "id"],
+                name="booking_fit_upcoming_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fitnessclass",
+            index=models.Index(
+                fields=["instructor", "start_time", "id"],
+                name="booking_fit_instructor_idx",
+            ),
+        ),
+    ]
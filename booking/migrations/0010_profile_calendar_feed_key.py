@@ -0,0 +1,36 @@
+# Generated by Django 4.2.6 on 2026-10-18 10:40
+
+import booking.models
+from django.db import migrations, models
+
+
+def issue_feed_keys(apps, schema_editor):
+    # A callable default is evaluated once for existing rows, so each gets its own key here
+    Profile = apps.get_model("booking", "Profile")
+    for pk in Profile.objects.filter(calendar_feed_key="").values_list("pk", flat=True).iterator():
+        Profile.objects.filter(pk=pk).update(calendar_feed_key=booking.models.new_calendar_feed_key())
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booking", "0009_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="calendar_feed_key",
+            field=models.CharField(default="", editable=False, max_length=32),
+            preserve_default=False,
+        ),
+        migrations.RunPython(issue_feed_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="profile",
+            name="calendar_feed_key",
+            field=models.CharField(
+                default=booking.models.new_calendar_feed_key,
+                editable=False,
+                max_length=32,
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.6 on 2026-10-18 10:55
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+def create_gin_index(apps, schema_editor):
+    # 0006 created it with raw SQL; recreate it only where it has gone missing
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS booking_fit_search_gin ON booking_fitnessclass "
+            "USING gin (search_vector)"
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booking", "0010_profile_calendar_feed_key"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="fitnessclass",
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=["search_vector"], name="booking_fit_search_gin"
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_gin_index, migrations.RunPython.noop),
+            ],
+        ),
+    ]
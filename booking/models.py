@@ -1,11 +1,32 @@
-from django.db import models
+import secrets
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives
+from django.dispatch import Signal
 from django.conf import settings
 from django.urls import reverse
 from django.utils import timezone
 from django.template.loader import render_to_string
 from django.utils.translation import gettext_lazy as _
+from .exceptions import ClassFullError
+
+# Sent once a booking change that moved FitnessClass.booked_count commits.
+# Arguments: fitness_class_id, delta, booked_count (None when not known).
+seat_count_changed = Signal()
+
+# Sent once a booking is created, deleted, cancelled, reinstated or has its
+# attendance changed. Arguments: user_id, total_delta, seat_delta,
+# attended_delta, start_time (the class start, None when not loaded).
+booking_changed = Signal()
+
+# Sent once a mark_attendance() batch commits, in place of one
+# booking_changed per booking. Arguments: attended_deltas ({user_id: change
+# in attended classes}), start_time (the class start).
+attendance_changed = Signal()
 
 class TimeStampedModel(models.Model):
     """
@@ -18,6 +39,28 @@ class TimeStampedModel(models.Model):
     class Meta:
         abstract = True
 
+class ClassSeries(TimeStampedModel):
+    """
+    Recurrence rule a run of FitnessClass occurrences was generated from.
+    """
+    rule = models.TextField(
+        _('recurrence rule'),
+        help_text=_('RFC 5545 RRULE, e.g. FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10')
+    )
+    exceptions = models.JSONField(
+        _('skipped dates'),
+        default=list,
+        blank=True,
+        help_text=_('ISO dates (YYYY-MM-DD) the rule would produce but which were left out')
+    )
+
+    class Meta:
+        verbose_name = _('class series')
+        verbose_name_plural = _('class series')
+
+    def __str__(self):
+        return self.rule
+
 class FitnessClass(TimeStampedModel):
     """
     Model representing a fitness class that users can book.
@@ -51,6 +94,23 @@ class FitnessClass(TimeStampedModel):
     )
     location = models.CharField(_('location'), max_length=200)
     is_active = models.BooleanField(_('active'), default=True)
+    booked_count = models.PositiveIntegerField(
+        _('booked count'),
+        default=0,
+        editable=False,
+        help_text=_('Number of non-cancelled bookings, maintained by Booking.save()')
+    )
+    # Weighted full-text document, maintained by save(); see booking.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    series = models.ForeignKey(
+        ClassSeries,
+        on_delete=models.SET_NULL,
+        related_name='occurrences',
+        verbose_name=_('series'),
+        blank=True,
+        null=True,
+        editable=False
+    )
     image = models.ImageField(
         _('class image'),
         upload_to='class_images/',
@@ -63,8 +123,21 @@ class FitnessClass(TimeStampedModel):
         verbose_name_plural = _('fitness classes')
         ordering = ['start_time']
         indexes = [
-            models.Index(fields=['start_time']),
+            # Matches the (start_time, id) keyset used to page class listings
+            models.Index(fields=['start_time', 'id']),
             models.Index(fields=['class_type']),
+            # "This and all following" lookups within a series
+            models.Index(fields=['series', 'start_time']),
+            # Listings, the leaderboard and availability only read active classes
+            models.Index(
+                fields=['start_time', 'id'],
+                condition=models.Q(is_active=True),
+                name='booking_fit_upcoming_idx'
+            ),
+            # An instructor's classes in manage_classes
+            models.Index(fields=['instructor', 'start_time', 'id'], name='booking_fit_instructor_idx'),
+            # Full-text search (booking.search); only created on PostgreSQL
+            GinIndex(fields=['search_vector'], name='booking_fit_search_gin'),
         ]
         constraints = [
             models.CheckConstraint(
@@ -79,6 +152,15 @@ class FitnessClass(TimeStampedModel):
     def get_absolute_url(self):
         return reverse('class_detail', kwargs={'pk': self.pk})
 
+    def save(self, *args, **kwargs):
+        """Override save to keep the full-text index in step with the row"""
+        from .search import SEARCH_FIELDS, index_classes
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if update_fields is None or set(update_fields) & set(SEARCH_FIELDS):
+                index_classes(FitnessClass.objects.using(self._state.db).filter(pk=self.pk))
+
     @property
     def duration(self):
         """Calculate duration in minutes"""
@@ -86,8 +168,8 @@ class FitnessClass(TimeStampedModel):
 
     @property
     def spots_remaining(self):
-        """Calculate remaining spots available"""
-        return self.capacity - self.bookings.count()
+        """Calculate remaining spots available from the denormalized counter"""
+        return max(self.capacity - self.booked_count, 0)
 
     def is_full(self):
         return self.spots_remaining <= 0
@@ -119,6 +201,7 @@ class Booking(TimeStampedModel):
         blank=True,
         null=True
     )
+    reminder_sent = models.BooleanField(_('reminder sent'), default=False)
 
     class Meta:
         verbose_name = _('booking')
@@ -127,6 +210,14 @@ class Booking(TimeStampedModel):
         unique_together = ['user', 'fitness_class']
         indexes = [
             models.Index(fields=['user', 'fitness_class']),
+            # Only bookings still owed a reminder, so the nightly run stays cheap
+            models.Index(
+                fields=['fitness_class', 'id'],
+                condition=models.Q(reminder_sent=False, cancelled=False),
+                name='booking_reminder_due_idx'
+            ),
+            # The admin's newest-first booking list
+            models.Index(fields=['-created', '-id'], name='booking_created_idx'),
         ]
 
     def __str__(self):
@@ -135,74 +226,333 @@ class Booking(TimeStampedModel):
     def get_absolute_url(self):
         return reverse('booking_detail', kwargs={'pk': self.pk})
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored state so save() can tell which transition happened
+        if 'cancelled' in field_names:
+            instance._loaded_cancelled = instance.cancelled
+        if 'attended' in field_names:
+            instance._loaded_attended = instance.attended
+        return instance
+
+    def _stored_flags(self):
+        """Return the (cancelled, attended) flags as last loaded or saved, or None if unsaved"""
+        cancelled = getattr(self, '_loaded_cancelled', None)
+        attended = getattr(self, '_loaded_attended', None)
+        if cancelled is None or attended is None:
+            stored = Booking.objects.filter(pk=self.pk).values_list(
+                'cancelled', 'attended'
+            ).first()
+            if stored is None:
+                return None
+            cancelled, attended = stored
+            self._loaded_cancelled, self._loaded_attended = stored
+        return cancelled, attended
+
+    def _seat_delta(self, is_new):
+        """Return how this save changes the class's booked_count (-1, 0 or +1)"""
+        stored = None if is_new else self._stored_flags()
+        if stored is None:
+            # New, or saving with an explicit pk that is not in the table yet
+            return 0 if self.cancelled else 1
+        return int(stored[0]) - int(self.cancelled)
+
+    def _attended_delta(self, is_new):
+        """Return how this save changes the member's attended total (-1, 0 or +1)"""
+        stored = None if is_new else self._stored_flags()
+        if stored is None:
+            return int(self.attended)
+        return int(self.attended) - int(stored[1])
+
+    def _notify_booking_changed(self, total_delta, seat_delta, attended_delta):
+        """Tell listeners (member stats) about this change once it commits"""
+        if not (total_delta or seat_delta or attended_delta):
+            return
+        cached = self._state.fields_cache.get('fitness_class')
+        start_time = cached.start_time if cached is not None else None
+        user_id = self.user_id
+        transaction.on_commit(lambda: booking_changed.send(
+            sender=Booking,
+            user_id=user_id,
+            total_delta=total_delta,
+            seat_delta=seat_delta,
+            attended_delta=attended_delta,
+            start_time=start_time
+        ))
+
+    def _apply_seat_delta(self, delta):
+        """
+        Atomically shift the denormalized counter on the booked class.
+
+        Taking a seat is a capacity-guarded UPDATE: it only matches while
+        booked_count < capacity, so two workers can never both claim the
+        last seat. Raises ClassFullError when no seat was left.
+        """
+        if not delta:
+            return
+        classes = FitnessClass.objects.filter(pk=self.fitness_class_id)
+        if delta > 0:
+            classes = classes.filter(booked_count__lte=F('capacity') - delta)
+        if not classes.update(booked_count=F('booked_count') + delta) and delta > 0:
+            raise ClassFullError()
+        # Keep an already-loaded class instance in step with the column
+        booked_count = None
+        cached = self._state.fields_cache.get('fitness_class')
+        if cached is not None:
+            cached.booked_count = booked_count = max(cached.booked_count + delta, 0)
+        transaction.on_commit(lambda: seat_count_changed.send(
+            sender=FitnessClass,
+            fitness_class_id=self.fitness_class_id,
+            delta=delta,
+            booked_count=booked_count
+        ))
+
     def save(self, *args, **kwargs):
-        """Override save to send notifications"""
-        is_new = self.pk is None
-        super().save(*args, **kwargs)
-        
-        if is_new:
-            self.send_confirmation_email()
-        elif self.cancelled and not is_new:
-            self.send_cancellation_email()
-
-    def send_confirmation_email(self):
-        """Send booking confirmation email"""
-        subject = _("Booking Confirmation: %(class_name)s") % {
-            'class_name': self.fitness_class.name
-        }
-        
-        context = {
-            'user': self.user,
-            'booking': self,
-            'class': self.fitness_class,
-        }
-        
-        text_message = render_to_string('emails/booking_confirmation.txt', context)
-        html_message = render_to_string('emails/booking_confirmation.html', context)
-        
-        send_mail(
-            subject,
-            text_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [self.user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
+        """Override save to maintain the seat counter and queue notifications"""
+        is_new = self.pk is None or self._state.adding
+        with transaction.atomic():
+            delta = self._seat_delta(is_new)
+            attended_delta = self._attended_delta(is_new)
+            # Claim the seat before inserting so a full class never touches
+            # the bookings table; seats are released after the row is saved
+            if delta > 0:
+                self._apply_seat_delta(delta)
+            super().save(*args, **kwargs)
+            if delta < 0:
+                self._apply_seat_delta(delta)
+
+            # Emails are written to the outbox in the same transaction and
+            # delivered by the send_queued_emails dispatcher, never inline.
+            # A reinstated booking (say, promoted from the waitlist) is
+            # confirmed like a new one.
+            if is_new or delta > 0:
+                self.queue_email(OutboxEmail.CONFIRMATION)
+            elif delta < 0:
+                self.queue_email(OutboxEmail.CANCELLATION)
+            self._notify_booking_changed(int(is_new), delta, attended_delta)
+        self._loaded_cancelled = self.cancelled
+        self._loaded_attended = self.attended
+
+    def queue_email(self, template):
+        """Add a notification about this booking to the email outbox"""
+        return OutboxEmail.objects.create(booking=self, template=template)
+
+    def remember_deleted_state(self):
+        """pre_delete: keep the stored flags, which post_delete can no longer read"""
+        self._deleted_flags = self._stored_flags()
+
+    def release_after_delete(self, origin=None):
+        """
+        post_delete: release the seat a live booking held and update member
+        stats. Runs for instance, queryset (admin bulk) and cascade deletes
+        alike, from the flags as stored rather than as edited in memory.
+        """
+        stored = getattr(self, '_deleted_flags', None)
+        if stored is None:
+            return
+        cancelled, attended = stored
+        delta = 0 if cancelled else -1
+        self._notify_booking_changed(-1, delta, -int(attended))
+        # Deleting the class itself takes its counter with it
+        if not (isinstance(origin, FitnessClass) and origin.pk == self.fitness_class_id):
+            self._apply_seat_delta(delta)
+
+    def cancel(self, reason=None):
+        """Helper method to cancel a booking and hand the seat to the waitlist"""
+        with transaction.atomic():
+            self.cancelled = True
+            self.cancellation_reason = reason
+            releases_seat = self._seat_delta(is_new=False) < 0
+            self.save()
+            if releases_seat:
+                WaitlistEntry.promote_next(self.fitness_class)
+
+
+class WaitlistEntry(TimeStampedModel):
+    """
+    A member queued for a seat in a full fitness class.
+
+    Entries are served first-in, first-out per class. The (fitness_class, id)
+    index makes "next in line" a single index seek and a member's position
+    an index-only range count; entries are deleted once promoted so the
+    index only ever holds people who are still waiting.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        verbose_name=_('user')
+    )
+    fitness_class = models.ForeignKey(
+        FitnessClass,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        verbose_name=_('fitness class')
+    )
+
+    class Meta:
+        verbose_name = _('waitlist entry')
+        verbose_name_plural = _('waitlist entries')
+        ordering = ['fitness_class', 'id']
+        unique_together = ['user', 'fitness_class']
+        indexes = [
+            models.Index(fields=['fitness_class', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} waiting for {self.fitness_class.name}"
 
-    def send_cancellation_email(self):
-        """Send booking cancellation email"""
-        subject = _("Booking Cancelled: %(class_name)s") % {
-            'class_name': self.fitness_class.name
+    @property
+    def position(self):
+        """1-based place in the queue for this class"""
+        return WaitlistEntry.objects.filter(
+            fitness_class_id=self.fitness_class_id,
+            id__lte=self.id
+        ).count()
+
+    @classmethod
+    def promote_next(cls, fitness_class):
+        """
+        Give a freed seat to the longest-waiting member.
+
+        Runs inside the caller's transaction so the cancellation and the
+        promotion commit together. Returns the promoted booking, or None if
+        nobody is waiting or the seat has already been taken.
+        """
+        with transaction.atomic():
+            waiting = cls.objects.select_for_update(skip_locked=True).filter(
+                fitness_class=fitness_class
+            ).order_by('id')
+            while True:
+                entry = waiting.first()
+                if entry is None:
+                    return None
+                booking = Booking.objects.filter(
+                    user_id=entry.user_id,
+                    fitness_class=fitness_class
+                ).first()
+                if booking is not None and not booking.cancelled:
+                    # Already holds a seat; drop the stale entry and move on
+                    entry.delete()
+                    continue
+                if booking is None:
+                    booking = Booking(user_id=entry.user_id, fitness_class=fitness_class)
+                booking.fitness_class = fitness_class
+                booking.cancelled = False
+                booking.cancellation_reason = None
+                try:
+                    with transaction.atomic():
+                        booking.save()
+                except ClassFullError:
+                    # The seat went to someone else; this member keeps their place
+                    return None
+                entry.delete()
+                return booking
+
+
+class OutboxEmail(TimeStampedModel):
+    """
+    A booking notification waiting to be delivered.
+
+    Rows are written in the same transaction as the booking change that
+    caused them and drained in batches by ``manage.py send_queued_emails``,
+    so a slow mail server never holds up a request. Failed deliveries are
+    retried with exponential backoff and parked as FAILED (dead letters)
+    once they run out of attempts.
+    """
+    CONFIRMATION = 'booking_confirmation'
+    CANCELLATION = 'booking_cancellation'
+    TEMPLATES = (
+        (CONFIRMATION, _('Booking confirmation')),
+        (CANCELLATION, _('Booking cancellation')),
+    )
+    SUBJECTS = {
+        CONFIRMATION: _("Booking Confirmation: %(class_name)s"),
+        CANCELLATION: _("Booking Cancelled: %(class_name)s"),
+    }
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    # Dropped unsent because the booking changed back before delivery
+    SUPERSEDED = 'superseded'
+    STATUSES = (
+        (PENDING, _('Pending')),
+        (SENT, _('Sent')),
+        (FAILED, _('Failed')),
+        (SUPERSEDED, _('Superseded')),
+    )
+
+    booking = models.ForeignKey(
+        Booking,
+        on_delete=models.CASCADE,
+        related_name='outbox_emails',
+        verbose_name=_('booking')
+    )
+    template = models.CharField(_('template'), max_length=50, choices=TEMPLATES)
+    status = models.CharField(
+        _('status'),
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(_('attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('next attempt at'), default=timezone.now)
+    sent_at = models.DateTimeField(_('sent at'), blank=True, null=True)
+    last_error = models.TextField(_('last error'), blank=True)
+
+    class Meta:
+        verbose_name = _('outbox email')
+        verbose_name_plural = _('outbox emails')
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            # The dispatcher only ever scans due, pending rows
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='booking_outbox_pending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_template_display()} for booking {self.booking_id} ({self.status})"
+
+    def is_superseded(self):
+        """Whether this is a cancellation notice for a booking that has since been reinstated"""
+        return self.template == self.CANCELLATION and not self.booking.cancelled
+
+    def build_message(self, connection=None):
+        """Render this notification into an email bound to ``connection``"""
+        booking = self.booking
+        subject = self.SUBJECTS[self.template] % {
+            'class_name': booking.fitness_class.name
         }
-        
         context = {
-            'user': self.user,
-            'booking': self,
-            'class': self.fitness_class,
-            'reason': self.cancellation_reason,
+            'user': booking.user,
+            'booking': booking,
+            'class': booking.fitness_class,
+            'reason': booking.cancellation_reason,
         }
-        
-        text_message = render_to_string('emails/booking_cancellation.txt', context)
-        html_message = render_to_string('emails/booking_cancellation.html', context)
-        
-        send_mail(
+        message = EmailMultiAlternatives(
             subject,
-            text_message,
+            render_to_string(f'emails/{self.template}.txt', context),
             settings.DEFAULT_FROM_EMAIL,
-            [self.user.email],
-            html_message=html_message,
-            fail_silently=False,
+            [booking.user.email],
+            connection=connection,
         )
-
-    def cancel(self, reason=None):
-        """Helper method to cancel a booking"""
-        self.cancelled = True
-        self.cancellation_reason = reason
-        self.save()
+        message.attach_alternative(
+            render_to_string(f'emails/{self.template}.html', context),
+            'text/html'
+        )
+        return message
 
 from django.db import models
 from django.contrib.auth.models import User
 
+def new_calendar_feed_key():
+    return secrets.token_urlsafe(16)
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
@@ -211,6 +561,59 @@ class Profile(models.Model):
     emergency_phone = models.CharField(max_length=20, blank=True, null=True)
     health_notes = models.TextField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Part of every calendar feed URL (booking.ical); replacing it revokes them
+    calendar_feed_key = models.CharField(max_length=32, default=new_calendar_feed_key, editable=False)
 
     def __str__(self):
-        return f"{self.user.username}'s Profile"
\ No newline at end of file
+        return f"{self.user.username}'s Profile"
+
+    def reset_calendar_feed_key(self):
+        """Issue a new feed key, so the feed URLs handed out so far stop working"""
+        self.calendar_feed_key = new_calendar_feed_key()
+        self.save(update_fields=['calendar_feed_key'])
+
+    @classmethod
+    def for_user(cls, user):
+        """The user's profile, created the first time it is needed"""
+        try:
+            return user.profile
+        except cls.DoesNotExist:
+            profile, _created = cls.objects.get_or_create(user=user)
+            user.profile = profile
+            return profile
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so save() can skip unchanged fields
+        instance._loaded_values = instance._field_values(field_names)
+        return instance
+
+    def _field_values(self, attnames=None):
+        return {
+            field.attname: field.get_prep_value(getattr(self, field.attname))
+            for field in self._meta.concrete_fields
+            if attnames is None or field.attname in attnames
+        }
+
+    def changed_fields(self):
+        """Fields that differ from the stored row, or None if that row was never loaded"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        current = self._field_values(loaded)
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded and current[field.attname] != loaded[field.attname]
+        ]
+
+    def save(self, *args, **kwargs):
+        # A loaded profile writes only the fields that changed, or nothing
+        if not args and not self._state.adding and kwargs.get('update_fields') is None:
+            changed = self.changed_fields()
+            if changed == []:
+                return
+            if changed is not None:
+                kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        self._loaded_values = self._field_values()
\ No newline at end of file
@@ -0,0 +1,89 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempts):
+    """Exponential backoff between delivery attempts, capped at one hour"""
+    base = settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+def dispatch_batch(batch_size=None, max_attempts=None):
+    """
+    Deliver one batch of due outbox emails over a single SMTP connection.
+
+    Rows are claimed with SKIP LOCKED so several dispatchers can drain the
+    outbox side by side. Emails are rendered at send time, so a cancellation
+    whose booking was reinstated meanwhile is marked SUPERSEDED instead of
+    sent. Returns ``(sent, failed)`` counts for the batch.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+    while True:
+        sent, failed, superseded = _dispatch(batch_size, max_attempts)
+        # A batch that was all superseded says nothing about what is left,
+        # and (0, 0) would tell send_queued_emails the outbox is drained
+        if sent or failed or not superseded:
+            return sent, failed
+
+
+def _dispatch(batch_size, max_attempts):
+    now = timezone.now()
+    sent = failed = superseded = 0
+
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+            .select_related('booking__user', 'booking__fitness_class')
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not batch:
+            return sent, failed, superseded
+
+        connection = get_connection()
+        try:
+            connection.open()
+            for email in batch:
+                if email.is_superseded():
+                    superseded += 1
+                    email.status = OutboxEmail.SUPERSEDED
+                    logger.info('Outbox email %s dropped: booking %s was reinstated', email.pk, email.booking_id)
+                    continue
+                email.attempts += 1
+                try:
+                    email.build_message(connection).send()
+                except Exception as exc:
+                    failed += 1
+                    email.last_error = f'{exc.__class__.__name__}: {exc}'
+                    if email.attempts >= max_attempts:
+                        email.status = OutboxEmail.FAILED
+                        logger.error('Outbox email %s moved to dead letters: %s', email.pk, exc)
+                    else:
+                        email.next_attempt_at = now + retry_delay(email.attempts)
+                else:
+                    sent += 1
+                    email.status = OutboxEmail.SENT
+                    email.sent_at = now
+                    email.last_error = ''
+        finally:
+            connection.close()
+
+        finished = timezone.now()
+        for email in batch:
+            email.modified = finished
+        OutboxEmail.objects.bulk_update(
+            batch,
+            ['status', 'attempts', 'next_attempt_at', 'sent_at', 'last_error', 'modified']
+        )
+
+    return sent, failed, superseded
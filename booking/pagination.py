@@ -0,0 +1,138 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are fetched with a ``WHERE (key) > (last key)`` condition on the
+ordering columns instead of OFFSET, and one extra row is read to detect a
+following page instead of running COUNT(*), so page 500 costs the same as
+page one. Cursors are opaque URL-safe tokens carrying the boundary key.
+"""
+import base64
+import json
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values, backwards=False):
+    payload = json.dumps({'k': values, 'b': backwards}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(values, backwards)``, or ``(None, False)`` for a missing or bad token"""
+    if not token:
+        return None, False
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return list(payload['k']), bool(payload.get('b'))
+    except (ValueError, TypeError, KeyError):
+        return None, False
+
+
+def _resolve_field(model, lookup):
+    """Follow a ``a__b`` lookup to its model field, or None for annotations"""
+    field = None
+    for part in lookup.split('__'):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model or model
+    return field
+
+
+def _key_value(obj, lookup):
+    for part in lookup.split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _after(ordering, values, reverse):
+    """Build the lexicographic "comes after ``values``" condition for ``ordering``"""
+    clauses = []
+    for i, key in enumerate(ordering):
+        name = key.lstrip('-')
+        descending = key.startswith('-') != reverse
+        condition = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            condition &= Q(**{previous.lstrip('-'): value})
+        clauses.append(condition)
+    return reduce(lambda a, b: a | b, clauses)
+
+
+def paginate(queryset, ordering, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    """
+    Return a KeysetPage of ``queryset`` ordered by ``ordering``.
+
+    ``ordering`` is a sequence of field lookups (``-`` for descending) whose
+    last entry must be unique, e.g. ``('start_time', 'id')``.
+    """
+    ordering = tuple(ordering)
+    values, backwards = decode_cursor(cursor)
+
+    if values is not None:
+        if len(values) != len(ordering):
+            values = None
+        else:
+            try:
+                values = [
+                    field.to_python(value) if field is not None else value
+                    for field, value in (
+                        (_resolve_field(queryset.model, key.lstrip('-')), value)
+                        for key, value in zip(ordering, values)
+                    )
+                ]
+            except (ValidationError, TypeError, ValueError):
+                values = None
+        if values is None:
+            backwards = False
+
+    order_by = ordering
+    if backwards:
+        order_by = tuple(key[1:] if key.startswith('-') else f'-{key}' for key in ordering)
+
+    page_qs = queryset.order_by(*order_by)
+    if values is not None:
+        page_qs = page_qs.filter(_after(ordering, values, backwards))
+
+    rows = list(page_qs[:per_page + 1])
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    if backwards:
+        items.reverse()
+
+    def key_of(obj):
+        return [_key_value(obj, key.lstrip('-')) for key in ordering]
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_more or backwards:
+            next_cursor = encode_cursor(key_of(items[-1]))
+        if values is not None and (has_more or not backwards):
+            prev_cursor = encode_cursor(key_of(items[0]), backwards=True)
+    return KeysetPage(items, next_cursor, prev_cursor)
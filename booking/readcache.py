@@ -0,0 +1,229 @@
+"""
+Two-tier cache for hot read models: class listings, class details and seat
+counts.
+
+Values are kept in a bounded in-process LRU in front of the shared cache
+(CACHES[READ_CACHE_ALIAS], Redis in production), so a hit usually costs no
+network round trip for the payload. Every key embeds the current version
+of the namespaces it was built from:
+
+* ``schedule``: any class added, edited or removed (conditional.touch_schedule)
+* ``class:<pk>``: that class's seat count changing
+* ``member:<user_id>``: that member's bookings changing (booking_changed)
+
+Versions are only read from the shared tier, so one bump there, e.g. when a
+booking commits, retires the old entries in every worker at once. Retired
+entries are never read again and age out of both tiers.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+SCHEDULE = 'schedule'
+KEY_PREFIX = 'booking:read'
+
+_MISSING = object()
+
+
+def class_namespace(pk):
+    return f'class:{pk}'
+
+
+def member_namespace(user_id):
+    return f'member:{user_id}'
+
+
+class LocalLRU:
+    """Bounded, thread-safe in-process store with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ReadCache:
+    """
+    get_or_set()/get_many_or_set() for read models, counting hits per model.
+    ``shared`` is any Django cache; tests pass a LocMemCache in place of Redis.
+    """
+
+    def __init__(self, shared=None, max_entries=None, local_timeout=None):
+        self._shared = shared
+        self.local = LocalLRU(
+            settings.READ_CACHE_LOCAL_MAX_ENTRIES if max_entries is None else max_entries
+        )
+        self.local_timeout = settings.READ_CACHE_LOCAL_TIMEOUT if local_timeout is None else local_timeout
+        self.counters = Counter()
+
+    @property
+    def shared(self):
+        if self._shared is None:
+            self._shared = caches[settings.READ_CACHE_ALIAS]
+        return self._shared
+
+    def _version_key(self, namespace):
+        return f'{KEY_PREFIX}:version:{namespace}'
+
+    def versions(self, namespaces):
+        """{namespace: current version}, read from the shared tier in one round trip"""
+        keys = {self._version_key(namespace): namespace for namespace in namespaces}
+        found = self.shared.get_many(keys)
+        versions = {keys[key]: version for key, version in found.items()}
+        for key, namespace in keys.items():
+            if namespace not in versions:
+                # A clock-based start, so a lost version key never reuses an old one
+                self.shared.add(key, time.time_ns(), None)
+                versions[namespace] = self.shared.get(key)
+        return versions
+
+    def bump(self, *namespaces):
+        """Retire every entry built from these namespaces, in all workers"""
+        for namespace in namespaces:
+            key = self._version_key(namespace)
+            try:
+                self.shared.incr(key)
+            except ValueError:
+                self.shared.add(key, time.time_ns(), None)
+
+    def _key(self, model, key, namespaces, versions):
+        stamp = ':'.join(f'{namespace}={versions[namespace]}' for namespace in namespaces)
+        # Hashed so query strings and long version lists make valid memcached keys too
+        digest = hashlib.md5(f'{key}|{stamp}'.encode()).hexdigest()
+        return f'{KEY_PREFIX}:{model}:{digest}'
+
+    def _local_timeout(self, timeout):
+        return min(timeout, self.local_timeout)
+
+    def entry_key(self, model, key, namespaces):
+        """The cache key ``key`` is stored under until one of ``namespaces`` is bumped"""
+        return self._key(model, key, namespaces, self.versions(namespaces))
+
+    def get(self, model, cache_key, default=None, timeout=None):
+        """Look ``cache_key`` up in both tiers, counting the hit or miss against ``model``"""
+        value = self.local.get(cache_key, _MISSING)
+        if value is not _MISSING:
+            self.counters[model, 'local_hits'] += 1
+            return value
+        value = self.shared.get(cache_key, _MISSING)
+        if value is _MISSING:
+            self.counters[model, 'misses'] += 1
+            return default
+        self.counters[model, 'shared_hits'] += 1
+        timeout = settings.READ_CACHE_TIMEOUT if timeout is None else timeout
+        self.local.set(cache_key, value, self._local_timeout(timeout))
+        return value
+
+    def set(self, cache_key, value, timeout=None):
+        """Store ``value`` under a key from entry_key() in both tiers"""
+        timeout = settings.READ_CACHE_TIMEOUT if timeout is None else timeout
+        self.shared.set(cache_key, value, timeout)
+        self.local.set(cache_key, value, self._local_timeout(timeout))
+
+    def get_or_set(self, model, key, namespaces, factory, timeout=None):
+        """Return the cached ``model`` value for ``key``, building it with ``factory()`` on a miss"""
+        cache_key = self.entry_key(model, key, namespaces)
+        value = self.get(model, cache_key, _MISSING, timeout)
+        if value is _MISSING:
+            value = factory()
+            self.set(cache_key, value, timeout)
+        return value
+
+    def get_many_or_set(self, model, keys, namespaces_for, factory, timeout=None):
+        """
+        Batch get_or_set(): ``namespaces_for(key)`` lists each key's namespaces
+        and ``factory(missing_keys)`` returns a dict for the keys it found.
+        """
+        timeout = settings.READ_CACHE_TIMEOUT if timeout is None else timeout
+        key_namespaces = {key: namespaces_for(key) for key in keys}
+        versions = self.versions({ns for namespaces in key_namespaces.values() for ns in namespaces})
+        cache_keys = {
+            self._key(model, key, namespaces, versions): key
+            for key, namespaces in key_namespaces.items()
+        }
+
+        values = {}
+        for cache_key, key in cache_keys.items():
+            value = self.local.get(cache_key, _MISSING)
+            if value is not _MISSING:
+                values[key] = value
+        self.counters[model, 'local_hits'] += len(values)
+
+        remote = [cache_key for cache_key, key in cache_keys.items() if key not in values]
+        for cache_key, value in self.shared.get_many(remote).items():
+            values[cache_keys[cache_key]] = value
+            self.local.set(cache_key, value, self._local_timeout(timeout))
+            self.counters[model, 'shared_hits'] += 1
+
+        missing = [key for key in keys if key not in values]
+        if missing:
+            self.counters[model, 'misses'] += len(missing)
+            built = factory(missing)
+            fresh = {
+                cache_key: built[key]
+                for cache_key, key in cache_keys.items()
+                if key in built and key not in values
+            }
+            self.shared.set_many(fresh, timeout)
+            for cache_key, value in fresh.items():
+                self.local.set(cache_key, value, self._local_timeout(timeout))
+            values.update(built)
+        return values
+
+    def stats(self):
+        """Hit/miss counts per read model for this process, plus the LRU size"""
+        models = {}
+        for (model, outcome), count in self.counters.items():
+            models.setdefault(model, {'local_hits': 0, 'shared_hits': 0, 'misses': 0})[outcome] = count
+        for counts in models.values():
+            total = sum(counts.values())
+            counts['hit_rate'] = round((counts['local_hits'] + counts['shared_hits']) / total, 3) if total else None
+        return {
+            'local_entries': len(self.local),
+            'local_max_entries': self.local.max_entries,
+            'models': models,
+        }
+
+    def clear_local(self):
+        self.local.clear()
+        self.counters.clear()
+
+
+# The process-wide instance used by the views
+read_cache = ReadCache()
+get_or_set = read_cache.get_or_set
+get_many_or_set = read_cache.get_many_or_set
+bump = read_cache.bump
+stats = read_cache.stats
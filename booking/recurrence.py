@@ -0,0 +1,247 @@
+"""
+Recurring class series.
+
+A series is an RFC 5545 RRULE expanded in local time, so a 07:00 class stays
+at 07:00 across daylight-saving changes. All occurrences are validated
+before anything is written and are then inserted with one bulk_create.
+"This and all following" edits and cancellations are set-based UPDATEs over
+the (series, start_time) index.
+"""
+from collections import Counter
+
+from dateutil.rrule import rrulestr
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from . import conditional, leaderboard
+from .models import (
+    Booking, ClassSeries, FitnessClass, OutboxEmail, WaitlistEntry, booking_changed, seat_count_changed
+)
+from .search import SEARCH_FIELDS, index_classes
+
+# Upper bound on one series; also stops rules without COUNT or UNTIL
+MAX_OCCURRENCES = 200
+
+WEEKDAYS = (
+    ('MO', _('Monday')),
+    ('TU', _('Tuesday')),
+    ('WE', _('Wednesday')),
+    ('TH', _('Thursday')),
+    ('FR', _('Friday')),
+    ('SA', _('Saturday')),
+    ('SU', _('Sunday')),
+)
+
+# Fields a "this and all following" edit copies across the series
+SERIES_FIELDS = (
+    'name', 'description', 'instructor', 'class_type', 'capacity',
+    'price', 'location', 'is_active', 'image',
+)
+
+# Per-row state that each occurrence gets fresh instead of copying it from the template
+NOT_COPIED = ('id', 'created', 'modified', 'start_time', 'end_time', 'booked_count', 'search_vector', 'series')
+
+
+def weekly_rule(weekdays, interval=1, until=None, count=None):
+    """Build the RRULE for a weekly series on ``weekdays`` (codes from WEEKDAYS)"""
+    parts = ['FREQ=WEEKLY', f'INTERVAL={interval}', f"BYDAY={','.join(weekdays)}"]
+    if count:
+        parts.append(f'COUNT={count}')
+    elif until:
+        parts.append(f'UNTIL={until:%Y%m%d}T235959')
+    return ';'.join(parts)
+
+
+def expand(rule, start_time, end_time, exceptions=()):
+    """
+    Return ``(start_time, end_time)`` for every occurrence of ``rule``.
+
+    The rule is anchored at ``start_time``'s local wall-clock time and each
+    occurrence keeps the template's length. Dates in ``exceptions`` are
+    skipped. Raises ValidationError for an unparsable rule, an empty or
+    oversized series, or an occurrence that would break the
+    end_time_after_start_time constraint.
+    """
+    duration = end_time - start_time
+    skipped = set(exceptions)
+    try:
+        dates = rrulestr(
+            rule,
+            dtstart=timezone.localtime(start_time).replace(tzinfo=None),
+            forceset=True
+        )
+        occurrences = []
+        for local_start in dates:
+            if local_start.date() in skipped:
+                continue
+            if len(occurrences) == MAX_OCCURRENCES:
+                raise ValidationError(
+                    _('A series can have at most %(max)d classes; add COUNT or an earlier UNTIL.'),
+                    code='too_many_occurrences',
+                    params={'max': MAX_OCCURRENCES}
+                )
+            occurrence_start = timezone.make_aware(local_start)
+            occurrence_end = occurrence_start + duration
+            if occurrence_end <= occurrence_start:
+                raise ValidationError(
+                    _('End time must be after start time (%(date)s).'),
+                    code='end_time_after_start_time',
+                    params={'date': local_start.date()}
+                )
+            occurrences.append((occurrence_start, occurrence_end))
+    except (ValueError, TypeError, OverflowError) as error:
+        raise ValidationError(
+            _('Invalid recurrence rule: %(error)s'),
+            code='invalid_rule',
+            params={'error': error}
+        )
+    if not occurrences:
+        raise ValidationError(_('The recurrence rule produces no classes.'), code='empty_series')
+    return occurrences
+
+
+def create_series(template, rule, occurrences, exceptions=()):
+    """
+    Save a copy of the unsaved ``template`` class for every occurrence.
+
+    All rows are written with a single bulk_create. That bypasses
+    FitnessClass.save(), so the new rows are added to the search index here.
+    """
+    # Store an uploaded image once rather than once per occurrence
+    FitnessClass._meta.get_field('image').pre_save(template, add=True)
+    values = {
+        field.attname: getattr(template, field.attname)
+        for field in FitnessClass._meta.concrete_fields
+        if field.name not in NOT_COPIED
+    }
+
+    with transaction.atomic():
+        series = ClassSeries.objects.create(
+            rule=rule,
+            exceptions=sorted(day.isoformat() for day in exceptions)
+        )
+        FitnessClass.objects.bulk_create([
+            FitnessClass(**values, start_time=start, end_time=end, series=series)
+            for start, end in occurrences
+        ])
+        index_classes(series.occurrences.all())
+        transaction.on_commit(leaderboard.invalidate)
+        transaction.on_commit(conditional.touch_schedule)
+    return series
+
+
+def following(fitness_class, start_time=None):
+    """Queryset of ``fitness_class`` and the later occurrences of its series"""
+    if fitness_class.series_id is None:
+        return FitnessClass.objects.filter(pk=fitness_class.pk)
+    return FitnessClass.objects.filter(
+        series_id=fitness_class.series_id,
+        start_time__gte=start_time or fitness_class.start_time
+    )
+
+
+def update_following(fitness_class, changed_fields, original_start):
+    """
+    Copy the edited values on ``fitness_class`` to it and every later
+    occurrence in its series with one UPDATE.
+
+    ``fitness_class`` holds the edited (unsaved) values and ``original_start``
+    its stored start. A time change moves each occurrence by the same
+    offset and gives it the new length. Like a single-class edit, it is
+    refused with ValidationError once any affected class has bookings.
+    Returns the number of classes updated.
+    """
+    changed = set(changed_fields)
+    if 'image' in changed:
+        FitnessClass._meta.get_field('image').pre_save(fitness_class, add=False)
+    updates = {name: getattr(fitness_class, name) for name in SERIES_FIELDS if name in changed}
+
+    with transaction.atomic():
+        classes = following(fitness_class, original_start)
+        if changed & {'start_time', 'end_time'}:
+            if Booking.objects.filter(fitness_class__in=classes).exists():
+                raise ValidationError(
+                    _('Cannot change class time after bookings have been made.'),
+                    code='has_bookings'
+                )
+            shift = fitness_class.start_time - original_start
+            updates['start_time'] = F('start_time') + shift
+            updates['end_time'] = F('start_time') + (shift + fitness_class.end_time - fitness_class.start_time)
+        if not updates:
+            return 0
+
+        updated = classes.update(**updates, modified=timezone.now())
+        if changed & set(SEARCH_FIELDS):
+            # Every row moved by the same offset, so the edited start bounds the set again
+            index_classes(following(fitness_class))
+        transaction.on_commit(leaderboard.invalidate)
+        transaction.on_commit(conditional.touch_schedule)
+    return updated
+
+
+def cancel_following(fitness_class, reason=None):
+    """
+    Cancel ``fitness_class`` and every later occurrence in its series.
+
+    The classes are deactivated and their live bookings cancelled with one
+    UPDATE each. Cancellation emails go to the outbox in one bulk insert,
+    member stats are updated through booking_changed and seat watchers and
+    caches through seat_count_changed, once per class. Waitlists for the
+    classes are dropped. Returns ``(classes_cancelled, bookings_cancelled)``.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Locked first, so no booking lands between reading the seats and zeroing them
+        class_ids = list(
+            following(fitness_class).select_for_update().order_by('pk').values_list('pk', flat=True)
+        )
+        classes = FitnessClass.objects.filter(pk__in=class_ids)
+        bookings = Booking.objects.select_for_update(of=('self',)).filter(
+            fitness_class__in=class_ids,
+            cancelled=False
+        ).order_by()
+        cancelled = list(bookings.values_list(
+            'pk', 'user_id', 'fitness_class__start_time', 'fitness_class_id'
+        ))
+        booking_ids = [booking_id for booking_id, _user_id, _start, _class_id in cancelled]
+        freed = Counter(class_id for _booking_id, _user_id, _start, class_id in cancelled)
+
+        Booking.objects.filter(pk__in=booking_ids).update(
+            cancelled=True,
+            cancellation_reason=reason,
+            modified=now
+        )
+        class_count = classes.update(is_active=False, booked_count=0, modified=now)
+        WaitlistEntry.objects.filter(fitness_class__in=classes).delete()
+        OutboxEmail.objects.bulk_create([
+            OutboxEmail(booking_id=pk, template=OutboxEmail.CANCELLATION)
+            for pk in booking_ids
+        ])
+
+        for booking_id, user_id, start_time, _class_id in cancelled:
+            transaction.on_commit(
+                lambda user_id=user_id, start_time=start_time: booking_changed.send(
+                    sender=Booking,
+                    user_id=user_id,
+                    total_delta=0,
+                    seat_delta=-1,
+                    attended_delta=0,
+                    start_time=start_time
+                )
+            )
+        transaction.on_commit(leaderboard.invalidate)
+        transaction.on_commit(conditional.touch_schedule)
+        # booked_count was zeroed by the UPDATE above, which Booking.save() never saw
+        for class_id in class_ids:
+            transaction.on_commit(
+                lambda class_id=class_id: seat_count_changed.send(
+                    sender=FitnessClass,
+                    fitness_class_id=class_id,
+                    delta=-freed[class_id],
+                    booked_count=0
+                )
+            )
+    return class_count, len(booking_ids)
@@ -0,0 +1,98 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .models import Booking
+
+logger = logging.getLogger(__name__)
+
+
+def due_reminders(now=None, window=timedelta(hours=24)):
+    """Live bookings for classes starting within ``window`` that have not been reminded"""
+    now = now or timezone.now()
+    return Booking.objects.filter(
+        fitness_class__start_time__range=(now, now + window),
+        cancelled=False,
+        reminder_sent=False
+    ).select_related('user', 'fitness_class').order_by('pk')
+
+
+def iter_chunks(queryset, chunk_size):
+    """
+    Yield lists of at most ``chunk_size`` rows using keyset pagination on pk.
+
+    Each chunk is a fresh ``pk > last`` query, so memory stays bounded and
+    rows whose send failed are not picked up again in the same run.
+    """
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def build_reminder(booking, text_template, html_template, connection):
+    """Render one reminder with pre-compiled templates"""
+    context = {
+        'user': booking.user,
+        'booking': booking,
+        'class': booking.fitness_class,
+    }
+    message = EmailMultiAlternatives(
+        _('Reminder: %(class_name)s starts soon') % {'class_name': booking.fitness_class.name},
+        text_template.render(context),
+        settings.DEFAULT_FROM_EMAIL,
+        [booking.user.email],
+        connection=connection,
+    )
+    message.attach_alternative(html_template.render(context), 'text/html')
+    return message
+
+
+def send_due_reminders(now=None, chunk_size=None, window=timedelta(hours=24)):
+    """
+    Send reminders for classes in the next ``window`` over one mail connection.
+
+    Bookings are streamed in keyset-ordered chunks and each chunk's
+    ``reminder_sent`` flags are flipped with a single UPDATE once it has been
+    sent. Because only unflagged bookings are selected, a run that crashes
+    part-way can simply be started again; at most the chunk in flight is
+    sent twice. Returns ``(sent, failed)``.
+    """
+    chunk_size = chunk_size or settings.BOOKING_REMINDER_CHUNK_SIZE
+    text_template = get_template('emails/booking_reminder.txt')
+    html_template = get_template('emails/booking_reminder.html')
+    sent = failed = 0
+
+    connection = get_connection()
+    connection.open()
+    try:
+        for chunk in iter_chunks(due_reminders(now, window), chunk_size):
+            delivered = []
+            for booking in chunk:
+                if not booking.user.email:
+                    # Nothing to send; flag it so it is not retried every night
+                    delivered.append(booking.pk)
+                    continue
+                try:
+                    build_reminder(booking, text_template, html_template, connection).send()
+                except Exception as exc:
+                    failed += 1
+                    logger.warning('Reminder for booking %s failed: %s', booking.pk, exc)
+                else:
+                    delivered.append(booking.pk)
+            Booking.objects.filter(pk__in=delivered).update(reminder_sent=True)
+            sent += len(delivered)
+    finally:
+        connection.close()
+
+    return sent, failed
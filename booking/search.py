@@ -0,0 +1,166 @@
+"""
+Full-text search over fitness classes.
+
+PostgreSQL keeps a weighted ``tsvector`` in FitnessClass.search_vector,
+backed by a GIN index; SQLite (dev and tests) mirrors the searchable
+columns into an FTS5 table. Both are refreshed from FitnessClass.save(),
+FTS5 rows are dropped when their class is deleted (unindex_classes()), and
+both can be rebuilt in bulk with ``manage.py rebuild_search_index``.
+"""
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'booking_fitnessclass_fts'
+SEARCH_FIELDS = ('name', 'instructor', 'description')
+
+
+def search_terms(query):
+    """Split user input into plain word tokens safe to splice into a search query"""
+    return re.findall(r'\w+', query or '')
+
+
+class PostgresSearchBackend:
+    """tsvector column with a GIN index, ranked with ts_rank"""
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return (
+            SearchVector('name', weight='A')
+            + SearchVector('instructor', weight='B')
+            + SearchVector('description', weight='C')
+        )
+
+    def update(self, queryset):
+        return queryset.update(search_vector=self.vector())
+
+    def remove(self, pks, using='default'):
+        # The vector lives on the class row and goes with it
+        return 0
+
+    def rebuild(self, model, using='default', batch_size=1000):
+        classes = model.objects.using(using)
+        updated = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                classes.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                return updated
+            updated += self.update(classes.filter(pk__in=pks))
+            last_pk = pks[-1]
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        terms = search_terms(query)
+        if not terms:
+            return queryset
+        # Prefix-match every word so results update as the user types
+        ts_query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw')
+        return queryset.filter(search_vector=ts_query).annotate(
+            rank=SearchRank(F('search_vector'), ts_query)
+        ).order_by('-rank', 'start_time')
+
+
+class SQLiteSearchBackend:
+    """FTS5 shadow table keyed by the class id, ranked with bm25"""
+
+    def match_expression(self, query):
+        return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+    def update(self, queryset):
+        pks = list(queryset.values_list('pk', flat=True))
+        if not pks:
+            return 0
+        table = queryset.model._meta.db_table
+        placeholders = ', '.join(['%s'] * len(pks))
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', pks)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, instructor, description) '
+                f'SELECT id, name, instructor, description FROM {table} WHERE id IN ({placeholders})',
+                pks
+            )
+        return len(pks)
+
+    def remove(self, pks, using='default'):
+        if not pks:
+            return 0
+        placeholders = ', '.join(['%s'] * len(pks))
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', list(pks))
+            return cursor.rowcount
+
+    def rebuild(self, model, using='default', batch_size=None):
+        table = model._meta.db_table
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, instructor, description) '
+                f'SELECT id, name, instructor, description FROM {table}'
+            )
+            return cursor.rowcount
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset
+        table = queryset.model._meta.db_table
+        # bm25() is lower-is-better; negate it so both backends sort on -rank
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id',
+            [match],
+            output_field=FloatField()
+        )
+        matching = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        return queryset.filter(pk__in=matching).annotate(rank=rank).order_by('-rank', 'start_time')
+
+
+class SubstringSearchBackend:
+    """Unindexed fallback for databases without a full-text engine"""
+
+    def update(self, queryset):
+        return 0
+
+    def remove(self, pks, using='default'):
+        return 0
+
+    def rebuild(self, model, using='default', batch_size=None):
+        return 0
+
+    def search(self, queryset, query):
+        if not query:
+            return queryset
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__icontains': query})
+        return queryset.filter(condition)
+
+
+def get_search_backend(using='default'):
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    return SubstringSearchBackend()
+
+
+def search_classes(queryset, query):
+    """Filter ``queryset`` to classes matching ``query``, best matches first"""
+    return get_search_backend(queryset.db).search(queryset, query)
+
+
+def index_classes(queryset):
+    """Refresh the search index for the classes in ``queryset``"""
+    return get_search_backend(queryset.db).update(queryset)
+
+
+def unindex_classes(pks, using='default'):
+    """Drop deleted classes from the search index"""
+    return get_search_backend(using).remove(pks, using)
@@ -0,0 +1,181 @@
+"""
+Synthetic members, classes and bookings for benchmarks and load tests.
+
+Rows are written with bulk_create in batches. That means the per-user
+post_save profile signal and Booking.save() never run: no seat claims, no
+outbox emails and no stats signals. booked_count is set directly from the
+generated bookings instead. The same seed and anchor produce the same data.
+"""
+import random
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import conditional, leaderboard
+from .models import Booking, FitnessClass, Profile
+from .search import index_classes
+
+SEED_PASSWORD = 'seed-password'
+
+FIRST_NAMES = (
+    'Amara', 'Ben', 'Chloe', 'Diego', 'Esther', 'Felix', 'Grace', 'Hiro', 'Ines', 'Jonas',
+    'Kemi', 'Liam', 'Maya', 'Noah', 'Olga', 'Pierre', 'Quinn', 'Rosa', 'Sami', 'Tara',
+)
+LAST_NAMES = (
+    'Adeyemi', 'Brown', 'Costa', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Haddad',
+    'Ito', 'Jensen', 'Kowalski', 'Lopez', 'Mwangi', 'Nguyen', 'Okafor', 'Petrov',
+)
+CLASS_ADJECTIVES = ('Morning', 'Lunchtime', 'Evening', 'Power', 'Gentle', 'Express', 'Advanced', 'Beginner')
+LOCATIONS = ('Studio A', 'Studio B', 'Main Hall', 'Rooftop', 'Spin Room')
+CAPACITIES = (10, 12, 15, 20, 25, 30, 40)
+DURATIONS = (45, 60, 75, 90)
+PRICES = ('0.00', '8.00', '12.50', '15.00')
+
+
+def _batched_create(model, objs, batch_size):
+    """bulk_create ``objs`` (any iterable) ``batch_size`` rows at a time; returns the row count"""
+    total = 0
+    batch = []
+    for obj in objs:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def _new_pks(model, after):
+    """Primary keys created since ``after`` (the max pk before inserting), oldest first"""
+    return list(model.objects.filter(pk__gt=after).order_by('pk').values_list('pk', flat=True))
+
+
+def _max_pk(model):
+    return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def seed(members=1000, classes=2000, bookings=20000, seed=0, batch_size=5000,
+         prefix='seed', anchor=None, past_days=90, future_days=90,
+         cancellation_rate=0.1, attendance_rate=0.8):
+    """
+    Create ``members`` users with profiles and ``classes`` classes spread
+    over ``past_days`` before and ``future_days`` after ``anchor`` (default
+    today). About ``bookings`` bookings are spread across them, fewer when
+    the classes cannot hold that many.
+
+    About ``cancellation_rate`` of the bookings are cancelled; no class has
+    more live bookings than its capacity. About ``attendance_rate`` of the
+    live bookings for classes that have already started are marked
+    attended.
+
+    Returns a dict of the rows created.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    anchor = anchor or timezone.localdate()
+    password = make_password(SEED_PASSWORD, salt='seedfitness')
+    first_day = anchor - timedelta(days=past_days)
+    span_days = past_days + future_days
+
+    with transaction.atomic():
+        last_user = _max_pk(User)
+        _batched_create(User, (
+            User(
+                username=f'{prefix}{number:07d}',
+                email=f'{prefix}{number:07d}@example.com',
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                password=password
+            )
+            for number in range(members)
+        ), batch_size)
+        member_ids = _new_pks(User, last_user)
+
+        # Profiles are otherwise created on first use (Profile.for_user); one batch here
+        _batched_create(Profile, (
+            Profile(
+                user_id=user_id,
+                phone_number=f'+1555{rng.randrange(10 ** 7):07d}',
+                birth_date=anchor - timedelta(days=rng.randint(18 * 365, 70 * 365))
+            )
+            for user_id in member_ids
+        ), batch_size)
+
+        # Seats per class are chosen up front so booked_count is right on insert
+        per_class = bookings / classes if classes else 0
+        type_labels = {code: str(label) for code, label in FitnessClass.CLASS_TYPES}
+        class_types = list(type_labels)
+        class_rows = []
+        for _number in range(classes):
+            class_type = rng.choice(class_types)
+            capacity = rng.choice(CAPACITIES)
+            start_time = timezone.make_aware(datetime.combine(
+                first_day + timedelta(days=rng.randrange(span_days or 1)),
+                time(rng.randint(6, 20), rng.choice((0, 30)))
+            ))
+            # Demand beyond what capacity (plus the usual cancellations) can absorb is dropped
+            ceiling = int(capacity / (1 - cancellation_rate)) if cancellation_rate < 1 else len(member_ids)
+            total = min(len(member_ids), ceiling, rng.randint(0, round(2 * per_class)))
+            cancelled = sum(rng.random() < cancellation_rate for _booking in range(total))
+            # Cancel any overflow rather than overbook the class
+            cancelled = max(cancelled, total - capacity)
+            class_rows.append((total, cancelled, FitnessClass(
+                name=f'{rng.choice(CLASS_ADJECTIVES)} {type_labels[class_type]}',
+                description=f'{type_labels[class_type]} session for all levels',
+                instructor=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                class_type=class_type,
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=rng.choice(DURATIONS)),
+                capacity=capacity,
+                price=rng.choice(PRICES),
+                location=rng.choice(LOCATIONS),
+                is_active=rng.random() > 0.02,
+                booked_count=total - cancelled
+            )))
+        last_class = _max_pk(FitnessClass)
+        _batched_create(FitnessClass, (fitness_class for _total, _cancelled, fitness_class in class_rows), batch_size)
+        class_ids = _new_pks(FitnessClass, last_class)
+        index_classes(FitnessClass.objects.filter(pk__gt=last_class))
+
+        counts = {'cancelled': 0, 'attended': 0}
+
+        def class_bookings(class_id, total, cancelled, fitness_class):
+            started = fitness_class.start_time <= now
+            for position, user_id in enumerate(rng.sample(member_ids, total)):
+                is_cancelled = position < cancelled
+                attended = started and not is_cancelled and rng.random() < attendance_rate
+                counts['cancelled'] += is_cancelled
+                counts['attended'] += attended
+                yield Booking(
+                    user_id=user_id,
+                    fitness_class_id=class_id,
+                    cancelled=is_cancelled,
+                    cancellation_reason='Seeded cancellation' if is_cancelled else None,
+                    attended=attended,
+                    # Past reminders count as sent so send_booking_reminders skips them
+                    reminder_sent=started
+                )
+
+        booking_count = _batched_create(Booking, (
+            booking
+            for class_id, row in zip(class_ids, class_rows)
+            for booking in class_bookings(class_id, *row)
+        ), batch_size)
+
+        transaction.on_commit(leaderboard.invalidate)
+        transaction.on_commit(conditional.touch_schedule)
+
+    return {
+        'members': len(member_ids),
+        'classes': len(class_ids),
+        'bookings': booking_count,
+        'cancelled': counts['cancelled'],
+        'attended': counts['attended'],
+    }
@@ -0,0 +1,158 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .exceptions import AlreadyBookedError, ClassFullError, ClassNotBookableError
+from .models import Booking, FitnessClass, WaitlistEntry, attendance_changed
+
+
+def check_bookable(fitness_class, now=None, allow_past=False):
+    """
+    Cheap, lock-free pre-check against the loaded class row.
+
+    Lets requests for a class that is over or already full bail out before
+    opening a transaction; book_class() repeats the capacity check atomically.
+    """
+    now = now or timezone.now()
+    if not fitness_class.is_active:
+        raise ClassNotBookableError(_('This class is no longer available for booking.'))
+    if not allow_past and fitness_class.start_time < now:
+        raise ClassNotBookableError()
+    if fitness_class.is_full():
+        raise ClassFullError()
+
+
+def book_class(user, fitness_class, allow_past=False):
+    """
+    Book a seat for ``user`` in ``fitness_class`` as a single transaction.
+
+    The seat is claimed by Booking.save() with a capacity-guarded UPDATE on
+    the FitnessClass row, so concurrent workers can never push booked_count
+    past capacity and a full class is rejected without waiting on a lock.
+    A previously cancelled booking is reinstated in the same step.
+
+    Returns ``(booking, reinstated)``; raises a BookingError subclass when
+    the class cannot be booked.
+    """
+    check_bookable(fitness_class, allow_past=allow_past)
+
+    try:
+        with transaction.atomic():
+            booking = Booking.objects.select_for_update().filter(
+                user=user,
+                fitness_class=fitness_class
+            ).first()
+
+            if booking is None:
+                booking = Booking(user=user, fitness_class=fitness_class)
+                booking.save()
+                return booking, False
+
+            if not booking.cancelled:
+                raise AlreadyBookedError()
+
+            booking.fitness_class = fitness_class
+            booking.cancelled = False
+            booking.cancellation_reason = None
+            booking.save()
+            return booking, True
+    except IntegrityError:
+        # Another request from the same user inserted the row first
+        raise AlreadyBookedError()
+
+
+def join_waitlist(user, fitness_class):
+    """
+    Queue ``user`` for a seat in a full class.
+
+    Returns ``(entry, booking)``. If a seat opened up between the failed
+    booking attempt and joining, the head of the queue is promoted straight
+    away; ``booking`` is set when that promotion went to ``user``.
+    """
+    if Booking.objects.filter(user=user, fitness_class=fitness_class, cancelled=False).exists():
+        raise AlreadyBookedError()
+
+    entry, created = WaitlistEntry.objects.get_or_create(
+        user=user,
+        fitness_class=fitness_class
+    )
+    seat_free = FitnessClass.objects.filter(
+        pk=fitness_class.pk,
+        booked_count__lt=F('capacity')
+    ).exists()
+    if created and seat_free:
+        promoted = WaitlistEntry.promote_next(fitness_class)
+        if promoted is not None and promoted.user_id == user.pk:
+            return entry, promoted
+    return entry, None
+
+
+def book_or_waitlist(user, fitness_class):
+    """
+    Book a seat, or queue for one when the class is full.
+
+    Returns ``(booking, reinstated, entry)``; exactly one of ``booking`` and
+    ``entry`` is set.
+    """
+    try:
+        booking, reinstated = book_class(user, fitness_class)
+    except ClassFullError:
+        entry, booking = join_waitlist(user, fitness_class)
+        if booking is None:
+            return None, False, entry
+        return booking, False, None
+    return booking, reinstated, None
+
+
+def mark_attendance(fitness_class, present_ids, absent_ids=None):
+    """
+    Record attendance for live bookings in ``fitness_class`` with set-based UPDATEs.
+
+    With ``absent_ids`` left as None the call is a full register: every live
+    booking not in ``present_ids`` is marked absent. Otherwise only the listed
+    bookings change, which suits check-ins arriving one by one. Only rows
+    whose flag actually flips are written, in at most two statements, and no
+    per-row save() (or its side effects) runs.
+
+    Returns ``(marked_present, marked_absent)`` counts.
+    """
+    present_ids = set(present_ids)
+    absent_ids = None if absent_ids is None else set(absent_ids) - present_ids
+
+    with transaction.atomic():
+        rows = Booking.objects.select_for_update().filter(
+            fitness_class=fitness_class,
+            cancelled=False
+        ).order_by().values_list('pk', 'user_id', 'attended')
+
+        to_present, to_absent = [], []
+        for pk, user_id, attended in rows:
+            if pk in present_ids:
+                if not attended:
+                    to_present.append((pk, user_id))
+            elif absent_ids is None or pk in absent_ids:
+                if attended:
+                    to_absent.append((pk, user_id))
+
+        now = timezone.now()
+        attended_deltas = {}
+        for changed, attended in ((to_present, True), (to_absent, False)):
+            if not changed:
+                continue
+            Booking.objects.filter(pk__in=[pk for pk, _user_id in changed]).update(
+                attended=attended,
+                modified=now
+            )
+            for _pk, user_id in changed:
+                attended_deltas[user_id] = attended_deltas.get(user_id, 0) + (1 if attended else -1)
+
+        if attended_deltas:
+            # One signal for the batch, so receivers can batch their cache work
+            transaction.on_commit(lambda: attendance_changed.send(
+                sender=Booking,
+                attended_deltas=attended_deltas,
+                start_time=fitness_class.start_time
+            ))
+
+    return len(to_present), len(to_absent)
@@ -0,0 +1,72 @@
+"""
+Low-write sessions.
+
+With SESSION_SAVE_EVERY_REQUEST every request, JSON polls included, ends
+in a session UPDATE. CoalescingSessionMiddleware writes a session only when
+its data changed or when SESSION_REFRESH_FRACTION of SESSION_COOKIE_AGE has
+passed since the last write. The session engines in this package
+(booking.sessions.db, .cached_db and .signed_cookies) add that refresh
+interval to the stored lifetime, so a member is never signed out sooner
+than SESSION_COOKIE_AGE after their last request.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.utils import timezone
+
+# Unix time of the session's last write, kept in the session data
+REFRESHED_KEY = '_refreshed_at'
+
+
+def refresh_interval():
+    """Seconds a session may go without a write while it is in use"""
+    return int(settings.SESSION_COOKIE_AGE * settings.SESSION_REFRESH_FRACTION)
+
+
+class CoalescedExpiryMixin:
+    """Stores live for SESSION_COOKIE_AGE plus the refresh interval that can pass unsaved"""
+
+    def get_session_cookie_age(self):
+        return settings.SESSION_COOKIE_AGE + refresh_interval()
+
+
+class BatchedCleanupMixin:
+    """clear_expired() (and so `manage.py clearsessions`) deletes in short batches"""
+
+    @classmethod
+    def clear_expired(cls):
+        model = cls.get_model_class()
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(
+                model.objects.filter(expire_date__lt=now)
+                .order_by()
+                .values_list('session_key', flat=True)[:settings.SESSION_CLEANUP_BATCH_SIZE]
+            )
+            if not keys:
+                return deleted
+            deleted += model.objects.filter(session_key__in=keys).delete()[0]
+
+
+class CoalescingSessionMiddleware(SessionMiddleware):
+    """SessionMiddleware that refreshes an unchanged session's expiry only now and then"""
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is not None and not settings.SESSION_SAVE_EVERY_REQUEST:
+            self.stamp(session)
+        return super().process_response(request, response)
+
+    def stamp(self, session):
+        """Mark the session for saving when its data changed or its refresh is due"""
+        if not session.modified and session.session_key is None:
+            return
+        # Loads an untouched session; the write it replaces would have too
+        refreshed = session.get(REFRESHED_KEY)
+        if session.is_empty():
+            return
+        now = int(time.time())
+        if session.modified or refreshed is None or now - refreshed >= refresh_interval():
+            session[REFRESHED_KEY] = now
@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import cached_db
+
+from . import BatchedCleanupMixin, CoalescedExpiryMixin
+
+
+class SessionStore(BatchedCleanupMixin, CoalescedExpiryMixin, cached_db.SessionStore):
+    pass
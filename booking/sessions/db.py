@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import db
+
+from . import BatchedCleanupMixin, CoalescedExpiryMixin
+
+
+class SessionStore(BatchedCleanupMixin, CoalescedExpiryMixin, db.SessionStore):
+    pass
@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import signed_cookies
+
+from . import CoalescedExpiryMixin
+
+
+class SessionStore(CoalescedExpiryMixin, signed_cookies.SessionStore):
+    pass
@@ -1,13 +1,59 @@
-from django.db.models.signals import post_save
-from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from .models import Profile
+from .models import Booking, FitnessClass, attendance_changed, booking_changed, seat_count_changed
+from . import conditional, dbpool, leaderboard, live, readcache, search, stats
 
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
+@receiver(seat_count_changed)
+def update_popular_classes(sender, fitness_class_id, delta, booked_count, **kwargs):
+    leaderboard.record_seat_change(fitness_class_id, delta, booked_count)
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+@receiver(seat_count_changed)
+def retire_seat_read_models(sender, fitness_class_id, **kwargs):
+    readcache.bump(readcache.class_namespace(fitness_class_id))
+
+# Connected after retire_seat_read_models so the count it sends is fresh
+@receiver(seat_count_changed)
+def broadcast_seat_count(sender, fitness_class_id, **kwargs):
+    live.publish_seats(fitness_class_id)
+
+@receiver([post_save, post_delete], sender=FitnessClass)
+def invalidate_popular_classes(sender, **kwargs):
+    leaderboard.invalidate()
+
+@receiver([post_save, post_delete], sender=FitnessClass)
+def touch_class_schedule(sender, **kwargs):
+    conditional.touch_schedule()
+
+@receiver(post_delete, sender=FitnessClass)
+def remove_from_search_index(sender, instance, using, **kwargs):
+    search.unindex_classes([instance.pk], using)
+
+# Booking.delete() is skipped by queryset and cascade deletes; these are not
+@receiver(pre_delete, sender=Booking)
+def remember_deleted_booking(sender, instance, **kwargs):
+    instance.remember_deleted_state()
+
+@receiver(post_delete, sender=Booking)
+def release_deleted_booking(sender, instance, origin=None, **kwargs):
+    instance.release_after_delete(origin)
+
+@receiver(booking_changed)
+def update_member_stats(sender, user_id, total_delta, seat_delta, attended_delta, start_time, **kwargs):
+    stats.record_booking_change(user_id, total_delta, seat_delta, attended_delta, start_time)
+
+@receiver(booking_changed)
+def retire_member_read_models(sender, user_id, **kwargs):
+    readcache.bump(readcache.member_namespace(user_id))
+
+@receiver(attendance_changed)
+def update_member_attendance(sender, attended_deltas, **kwargs):
+    stats.record_attendance_changes(attended_deltas)
+
+@receiver(attendance_changed)
+def retire_attendance_read_models(sender, attended_deltas, **kwargs):
+    readcache.bump(*(readcache.member_namespace(user_id) for user_id in attended_deltas))
+
+@receiver(connection_created)
+def count_database_connection(sender, connection, **kwargs):
+    dbpool.record_connect(connection)
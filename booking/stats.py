@@ -0,0 +1,99 @@
+"""
+Per-member booking statistics.
+
+Counters are computed with one conditional-aggregate query and kept in the
+cache per user. Booking changes adjust the cached numbers in place through
+the booking_changed signal, and attendance registers through one
+attendance_changed per batch. The entry expires when the member's next
+booked class starts, because that is when "upcoming" stops being true for it.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import Booking
+
+COUNTERS = ('total_bookings', 'upcoming_bookings', 'attended_classes')
+
+
+def cache_key(user_id):
+    return f'booking:member_stats:{user_id}'
+
+
+def compute_member_stats(user_id, now=None):
+    """Count a member's bookings in a single aggregate query"""
+    now = now or timezone.now()
+    upcoming = Q(cancelled=False, fitness_class__start_time__gte=now)
+    return Booking.objects.filter(user_id=user_id).aggregate(
+        total_bookings=Count('id'),
+        upcoming_bookings=Count('id', filter=upcoming),
+        attended_classes=Count('id', filter=Q(attended=True)),
+        next_class_start=Min('fitness_class__start_time', filter=upcoming),
+    )
+
+
+def _timeout(stats, now):
+    timeout = settings.MEMBER_STATS_CACHE_TIMEOUT
+    if stats['next_class_start'] is not None:
+        until_next = (stats['next_class_start'] - now).total_seconds()
+        timeout = max(1, min(timeout, int(until_next)))
+    return timeout
+
+
+def _store(user_id, stats, now):
+    cache.set(cache_key(user_id), stats, _timeout(stats, now))
+
+
+def get_member_stats(user_id):
+    """Return the member's counters, recomputing only when the cache entry is gone or stale"""
+    now = timezone.now()
+    stats = cache.get(cache_key(user_id))
+    if stats is None or (stats['next_class_start'] is not None and stats['next_class_start'] <= now):
+        stats = compute_member_stats(user_id, now)
+        _store(user_id, stats, now)
+    return stats
+
+
+def record_booking_change(user_id, total_delta=0, seat_delta=0, attended_delta=0, start_time=None):
+    """Fold one booking change into the member's cached counters"""
+    stats = cache.get(cache_key(user_id))
+    if stats is None:
+        return
+    if seat_delta and start_time is None:
+        # Can't tell whether the class is upcoming; recompute on next read
+        invalidate(user_id)
+        return
+
+    now = timezone.now()
+    stats['total_bookings'] += total_delta
+    stats['attended_classes'] += attended_delta
+    if seat_delta and start_time >= now:
+        stats['upcoming_bookings'] += seat_delta
+        if seat_delta > 0:
+            if stats['next_class_start'] is None or start_time < stats['next_class_start']:
+                stats['next_class_start'] = start_time
+        elif start_time == stats['next_class_start']:
+            # The next class was dropped; the one after it is not known here
+            invalidate(user_id)
+            return
+    _store(user_id, stats, now)
+
+
+def record_attendance_changes(attended_deltas):
+    """
+    Fold a register's {user_id: attended delta} into the cached counters: one
+    read for every member, and one write per distinct expiry
+    """
+    keys = {cache_key(user_id): user_id for user_id in attended_deltas}
+    now = timezone.now()
+    by_timeout = {}
+    for key, stats in cache.get_many(keys).items():
+        stats['attended_classes'] += attended_deltas[keys[key]]
+        by_timeout.setdefault(_timeout(stats, now), {})[key] = stats
+    for timeout, entries in by_timeout.items():
+        cache.set_many(entries, timeout)
+
+
+def invalidate(user_id):
+    cache.delete(cache_key(user_id))
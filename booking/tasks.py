@@ -1,14 +1,15 @@
+from importlib import import_module
+
 from background_task import background
-from django.utils import timezone
-from .models import Booking
+from django.conf import settings
+from .reminders import send_due_reminders
 
 @background(schedule=60)
 def send_reminders():
     """Send reminders for upcoming classes."""
-    now = timezone.now()
-    upcoming = Booking.objects.filter(
-        fitness_class__start_time__range=(now, now + timedelta(hours=24)),
-        cancelled=False,
-        reminder_sent=False
-    )
-    # Implement reminder logic
\ No newline at end of file
+    send_due_reminders()
+
+@background(schedule=60)
+def clear_expired_sessions():
+    """Purge expired sessions in batches."""
+    import_module(settings.SESSION_ENGINE).SessionStore.clear_expired()
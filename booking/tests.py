@@ -1,12 +1,84 @@
+import asyncio
+import csv
+import io
+import json
 import os
-from datetime import timedelta
-from django.test import TestCase, Client
-from django.urls import reverse
+import queue
+import threading
+import time
+import zipfile
+from datetime import date, timedelta
+from unittest import mock, skipIf
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import URLPattern, reverse
 from django.utils import timezone
 from django.core import mail
 from django.contrib.auth.models import User
-from .models import FitnessClass, Booking
+from django.contrib.sessions.models import Session
+from django.core.management import call_command, CommandError
+from .exceptions import AlreadyBookedError, ClassFullError, ClassNotBookableError
+from .models import (
+    FitnessClass, Booking, WaitlistEntry, OutboxEmail, Profile,
+    attendance_changed, booking_changed, seat_count_changed,
+)
+from .outbox import dispatch_batch
+from .reminders import send_due_reminders
+from .search import search_classes
+from . import leaderboard
+from .pagination import paginate
+from .forms import FitnessClassForm
+from . import aio, availability, benchmarks, dbpool, ical, indexadvisor, live, middleware, readcache, search, seeding
+from . import recurrence, services, views
+from . import urls as booking_urls
+from . import stats
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from .services import book_class, book_or_waitlist, mark_attendance
+from .sessions import refresh_interval
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.exceptions import ValidationError
+
+# Stand-ins for the page templates this tree does not ship, so the views
+# that render them can be exercised. They walk the same context the pages do.
+PAGE_TEMPLATE_STUBS = {
+    'booking/my_bookings.html': (
+        '{% for booking in bookings %}{{ booking.fitness_class.name }}{{ booking.can_cancel }}{% endfor %}'
+        '{% for booking in past_bookings %}{{ booking.fitness_class.name }}{% endfor %}'
+        '{{ calendar_feed_url }}'
+    ),
+    'booking/cancel_booking.html': '{{ booking.fitness_class.name }} {{ cancellation_deadline }}',
+    'booking/profile.html': (
+        '{{ total_bookings }} {{ upcoming_bookings }} {{ attended_classes }}'
+        '{% for booking in recent_classes %}{{ booking.fitness_class.name }}{% endfor %}'
+    ),
+    'booking/update_profile.html': '{{ form }}',
+    'booking/manage_classes.html': (
+        '{% for class in upcoming_classes %}{{ class.name }}{{ class.spots_remaining }}{% endfor %}'
+        '{% for class in past_classes %}{{ class.name }}{{ class.attendance_percentage }}{% endfor %}'
+        '{{ calendar_feed_url }}'
+    ),
+    'booking/add_class.html': '{{ form }}',
+    'booking/edit_class.html': '{{ form }} {{ fitness_class.name }} {{ has_bookings }}',
+    'booking/class_attendance.html': (
+        '{{ fitness_class.name }}'
+        '{% for booking in bookings %}{{ booking.user.username }}{{ booking.attended }}{% endfor %}'
+    ),
+    'booking/account_inactive.html': 'Account inactive',
+}
+STUB_TEMPLATES = [dict(
+    settings.TEMPLATES[0],
+    APP_DIRS=False,
+    OPTIONS=dict(settings.TEMPLATES[0]['OPTIONS'], loaders=[
+        ('django.template.loaders.locmem.Loader', PAGE_TEMPLATE_STUBS),
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+)]
 
 class FitnessClassModelTest(TestCase):
     @classmethod
@@ -118,12 +190,15 @@ class BookingModelTest(TestCase):
         self.assertFalse(self.booking.cancelled)
         
     def test_confirmation_email_sent(self):
-        # Test that email was sent on creation
+        # Creation queues the email; the outbox dispatcher delivers it
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('send_queued_emails', stdout=open(os.devnull, 'w'))
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].subject, 'Booking Confirmation: Evening HIIT')
         
     def test_cancellation_email(self):
         self.booking.cancel(reason="Change of plans")
+        call_command('send_queued_emails', stdout=open(os.devnull, 'w'))
         self.assertEqual(len(mail.outbox), 2)  # Confirmation + cancellation
         self.assertEqual(mail.outbox[1].subject, 'Booking Cancelled: Evening HIIT')
         self.assertTrue(self.booking.cancelled)
@@ -279,4 +354,2111 @@ class BusinessLogicTests(TestCase):
         self.assertEqual(response.status_code, 302)  # Redirect after cancellation
         booking.refresh_from_db()
         self.assertTrue(booking.cancelled)
-        self.assertEqual(booking.cancellation_reason, 'Change of plans')
\ No newline at end of file
+        self.assertEqual(booking.cancellation_reason, 'Change of plans')
+
+class BookedCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'member{i}', password='testpass123')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.fitness_class = FitnessClass.objects.create(
+            name='Counter Class',
+            description='Seat counter checks',
+            instructor='Count Instructor',
+            class_type='strength',
+            start_time=timezone.now() + timedelta(days=3),
+            end_time=timezone.now() + timedelta(days=3, hours=1),
+            capacity=3
+        )
+
+    def _stored_count(self):
+        return FitnessClass.objects.values_list('booked_count', flat=True).get(
+            pk=self.fitness_class.pk
+        )
+
+    def test_create_cancel_reinstate_keep_counter_in_sync(self):
+        bookings = [
+            Booking.objects.create(user=user, fitness_class=self.fitness_class)
+            for user in self.users[:2]
+        ]
+        self.assertEqual(self._stored_count(), 2)
+
+        bookings[0].cancel(reason='Injured')
+        self.assertEqual(self._stored_count(), 1)
+
+        # Cancelling twice must not release the seat twice
+        bookings[0].cancel(reason='Still injured')
+        self.assertEqual(self._stored_count(), 1)
+
+        reinstated = Booking.objects.get(pk=bookings[0].pk)
+        reinstated.cancelled = False
+        reinstated.save()
+        self.assertEqual(self._stored_count(), 2)
+
+        bookings[1].delete()
+        self.assertEqual(self._stored_count(), 1)
+
+    def test_every_kind_of_delete_releases_seats(self):
+        bookings = [
+            Booking.objects.create(user=user, fitness_class=self.fitness_class)
+            for user in self.users
+        ]
+        self.assertEqual(self._stored_count(), 3)
+
+        # The stored flag counts, not an unsaved edit
+        bookings[0].cancelled = True
+        bookings[0].delete()
+        self.assertEqual(self._stored_count(), 2)
+
+        # Queryset deletes (admin bulk delete) skip Booking.delete()
+        Booking.objects.filter(pk=bookings[1].pk).delete()
+        self.assertEqual(self._stored_count(), 1)
+
+        # So do cascades
+        self.users[2].delete()
+        self.assertEqual(self._stored_count(), 0)
+
+    def test_deleting_the_class_skips_its_counter(self):
+        for user in self.users:
+            Booking.objects.create(user=user, fitness_class=self.fitness_class)
+        with CaptureQueriesContext(connection) as queries:
+            self.fitness_class.delete()
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('UPDATE "booking_fitnessclass"')])
+
+    def test_spots_remaining_reads_column(self):
+        Booking.objects.create(user=self.users[0], fitness_class=self.fitness_class)
+        fitness_class = FitnessClass.objects.get(pk=self.fitness_class.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(fitness_class.spots_remaining, 2)
+            self.assertFalse(fitness_class.is_full())
+
+    def test_reconcile_command_fixes_drift(self):
+        Booking.objects.create(user=self.users[0], fitness_class=self.fitness_class)
+        Booking.objects.create(
+            user=self.users[1], fitness_class=self.fitness_class
+        ).cancel()
+        FitnessClass.objects.filter(pk=self.fitness_class.pk).update(booked_count=7)
+
+        call_command('reconcile_booked_counts', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self._stored_count(), 1)
+
+
+class BookingServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'rider{i}', password='testpass123')
+            for i in range(3)
+        ]
+        cls.fitness_class = FitnessClass.objects.create(
+            name='Sprint Ride',
+            description='Popular early class',
+            instructor='Ride Instructor',
+            class_type='cycling',
+            start_time=timezone.now() + timedelta(days=1),
+            end_time=timezone.now() + timedelta(days=1, hours=1),
+            capacity=2
+        )
+
+    def test_book_until_full(self):
+        for user in self.users[:2]:
+            booking, reinstated = book_class(user, self.fitness_class)
+            self.assertFalse(reinstated)
+
+        with self.assertRaises(ClassFullError):
+            book_class(self.users[2], self.fitness_class)
+        self.assertEqual(Booking.objects.filter(fitness_class=self.fitness_class).count(), 2)
+
+    def test_guarded_update_rejects_stale_instance(self):
+        Booking.objects.create(user=self.users[0], fitness_class=self.fitness_class)
+        Booking.objects.create(user=self.users[1], fitness_class=self.fitness_class)
+        # A worker holding a stale copy of the class still cannot overbook
+        stale = FitnessClass.objects.get(pk=self.fitness_class.pk)
+        stale.booked_count = 0
+        with self.assertRaises(ClassFullError):
+            Booking.objects.create(user=self.users[2], fitness_class=stale)
+        self.assertEqual(
+            FitnessClass.objects.get(pk=self.fitness_class.pk).booked_count, 2
+        )
+
+    def test_duplicate_and_reinstate(self):
+        booking, _ = book_class(self.users[0], self.fitness_class)
+        with self.assertRaises(AlreadyBookedError):
+            book_class(self.users[0], self.fitness_class)
+
+        booking.cancel(reason='Busy')
+        reinstated_booking, reinstated = book_class(self.users[0], self.fitness_class)
+        self.assertTrue(reinstated)
+        self.assertEqual(reinstated_booking.pk, booking.pk)
+        self.assertFalse(reinstated_booking.cancelled)
+        self.assertEqual(
+            FitnessClass.objects.get(pk=self.fitness_class.pk).booked_count, 1
+        )
+
+    def test_past_class_is_rejected(self):
+        past_class = FitnessClass.objects.create(
+            name='Yesterday Ride',
+            description='Already happened',
+            instructor='Ride Instructor',
+            class_type='cycling',
+            start_time=timezone.now() - timedelta(days=1),
+            end_time=timezone.now() - timedelta(hours=23),
+            capacity=5
+        )
+        with self.assertRaises(ClassNotBookableError):
+            book_class(self.users[0], past_class)
+
+    def test_admin_reports_a_seat_lost_to_a_concurrent_booking(self):
+        for user in self.users[:2]:
+            book_class(user, self.fitness_class)
+        admin_user = User.objects.create_superuser(username='desk', password='testpass123')
+        self.client.force_login(admin_user)
+        url = reverse('admin:booking_booking_add')
+        # The form saw a free seat, but it was gone by the time of the save
+        with mock.patch.object(services, 'check_bookable'):
+            response = self.client.post(url, {
+                'user': self.users[2].pk,
+                'fitness_class': self.fitness_class.pk,
+            }, follow=True)
+        self.assertRedirects(response, url)
+        self.assertContains(response, 'This class is full.')
+        self.assertFalse(Booking.objects.filter(user=self.users[2]).exists())
+        self.assertEqual(FitnessClass.objects.get(pk=self.fitness_class.pk).booked_count, 2)
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite serialises writers, so bookings cannot race')
+class ConcurrentBookingTest(TransactionTestCase):
+    """Many requests for the last seats of one class, each on its own connection"""
+    WORKERS = 8
+    CAPACITY = 3
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'racer{i}', password='testpass123')
+            for i in range(self.WORKERS)
+        ]
+        self.fitness_class = FitnessClass.objects.create(
+            name='Last Seats',
+            description='Everyone wants in',
+            instructor='Race Instructor',
+            class_type='cycling',
+            start_time=timezone.now() + timedelta(days=1),
+            end_time=timezone.now() + timedelta(days=1, hours=1),
+            capacity=self.CAPACITY
+        )
+
+    def test_no_overbooking_under_concurrent_requests(self):
+        barrier = threading.Barrier(self.WORKERS)
+        outcomes, errors = [], []
+
+        def request(user):
+            try:
+                fitness_class = FitnessClass.objects.get(pk=self.fitness_class.pk)
+                barrier.wait(timeout=10)
+                book_class(user, fitness_class)
+                outcomes.append('booked')
+            except ClassFullError:
+                outcomes.append('full')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=request, args=[user]) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(outcomes.count('booked'), self.CAPACITY)
+        self.assertEqual(outcomes.count('full'), self.WORKERS - self.CAPACITY)
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.booked_count, self.CAPACITY)
+        self.assertEqual(
+            Booking.objects.filter(fitness_class=self.fitness_class, cancelled=False).count(),
+            self.CAPACITY
+        )
+
+
+class WaitlistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'yogi{i}', password='testpass123')
+            for i in range(4)
+        ]
+        cls.fitness_class = FitnessClass.objects.create(
+            name='Sunrise Flow',
+            description='Small studio class',
+            instructor='Flow Instructor',
+            class_type='yoga',
+            start_time=timezone.now() + timedelta(days=3),
+            end_time=timezone.now() + timedelta(days=3, hours=1),
+            capacity=1
+        )
+
+    def test_full_class_queues_in_fifo_order(self):
+        book_class(self.users[0], self.fitness_class)
+        _, _, first = book_or_waitlist(self.users[1], self.fitness_class)
+        _, _, second = book_or_waitlist(self.users[2], self.fitness_class)
+
+        self.assertEqual(first.position, 1)
+        self.assertEqual(second.position, 2)
+
+    def test_cancellation_promotes_next_in_line(self):
+        booking, _ = book_class(self.users[0], self.fitness_class)
+        book_or_waitlist(self.users[1], self.fitness_class)
+        book_or_waitlist(self.users[2], self.fitness_class)
+
+        booking.cancel(reason='Sick')
+
+        promoted = Booking.objects.get(user=self.users[1], fitness_class=self.fitness_class)
+        self.assertFalse(promoted.cancelled)
+        self.assertFalse(
+            WaitlistEntry.objects.filter(user=self.users[1]).exists()
+        )
+        remaining = WaitlistEntry.objects.get(user=self.users[2])
+        self.assertEqual(remaining.position, 1)
+        self.assertEqual(
+            FitnessClass.objects.get(pk=self.fitness_class.pk).booked_count, 1
+        )
+
+    def test_promotion_reinstates_cancelled_booking(self):
+        first, _ = book_class(self.users[0], self.fitness_class)
+        first.cancel()
+        second, _ = book_class(self.users[1], self.fitness_class)
+        # users[0] changes their mind but the seat is gone
+        _, _, entry = book_or_waitlist(self.users[0], self.fitness_class)
+        self.assertIsNotNone(entry)
+
+        second.cancel()
+        first.refresh_from_db()
+        self.assertFalse(first.cancelled)
+        self.assertFalse(WaitlistEntry.objects.exists())
+        # The promoted member hears about the seat like a new booking would
+        self.assertEqual(
+            list(first.outbox_emails.order_by('pk').values_list('template', flat=True)),
+            [OutboxEmail.CONFIRMATION, OutboxEmail.CANCELLATION, OutboxEmail.CONFIRMATION]
+        )
+
+
+
+class OutboxDispatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='mailee',
+            password='testpass123',
+            email='mailee@example.com'
+        )
+        cls.fitness_class = FitnessClass.objects.create(
+            name='Lunch Pilates',
+            description='Core work',
+            instructor='Core Instructor',
+            class_type='pilates',
+            start_time=timezone.now() + timedelta(days=2),
+            end_time=timezone.now() + timedelta(days=2, hours=1),
+            capacity=10
+        )
+
+    def test_booking_queues_email_in_same_transaction(self):
+        booking = Booking.objects.create(user=self.user, fitness_class=self.fitness_class)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get(booking=booking)
+        self.assertEqual(queued.template, OutboxEmail.CONFIRMATION)
+        self.assertEqual(queued.status, OutboxEmail.PENDING)
+
+    def test_batch_is_sent_and_marked(self):
+        booking = Booking.objects.create(user=self.user, fitness_class=self.fitness_class)
+        booking.cancel(reason='Travel')
+
+        self.assertEqual(dispatch_batch(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, ['mailee@example.com'])
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.SENT).exists())
+        # Nothing left to send
+        self.assertEqual(dispatch_batch(), (0, 0))
+
+    def test_failures_back_off_then_dead_letter(self):
+        booking = Booking.objects.create(user=self.user, fitness_class=self.fitness_class)
+        with mock.patch.object(OutboxEmail, 'build_message', side_effect=OSError('SMTP down')):
+            self.assertEqual(dispatch_batch(max_attempts=2), (0, 1))
+            queued = OutboxEmail.objects.get(booking=booking)
+            self.assertEqual(queued.status, OutboxEmail.PENDING)
+            self.assertGreater(queued.next_attempt_at, timezone.now())
+            # Not due yet, so the next batch skips it
+            self.assertEqual(dispatch_batch(max_attempts=2), (0, 0))
+
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(dispatch_batch(max_attempts=2), (0, 1))
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboxEmail.FAILED)
+        self.assertEqual(queued.attempts, 2)
+        self.assertIn('SMTP down', queued.last_error)
+
+    def test_cancellation_of_a_reinstated_booking_is_not_sent(self):
+        booking = Booking.objects.create(user=self.user, fitness_class=self.fitness_class)
+        booking.cancel()
+        # Reinstated before the dispatcher ran
+        booking.cancelled = False
+        booking.save()
+
+        # The second batch skips straight past the superseded cancellation
+        self.assertEqual(dispatch_batch(batch_size=1), (1, 0))
+        self.assertEqual(dispatch_batch(batch_size=1), (1, 0))
+        self.assertEqual(dispatch_batch(batch_size=1), (0, 0))
+        self.assertEqual(
+            [message.subject for message in mail.outbox],
+            ['Booking Confirmation: Lunch Pilates'] * 2
+        )
+        cancellation = OutboxEmail.objects.get(template=OutboxEmail.CANCELLATION)
+        self.assertEqual((cancellation.status, cancellation.attempts), (OutboxEmail.SUPERSEDED, 0))
+
+
+
+class ReminderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'early{i}',
+                password='testpass123',
+                email=f'early{i}@example.com'
+            )
+            for i in range(5)
+        ]
+        cls.tomorrow = FitnessClass.objects.create(
+            name='Tomorrow HIIT',
+            description='Starts within a day',
+            instructor='Reminder Instructor',
+            class_type='hiit',
+            start_time=timezone.now() + timedelta(hours=12),
+            end_time=timezone.now() + timedelta(hours=13),
+            capacity=10
+        )
+        cls.next_week = FitnessClass.objects.create(
+            name='Next Week HIIT',
+            description='Too far out for a reminder',
+            instructor='Reminder Instructor',
+            class_type='hiit',
+            start_time=timezone.now() + timedelta(days=7),
+            end_time=timezone.now() + timedelta(days=7, hours=1),
+            capacity=10
+        )
+        for user in cls.users:
+            Booking.objects.create(user=user, fitness_class=cls.tomorrow)
+        Booking.objects.create(user=cls.users[0], fitness_class=cls.next_week)
+        Booking.objects.filter(user=cls.users[4]).first().cancel()
+
+    def test_reminders_are_chunked_and_flagged(self):
+        # Two full chunks and a final empty probe: one SELECT and one UPDATE per chunk
+        with self.assertNumQueries(5):
+            sent, failed = send_due_reminders(chunk_size=2)
+        self.assertEqual((sent, failed), (4, 0))
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(
+            Booking.objects.filter(reminder_sent=True).count(), 4
+        )
+
+    def test_rerun_is_idempotent(self):
+        send_due_reminders(chunk_size=3)
+        mail.outbox.clear()
+        self.assertEqual(send_due_reminders(chunk_size=3), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + timedelta(days=1)
+
+        def make(name, instructor, description, class_type='yoga'):
+            return FitnessClass.objects.create(
+                name=name,
+                description=description,
+                instructor=instructor,
+                class_type=class_type,
+                start_time=start,
+                end_time=start + timedelta(hours=1),
+                capacity=10
+            )
+
+        cls.vinyasa = make('Vinyasa Flow', 'Ana Lopez', 'Dynamic breath-led sequence')
+        cls.spin = make('Power Spin', 'Ben Flowers', 'Climbs and sprints', 'cycling')
+        cls.core = make('Core Blast', 'Cara Diaz', 'Finishes with a slow flow cooldown', 'strength')
+
+    def test_matches_are_ranked_by_field_weight(self):
+        results = list(search_classes(FitnessClass.objects.all(), 'flow'))
+        # Name beats instructor beats description
+        self.assertEqual(results, [self.vinyasa, self.spin, self.core])
+
+    def test_prefix_and_multi_word_queries(self):
+        self.assertEqual(
+            list(search_classes(FitnessClass.objects.all(), 'vin')),
+            [self.vinyasa]
+        )
+        self.assertEqual(
+            list(search_classes(FitnessClass.objects.all(), 'power climbs')),
+            [self.spin]
+        )
+        self.assertEqual(
+            list(search_classes(FitnessClass.objects.all(), '"; DROP TABLE')),
+            []
+        )
+
+    def test_index_follows_saves_and_rebuilds(self):
+        self.core.name = 'Core Ignite'
+        self.core.save()
+        qs = FitnessClass.objects.all()
+        self.assertEqual(list(search_classes(qs, 'ignite')), [self.core])
+        self.assertEqual(list(search_classes(qs, 'blast')), [])
+
+        FitnessClass.objects.filter(pk=self.spin.pk).update(name='Hill Climb')
+        self.assertEqual(list(search_classes(qs, 'hill')), [])
+        call_command('rebuild_search_index', stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(search_classes(qs, 'hill')), [self.spin])
+
+    def test_deleted_classes_leave_the_index(self):
+        spin_pk, core_pk = self.spin.pk, self.core.pk
+        self.spin.delete()
+        FitnessClass.objects.filter(pk=core_pk).delete()
+        self.assertEqual(
+            list(search_classes(FitnessClass.objects.all(), 'flow')),
+            [self.vinyasa]
+        )
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT rowid FROM {search.FTS_TABLE} WHERE rowid IN (%s, %s)',
+                    [spin_pk, core_pk]
+                )
+                self.assertEqual(cursor.fetchall(), [])
+
+
+class PopularClassesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'fan{i}', password='testpass123')
+            for i in range(4)
+        ]
+        start = timezone.now() + timedelta(days=1)
+        cls.classes = [
+            FitnessClass.objects.create(
+                name=f'Class {i}',
+                description='Leaderboard check',
+                instructor='Board Instructor',
+                class_type='dance',
+                start_time=start + timedelta(hours=i),
+                end_time=start + timedelta(hours=i, minutes=45),
+                capacity=10
+            )
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def _book(self, user, fitness_class):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(user=user, fitness_class=fitness_class)
+
+    def test_board_is_served_from_cache(self):
+        leaderboard.get_popular_classes()
+        with self.assertNumQueries(0):
+            leaderboard.get_popular_classes()
+
+    def test_bookings_reorder_cached_board_without_queries(self):
+        for user in self.users[:2]:
+            self._book(user, self.classes[3])
+        self._book(self.users[2], self.classes[1])
+        self.assertEqual(
+            leaderboard.get_popular_classes(),
+            [self.classes[3], self.classes[1], self.classes[0]]
+        )
+
+        # Two more bookings move Class 1 to the top, all inside the cache
+        self._book(self.users[0], self.classes[1])
+        self._book(self.users[1], self.classes[1])
+        with self.assertNumQueries(0):
+            top = leaderboard.get_popular_classes()
+        self.assertEqual(top[0], self.classes[1])
+        self.assertEqual(top[0].booked_count, 3)
+
+    def test_cancellations_are_not_counted(self):
+        booking = self._book(self.users[0], self.classes[2])
+        self.assertEqual(leaderboard.get_popular_classes()[0], self.classes[2])
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.cancel()
+        self.assertEqual(leaderboard.get_popular_classes()[0], self.classes[0])
+
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + timedelta(days=1)
+        # Pairs of classes share a start time so the id tie-breaker matters
+        cls.classes = [
+            FitnessClass.objects.create(
+                name=f'Paged {i}',
+                description='Keyset check',
+                instructor='Page Instructor',
+                class_type='yoga',
+                start_time=start + timedelta(hours=i // 2),
+                end_time=start + timedelta(hours=i // 2, minutes=50),
+                capacity=5
+            )
+            for i in range(7)
+        ]
+
+    def test_walks_forward_and_back_without_count_or_offset(self):
+        qs = FitnessClass.objects.all()
+        ordering = ('start_time', 'id')
+
+        with self.assertNumQueries(1):
+            first = paginate(qs, ordering, per_page=3)
+        self.assertEqual(first.items, self.classes[:3])
+        self.assertFalse(first.has_previous)
+
+        with self.assertNumQueries(1) as ctx:
+            second = paginate(qs, ordering, first.next_cursor, per_page=3)
+        sql = ctx.captured_queries[0]['sql'].upper()
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+        self.assertEqual(second.items, self.classes[3:6])
+
+        last = paginate(qs, ordering, second.next_cursor, per_page=3)
+        self.assertEqual(last.items, self.classes[6:])
+        self.assertFalse(last.has_next)
+
+        back = paginate(qs, ordering, last.prev_cursor, per_page=3)
+        self.assertEqual(back.items, second.items)
+        self.assertTrue(back.has_next)
+        self.assertEqual(paginate(qs, ordering, back.prev_cursor, per_page=3).items, first.items)
+
+    def test_descending_and_related_ordering(self):
+        qs = FitnessClass.objects.all()
+        page = paginate(qs, ('-start_time', '-id'), per_page=4)
+        self.assertEqual(page.items, self.classes[::-1][:4])
+        page = paginate(qs, ('-start_time', '-id'), page.next_cursor, per_page=4)
+        self.assertEqual(page.items, self.classes[::-1][4:])
+
+        user = User.objects.create_user(username='pager', password='testpass123')
+        for fitness_class in self.classes:
+            Booking.objects.create(user=user, fitness_class=fitness_class)
+        bookings = Booking.objects.select_related('fitness_class')
+        page = paginate(bookings, ('fitness_class__start_time', 'id'), per_page=5)
+        page = paginate(bookings, ('fitness_class__start_time', 'id'), page.next_cursor, per_page=5)
+        self.assertEqual([b.fitness_class for b in page], self.classes[5:])
+
+    def test_garbage_cursor_falls_back_to_first_page(self):
+        page = paginate(FitnessClass.objects.all(), ('start_time', 'id'), 'not-a-cursor', per_page=2)
+        self.assertEqual(page.items, self.classes[:2])
+
+
+
+class MemberStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='regular', password='testpass123')
+        cls.classes = [
+            FitnessClass.objects.create(
+                name=f'Stats {i}',
+                description='Stats check',
+                instructor='Stats Instructor',
+                class_type='strength',
+                start_time=timezone.now() + timedelta(days=i),
+                end_time=timezone.now() + timedelta(days=i, hours=1),
+                capacity=5
+            )
+            for i in (-2, -1, 2, 3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def _save(self, booking):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+        return booking
+
+    def test_counters_come_from_one_query_then_cache(self):
+        past, _, upcoming, _ = self.classes
+        self._save(Booking(user=self.user, fitness_class=past, attended=True))
+        self._save(Booking(user=self.user, fitness_class=upcoming))
+
+        with self.assertNumQueries(1):
+            result = stats.get_member_stats(self.user.pk)
+        self.assertEqual(
+            [result[name] for name in stats.COUNTERS], [2, 1, 1]
+        )
+        with self.assertNumQueries(0):
+            stats.get_member_stats(self.user.pk)
+
+    def test_changes_update_cached_counters_incrementally(self):
+        past, older, upcoming, later = self.classes
+        stats.get_member_stats(self.user.pk)
+
+        attended = self._save(Booking(user=self.user, fitness_class=past))
+        self._save(Booking(user=self.user, fitness_class=upcoming))
+        booking = self._save(Booking(user=self.user, fitness_class=later))
+        attended.attended = True
+        self._save(attended)
+        booking.cancelled = True
+        self._save(booking)
+
+        with self.assertNumQueries(0):
+            cached = stats.get_member_stats(self.user.pk)
+        self.assertEqual(
+            [cached[name] for name in stats.COUNTERS],
+            [stats.compute_member_stats(self.user.pk)[name] for name in stats.COUNTERS]
+        )
+        self.assertEqual(cached['upcoming_bookings'], 1)
+        self.assertEqual(cached['attended_classes'], 1)
+
+
+class BulkAttendanceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='desk', password='testpass123', is_staff=True)
+        cls.fitness_class = FitnessClass.objects.create(
+            name='Register Class',
+            description='Attendance check',
+            instructor='Register Instructor',
+            class_type='cardio',
+            start_time=timezone.now() - timedelta(hours=2),
+            end_time=timezone.now() - timedelta(hours=1),
+            capacity=10
+        )
+        cls.users = [
+            User.objects.create_user(username=f'member{i}', password='testpass123')
+            for i in range(4)
+        ]
+        cls.bookings = [
+            Booking.objects.create(user=user, fitness_class=cls.fitness_class, attended=(i == 3))
+            for i, user in enumerate(cls.users)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def attended_flags(self):
+        return list(
+            Booking.objects.filter(fitness_class=self.fitness_class)
+            .order_by('pk')
+            .values_list('attended', flat=True)
+        )
+
+    def test_full_register_uses_set_based_updates(self):
+        present = [self.bookings[0].pk, self.bookings[1].pk]
+        # Savepoint pair, one locking SELECT and one UPDATE per direction,
+        # however big the class.
+        with self.assertNumQueries(5):
+            result = mark_attendance(self.fitness_class, present)
+        self.assertEqual(result, (2, 1))
+        self.assertEqual(self.attended_flags(), [True, True, False, False])
+
+        with self.assertNumQueries(3):
+            self.assertEqual(mark_attendance(self.fitness_class, present), (0, 0))
+
+    def test_partial_check_in_leaves_unlisted_bookings_alone(self):
+        result = mark_attendance(self.fitness_class, [self.bookings[0].pk], absent_ids=[])
+        self.assertEqual(result, (1, 0))
+        self.assertEqual(self.attended_flags(), [True, False, False, True])
+
+    def test_member_stats_follow_bulk_changes(self):
+        member, absentee = self.users[0], self.users[3]
+        self.assertEqual(stats.get_member_stats(member.pk)['attended_classes'], 0)
+        self.assertEqual(stats.get_member_stats(absentee.pk)['attended_classes'], 1)
+        sent = []
+
+        def record_attendance(sender, attended_deltas, **kwargs):
+            sent.append(attended_deltas)
+
+        attendance_changed.connect(record_attendance)
+        self.addCleanup(attendance_changed.disconnect, record_attendance)
+        with mock.patch.object(booking_changed, 'send') as per_booking, \
+                self.captureOnCommitCallbacks(execute=True):
+            mark_attendance(self.fitness_class, [self.bookings[0].pk])
+        # One signal for the whole register
+        per_booking.assert_not_called()
+        self.assertEqual(sent, [{member.pk: 1, absentee.pk: -1}])
+        self.assertEqual(stats.get_member_stats(member.pk)['attended_classes'], 1)
+        self.assertEqual(stats.get_member_stats(absentee.pk)['attended_classes'], 0)
+
+    def test_json_endpoint(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(
+            reverse('booking:bulk_attendance_api', args=[self.fitness_class.pk]),
+            data={'present': [self.bookings[1].pk], 'absent': [self.bookings[3].pk]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['marked_present'], 1)
+        self.assertEqual(self.attended_flags(), [False, True, False, False])
+
+        response = self.client.post(
+            reverse('booking:bulk_attendance_api', args=[self.fitness_class.pk]),
+            data='{"present": "x"}',
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='exporter', password='testpass123', is_staff=True)
+        cls.member = User.objects.create_user(
+            username='member', password='testpass123',
+            first_name='=Eve', last_name='Smith', email='eve@example.com'
+        )
+        cls.other = User.objects.create_user(username='other', password='testpass123')
+        start = timezone.now() - timedelta(days=3)
+        cls.recent = FitnessClass.objects.create(
+            name='Morning Spin',
+            description='Export check',
+            instructor='Export Instructor',
+            class_type='cycling',
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            capacity=10
+        )
+        cls.old = FitnessClass.objects.create(
+            name='Old Spin',
+            description='Export check',
+            instructor='Export Instructor',
+            class_type='cycling',
+            start_time=start - timedelta(days=60),
+            end_time=start - timedelta(days=60) + timedelta(hours=1),
+            capacity=10
+        )
+        Booking.objects.create(user=cls.member, fitness_class=cls.recent, attended=True)
+        Booking.objects.create(user=cls.other, fitness_class=cls.recent, cancelled=True)
+        Booking.objects.create(user=cls.other, fitness_class=cls.old)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def read_csv(self, response):
+        self.assertTrue(response.streaming)
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_attendance_csv(self):
+        response = self.client.get(reverse('booking:export_attendance', args=[self.recent.pk]))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="attendance-morning-spin-', response['Content-Disposition'])
+        rows = self.read_csv(response)
+        self.assertEqual(rows[0][0], 'Participant')
+        # Cancelled bookings are left out; formula-like names are neutralised
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][:3], ["'=Eve Smith", 'member', 'eve@example.com'])
+        self.assertEqual(rows[1][-1], 'Yes')
+
+    def test_attendance_xlsx_is_a_workbook(self):
+        response = self.client.get(
+            reverse('booking:export_attendance', args=[self.recent.pk]), {'format': 'xlsx'}
+        )
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 2)
+        self.assertIn('=Eve Smith', sheet)
+        self.assertIn('name="Attendance"', archive.read('xl/workbook.xml').decode())
+
+    def test_roster_is_date_ranged(self):
+        response = self.client.get(reverse('booking:export_roster'))
+        rows = self.read_csv(response)
+        self.assertEqual([row[0] for row in rows[1:]], ['Morning Spin'])
+
+        start = timezone.localdate() - timedelta(days=90)
+        response = self.client.get(reverse('booking:export_roster'), {'start': start.isoformat()})
+        rows = self.read_csv(response)
+        self.assertEqual([row[0] for row in rows[1:]], ['Old Spin', 'Morning Spin'])
+
+        response = self.client.get(reverse('booking:export_roster'), {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_exports_are_staff_only(self):
+        self.client.force_login(self.member)
+        response = self.client.get(reverse('booking:export_roster'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_asgi_streams_chunk_by_chunk(self):
+        await sync_to_async(self.async_client.force_login)(self.staff)
+        response = await self.async_client.get(reverse('booking:export_attendance', args=[self.recent.pk]))
+        # An async body is sent as it is read instead of collected up front
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[1][:2], ["'=Eve Smith", 'member'])
+
+
+class RecurringSeriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='regular', password='testpass123')
+
+    def setUp(self):
+        cache.clear()
+
+    def form_data(self, **overrides):
+        data = {
+            'name': 'Sunrise Flow',
+            'description': 'Weekly vinyasa',
+            'instructor': 'Series Instructor',
+            'class_type': 'yoga',
+            'start_time': '2026-10-20T07:00',
+            'end_time': '2026-10-20T08:00',
+            'capacity': 12,
+            'price': '0.00',
+            'location': 'Studio A',
+            'is_active': 'on',
+        }
+        data.update(overrides)
+        return data
+
+    def create(self, **overrides):
+        form = FitnessClassForm(data=self.form_data(**overrides))
+        self.assertTrue(form.is_valid(), form.errors)
+        with CaptureQueriesContext(connection) as queries:
+            series = recurrence.create_series(
+                form.save(commit=False),
+                form.recurrence_rule,
+                form.occurrences,
+                form.cleaned_data['repeat_exceptions']
+            )
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "booking_fitnessclass"')]
+        self.assertEqual(len(inserts), 1)
+        return list(series.occurrences.order_by('start_time'))
+
+    def test_weekly_series_keeps_local_time_and_skips_exceptions(self):
+        with self.settings(TIME_ZONE='Europe/London'):
+            classes = self.create(
+                repeat='weekly', repeat_days=['TU', 'TH'], repeat_count=5,
+                repeat_exceptions='2026-10-22'
+            )
+            self.assertEqual(
+                [timezone.localtime(c.start_time).strftime('%a %d %H:%M') for c in classes],
+                ['Tue 20 07:00', 'Tue 27 07:00', 'Thu 29 07:00', 'Tue 03 07:00']
+            )
+        # The clocks went back on the 25th, so the UTC start moves
+        self.assertEqual(classes[0].start_time.hour, 6)
+        self.assertEqual(classes[1].start_time.hour, 7)
+        self.assertTrue(all(c.duration == 60 for c in classes))
+        self.assertEqual(classes[0].series.exceptions, ['2026-10-22'])
+        # bulk_create skips save(), but the occurrences are still searchable
+        self.assertEqual(search_classes(FitnessClass.objects.all(), 'sunrise').count(), 4)
+
+    def test_invalid_series_are_rejected_before_writing(self):
+        cases = [
+            {'repeat': 'weekly'},
+            {'repeat': 'custom', 'repeat_rule': 'FREQ=SOMETIMES'},
+            {'repeat': 'custom', 'repeat_rule': 'FREQ=DAILY'},
+            {'repeat': 'weekly', 'repeat_count': 2, 'repeat_exceptions': 'next week'},
+        ]
+        for overrides in cases:
+            form = FitnessClassForm(data=self.form_data(**overrides))
+            self.assertFalse(form.is_valid(), overrides)
+        self.assertFalse(FitnessClass.objects.exists())
+
+    def test_edit_this_and_following(self):
+        classes = self.create(repeat='custom', repeat_rule='FREQ=DAILY;COUNT=4')
+        second = FitnessClass.objects.get(pk=classes[1].pk)
+        original_start = second.start_time
+        second.name = 'Sunset Flow'
+        second.start_time += timedelta(hours=10)
+        second.end_time += timedelta(hours=10, minutes=30)
+
+        with CaptureQueriesContext(connection) as queries:
+            updated = recurrence.update_following(second, ['name', 'start_time', 'end_time'], original_start)
+        self.assertEqual(updated, 3)
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "booking_fitnessclass"')]
+        self.assertEqual(len(updates), 1)
+
+        edited = list(FitnessClass.objects.order_by('start_time'))
+        self.assertEqual([c.name for c in edited], ['Sunrise Flow'] + ['Sunset Flow'] * 3)
+        self.assertEqual(edited[0].start_time, classes[0].start_time)
+        for before, after in zip(classes[1:], edited[1:]):
+            self.assertEqual(after.start_time, before.start_time + timedelta(hours=10))
+            self.assertEqual(after.duration, 90)
+        self.assertEqual(search_classes(FitnessClass.objects.all(), 'sunset').count(), 3)
+
+        Booking.objects.create(user=self.member, fitness_class=edited[3])
+        edited[2].start_time += timedelta(hours=1)
+        with self.assertRaises(ValidationError):
+            recurrence.update_following(edited[2], ['start_time'], edited[3].start_time - timedelta(days=1))
+
+    def test_cancel_this_and_following(self):
+        classes = self.create(repeat='custom', repeat_rule='FREQ=WEEKLY;COUNT=3')
+        for fitness_class in classes:
+            Booking.objects.create(user=self.member, fitness_class=fitness_class)
+        stats.get_member_stats(self.member.pk)
+        seat_changes = []
+
+        def record_seat_change(sender, fitness_class_id, delta, booked_count, **kwargs):
+            seat_changes.append((fitness_class_id, delta, booked_count))
+
+        seat_count_changed.connect(record_seat_change)
+        self.addCleanup(seat_count_changed.disconnect, record_seat_change)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = recurrence.cancel_following(classes[1], reason='Studio closed')
+        self.assertEqual(result, (2, 2))
+        # Live seat streams and the class:<pk> read-cache versions hear about every class
+        self.assertEqual(sorted(seat_changes), [(classes[1].pk, -1, 0), (classes[2].pk, -1, 0)])
+        self.assertEqual(
+            list(FitnessClass.objects.order_by('start_time').values_list('is_active', 'booked_count')),
+            [(True, 1), (False, 0), (False, 0)]
+        )
+        self.assertEqual(Booking.objects.filter(cancelled=True, cancellation_reason='Studio closed').count(), 2)
+        self.assertEqual(
+            OutboxEmail.objects.filter(template=OutboxEmail.CANCELLATION).count(), 2
+        )
+        self.assertEqual(stats.get_member_stats(self.member.pk)['upcoming_bookings'], 1)
+
+
+class ClassAvailabilityApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='regular', password='testpass123')
+        cls.other = User.objects.create_user(username='other', password='testpass123')
+        cls.classes = []
+        for i in range(3):
+            start = timezone.now() + timedelta(days=i + 1)
+            cls.classes.append(FitnessClass.objects.create(
+                name=f'Availability Class {i}',
+                description='Batch availability',
+                instructor='Availability Instructor',
+                class_type='spin',
+                start_time=start,
+                end_time=start + timedelta(hours=1),
+                capacity=2,
+                location='Studio C',
+                is_active=i < 2
+            ))
+        Booking.objects.create(user=cls.member, fitness_class=cls.classes[0])
+        Booking.objects.create(user=cls.other, fitness_class=cls.classes[0])
+        Booking.objects.create(user=cls.member, fitness_class=cls.classes[1], cancelled=True)
+        cls.url = reverse('booking:class_availability_api')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ids_batch_in_two_queries(self):
+        self.client.force_login(self.member)
+        ids = ','.join(str(fitness_class.pk) for fitness_class in self.classes) + ',999999'
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get(ids=ids)
+        # One seat query and one membership query, whatever the batch size
+        self.assertEqual(len([q for q in queries.captured_queries if 'booking_fitnessclass' in q['sql']]), 1)
+        self.assertEqual(len([q for q in queries.captured_queries if 'FROM "booking_booking"' in q['sql']]), 1)
+        self.assertEqual(data['missing'], [999999])
+        self.assertEqual(data['results'], [
+            {'id': self.classes[0].pk, 'available': False, 'is_booked': True, 'spots_remaining': 0},
+            {'id': self.classes[1].pk, 'available': True, 'is_booked': False, 'spots_remaining': 2},
+            {'id': self.classes[2].pk, 'available': True, 'is_booked': False, 'spots_remaining': 2},
+        ])
+
+    def test_polling_is_served_from_cache_until_seats_change(self):
+        ids = f'{self.classes[1].pk}'
+        self.get(ids=ids)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(ids=ids)['results'][0]['spots_remaining'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_class(self.other, self.classes[1])
+        self.assertEqual(self.get(ids=ids)['results'][0]['spots_remaining'], 1)
+
+    def test_date_window(self):
+        self.client.force_login(self.member)
+        data = self.get()
+        # The inactive class is left out of the schedule window
+        self.assertEqual([row['id'] for row in data['results']], [c.pk for c in self.classes[:2]])
+        self.assertTrue(data['results'][0]['is_booked'])
+
+        tomorrow = self.classes[0].start_time.astimezone(timezone.get_current_timezone()).date()
+        data = self.get(start=tomorrow.isoformat(), end=tomorrow.isoformat())
+        self.assertEqual([row['id'] for row in data['results']], [self.classes[0].pk])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url, {'ids': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': '2026-13-01'}).status_code, 400)
+        too_many = ','.join(str(pk) for pk in range(1, availability.MAX_CLASSES + 2))
+        self.assertEqual(self.client.get(self.url, {'ids': too_many}).status_code, 400)
+
+    def test_single_class_endpoint(self):
+        self.client.force_login(self.member)
+        response = self.client.get(reverse('booking:check_class_availability', args=[self.classes[0].pk]))
+        self.assertEqual(response.json(), {'available': False, 'is_booked': True, 'spots_remaining': 0})
+        response = self.client.get(reverse('booking:check_class_availability', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(LIVE_SEATS_ENABLED=True)
+class LiveSeatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='regular', password='testpass123')
+        cls.classes = []
+        for i in range(2):
+            start = timezone.now() + timedelta(days=i + 1)
+            cls.classes.append(FitnessClass.objects.create(
+                name=f'Live Class {i}',
+                description='Seat stream',
+                instructor='Live Instructor',
+                class_type='spin',
+                start_time=start,
+                end_time=start + timedelta(hours=1),
+                capacity=2,
+                location='Studio D'
+            ))
+        cls.url = reverse('booking:class_seat_stream')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_commits_publish_to_watched_classes_only(self):
+        watched, unwatched = self.classes
+        broker = live.get_broker()
+        with mock.patch.object(broker, 'wants', side_effect=lambda pk: pk == watched.pk), \
+                mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                book_class(self.member, watched)
+                book_class(self.member, unwatched)
+        publish.assert_called_once_with(
+            watched.pk, {'id': watched.pk, 'available': True, 'spots_remaining': 1}
+        )
+
+    def test_rejects_bad_ids(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'ids': 'x'}).status_code, 400)
+
+    @override_settings(LIVE_SEATS_REDIS_URL='redis://localhost:6379/0')
+    def test_redis_listener_stops_with_its_last_watcher(self):
+        broker = live.RedisBroker()
+        stopped = []
+
+        async def listen():
+            try:
+                await asyncio.Event().wait()
+            finally:
+                stopped.append(True)
+
+        async def stream():
+            before = len(stopped)
+            async with broker.subscribe([1]):
+                async with broker.subscribe([2]):
+                    pass
+                # Still feeding the outer watcher
+                self.assertEqual(len(broker.listeners), 1)
+                self.assertEqual(len(stopped), before)
+
+        with mock.patch.object(broker, 'listen', listen):
+            # Each async_to_sync() call gets a new event loop, as WSGI requests do
+            for _ in range(3):
+                async_to_sync(stream)()
+        self.assertEqual(stopped, [True] * 3)
+        self.assertEqual(broker.listeners, {})
+        self.assertEqual(broker.loop_subscriptions, {})
+
+    def test_only_offered_under_asgi(self):
+        pk = self.classes[0].pk
+        page = reverse('booking:class_detail', args=[pk])
+        self.assertContains(self.client.get(page), 'EventSource')
+        with override_settings(LIVE_SEATS_ENABLED=False):
+            # Under WSGI the page keeps its rendered count and the stream is refused
+            self.assertNotContains(self.client.get(page), 'EventSource')
+            self.assertEqual(self.client.get(self.url, {'ids': str(pk)}).status_code, 501)
+
+    @override_settings(LIVE_SEATS_HEARTBEAT=0.05, LIVE_SEATS_STREAM_TIMEOUT=0.5)
+    async def test_stream_sends_counts_then_changes(self):
+        pk = self.classes[0].pk
+        broker = live.get_broker()
+        response = await self.async_client.get(self.url, {'ids': str(pk)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+
+        first = (await anext(chunks)).decode()
+        self.assertTrue(first.startswith('retry: '))
+        self.assertIn('"spots_remaining": 2', first)
+        self.assertTrue(broker.wants(pk))
+
+        # Changes that arrive together coalesce to the newest count
+        broker.publish(pk, live.seat_message(pk, 1))
+        broker.publish(pk, live.seat_message(pk, 0))
+        update = (await anext(chunks)).decode()
+        self.assertEqual(update, live.sse_event({'id': pk, 'available': False, 'spots_remaining': 0}))
+        self.assertEqual(await anext(chunks), b': keepalive\n\n')
+
+        # The stream ends on its deadline and drops the subscription
+        [chunk async for chunk in chunks]
+        self.assertFalse(broker.wants(pk))
+
+
+class ReadCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='regular', password='testpass123')
+        cls.staff = User.objects.create_user(username='staffer', password='testpass123', is_staff=True)
+        start = timezone.now() + timedelta(days=1)
+        cls.fitness_class = FitnessClass.objects.create(
+            name='Cached Class',
+            description='Read models',
+            instructor='Cache Instructor',
+            class_type='pilates',
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            capacity=5,
+            location='Studio E'
+        )
+
+    def setUp(self):
+        cache.clear()
+        # A LocMemCache shared by two ReadCaches stands in for Redis and two workers
+        self.shared = LocMemCache('readcache-test', {})
+        self.shared.clear()
+        self.workers = [readcache.ReadCache(shared=self.shared, max_entries=10, local_timeout=30) for _ in range(2)]
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return self.builds
+
+    def test_tiers_and_cross_worker_invalidation(self):
+        first, second = self.workers
+        self.assertEqual(first.get_or_set('model', 'key', ['ns'], self.build), 1)
+        self.assertEqual(first.get_or_set('model', 'key', ['ns'], self.build), 1)
+        self.assertEqual(second.get_or_set('model', 'key', ['ns'], self.build), 1)
+        self.assertEqual(second.get_or_set('model', 'key', ['other'], self.build), 2)
+
+        # A bump in one worker retires the entry in the other's local tier too
+        first.bump('ns')
+        self.assertEqual(second.get_or_set('model', 'key', ['ns'], self.build), 3)
+        self.assertEqual(first.get_or_set('model', 'key', ['ns'], self.build), 3)
+
+        self.assertEqual(first.stats()['models']['model'], {
+            'local_hits': 1, 'shared_hits': 1, 'misses': 1, 'hit_rate': 0.667,
+        })
+        self.assertEqual(second.stats()['models']['model']['misses'], 2)
+
+    def test_batch_lookup_builds_only_missing_keys(self):
+        first, second = self.workers
+        built = []
+
+        def factory(missing):
+            built.append(sorted(missing))
+            return {key: key * 10 for key in missing if key != 3}
+
+        self.assertEqual(first.get_many_or_set('model', [1, 2], lambda key: [f'ns:{key}'], factory), {1: 10, 2: 20})
+        second.bump('ns:2')
+        self.assertEqual(
+            second.get_many_or_set('model', [1, 2, 3], lambda key: [f'ns:{key}'], factory),
+            {1: 10, 2: 20}
+        )
+        self.assertEqual(built, [[1, 2], [2, 3]])
+
+    def test_local_tier_is_bounded(self):
+        lru = readcache.LocalLRU(max_entries=2)
+        for key in 'abc':
+            lru.set(key, key, 30)
+        self.assertEqual((len(lru), lru.get('a'), lru.get('c')), (2, None, 'c'))
+
+    def test_booking_retires_cached_listing(self):
+        url = reverse('booking:class_list_api')
+        self.assertEqual(self.client.get(url).json()['results'][0]['spots_remaining'], 5)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            book_class(self.member, self.fitness_class)
+        self.assertEqual(self.client.get(url).json()['results'][0]['spots_remaining'], 4)
+
+    def test_booking_keeps_other_classes_cached(self):
+        start = self.fitness_class.start_time + timedelta(days=1)
+        other = FitnessClass.objects.create(
+            name='Other Cached Class',
+            description='Read models',
+            instructor='Cache Instructor',
+            class_type='yoga',
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            capacity=3
+        )
+        url = reverse('booking:class_list_api')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            book_class(self.member, other)
+        # The page itself stays cached; only the booked class's seats are re-read
+        with self.assertNumQueries(1):
+            results = self.client.get(url).json()['results']
+        self.assertEqual([row['spots_remaining'] for row in results], [5, 2])
+
+    def test_stats_endpoint_is_staff_only(self):
+        url = reverse('booking:read_cache_stats_api')
+        self.client.force_login(self.member)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('models', response.json())
+
+
+class SessionWriteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='regular', password='testpass123')
+        cls.url = reverse('booking:my_bookings_api')
+
+    def session_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        return len([q for q in queries.captured_queries if q['sql'].startswith('UPDATE "django_session"')])
+
+    def test_expiry_refresh_is_coalesced(self):
+        self.client.force_login(self.member)
+        now = time.time()
+        with mock.patch('booking.sessions.time.time', return_value=now):
+            self.assertEqual(self.session_writes(), 1)
+            self.assertEqual(self.session_writes(), 0)
+        with mock.patch('booking.sessions.time.time', return_value=now + refresh_interval() - 1):
+            self.assertEqual(self.session_writes(), 0)
+        with mock.patch('booking.sessions.time.time', return_value=now + refresh_interval()):
+            self.assertEqual(self.session_writes(), 1)
+
+    def test_stored_expiry_covers_the_sliding_hour(self):
+        self.client.force_login(self.member)
+        self.client.get(self.url)
+        session = Session.objects.get(session_key=self.client.session.session_key)
+        # Never signed out sooner than SESSION_COOKIE_AGE after the last request,
+        # even when that request skipped the write
+        self.assertGreaterEqual(
+            session.expire_date,
+            timezone.now() + timedelta(seconds=3600 + refresh_interval() - 5)
+        )
+
+    @override_settings(SESSION_ENGINE='booking.sessions.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        self.client.force_login(self.member)
+        self.assertIn('sessionid', self.client.get(self.url).cookies)
+        # The user and the bookings; no session read or write
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    @override_settings(SESSION_CLEANUP_BATCH_SIZE=2)
+    def test_expired_sessions_are_purged_in_batches(self):
+        expired = timezone.now() - timedelta(minutes=1)
+        for i in range(5):
+            Session.objects.create(session_key=f'expired{i}', session_data='', expire_date=expired)
+        Session.objects.create(session_key='live', session_data='', expire_date=timezone.now() + timedelta(hours=1))
+        with CaptureQueriesContext(connection) as queries:
+            call_command('clearsessions')
+        self.assertEqual(len([q for q in queries.captured_queries if q['sql'].startswith('DELETE')]), 3)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+
+class DbPoolStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staffer', password='testpass123', is_staff=True)
+
+    def setUp(self):
+        dbpool.wait_stats('pooled').reset()
+
+    def test_pool_usage_and_wait_times(self):
+        class FakePool:
+            maxsize = 10
+            size = 4
+
+            def __init__(self):
+                self.pool = queue.Queue()
+                self.pool.put('idle connection')
+
+        class FakeWrapper:
+            alias = 'pooled'
+            vendor = 'postgresql'
+            settings_dict = {'CONN_MAX_AGE': 0}
+            pool = FakePool()
+
+        with mock.patch('booking.dbpool.time.perf_counter', side_effect=[1.0, 1.25, 2.0, 2.05]):
+            for _ in range(2):
+                with dbpool.timed_checkout('pooled'):
+                    pass
+        with mock.patch('booking.dbpool.connections', {'pooled': FakeWrapper()}), \
+                self.settings(DB_CONN_MODE='pool', DB_POOL_MAX_CONNS=10, GUNICORN_WORKERS=3):
+            stats = dbpool.stats('pooled')
+        self.assertEqual(
+            {key: stats[key] for key in ('mode', 'max_connections', 'open', 'idle', 'in_use', 'checkouts')},
+            {'mode': 'pool', 'max_connections': 10, 'open': 4, 'idle': 1, 'in_use': 3, 'checkouts': 2}
+        )
+        self.assertEqual((stats['wait_avg_ms'], stats['wait_max_ms']), (150.0, 250.0))
+        self.assertEqual(stats['budget'], {'workers': 3, 'per_worker': 10, 'total': 30})
+
+    def test_persistent_connections_and_endpoint(self):
+        url = reverse('booking:db_pool_stats_api')
+        self.client.force_login(self.staff)
+        before = self.client.get(url).json()['default']['connects']
+        dbpool.record_connect(connection)
+        stats = self.client.get(url).json()['default']
+        self.assertEqual(stats['connects'], before + 1)
+        self.assertIn(stats['mode'], ('persistent', 'per-request'))
+        self.assertEqual(
+            stats['budget']['per_worker'],
+            settings.GUNICORN_THREADS + (settings.ASYNC_QUERY_THREADS if settings.ASYNC_QUERY_THREADS > 1 else 0)
+        )
+
+    def test_budget_counts_async_query_threads(self):
+        with self.settings(
+            DB_CONN_MODE='persistent', GUNICORN_WORKER_CLASS='gthread', GUNICORN_WORKERS=3,
+            GUNICORN_THREADS=4, ASYNC_QUERY_THREADS=4
+        ):
+            self.assertEqual(dbpool.connection_budget(), {'workers': 3, 'per_worker': 8, 'total': 24})
+        with self.settings(DB_CONN_MODE='persistent', GUNICORN_THREADS=4, ASYNC_QUERY_THREADS=1):
+            self.assertEqual(dbpool.connection_budget()['per_worker'], 4)
+
+
+class AsyncReadViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='regular', password='testpass123')
+        start = timezone.now() + timedelta(days=2)
+        cls.fitness_class = FitnessClass.objects.create(
+            name='Async Spin',
+            description='Many slow clients',
+            instructor='Async Instructor',
+            class_type='cycling',
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            capacity=5,
+            price=10.00,
+            location='Studio C'
+        )
+        cls.booking = Booking.objects.create(user=cls.member, fitness_class=cls.fitness_class)
+
+    def setUp(self):
+        cache.clear()
+        readcache.read_cache.clear_local()
+
+    async def test_read_views_over_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.member)
+        pk = self.fitness_class.pk
+
+        response = await self.async_client.get(reverse('booking:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['classes']), [self.fitness_class])
+
+        url = reverse('booking:class_detail', args=[pk])
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'Many slow clients')
+        self.assertIn('private', response['Cache-Control'])
+        response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = await self.async_client.get(reverse('booking:check_class_availability', args=[pk]))
+        self.assertEqual(response.json(), {'available': True, 'is_booked': True, 'spots_remaining': 4})
+
+    async def test_login_required(self):
+        for url in (reverse('booking:my_bookings'), reverse('booking:check_class_availability', args=[1])):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn(settings.LOGIN_URL, response.url)
+
+    @override_settings(ASYNC_QUERY_THREADS=2)
+    async def test_gather_runs_side_by_side_outside_transactions(self):
+        # Both calls must be running at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait(value):
+            barrier.wait()
+            return value, threading.get_ident()
+
+        with mock.patch.object(aio, 'connection', mock.Mock(in_atomic_block=False)):
+            results = await aio.gather(lambda: wait('a'), lambda: wait('b'))
+        self.assertEqual([value for value, _ in results], ['a', 'b'])
+        self.assertNotIn(threading.get_ident(), [thread for _, thread in results])
+
+    async def test_gather_stays_on_the_transaction_connection(self):
+        # TestCase wraps each test in a transaction, like ATOMIC_REQUESTS
+        def thread():
+            return threading.get_ident()
+
+        request_thread = await sync_to_async(thread)()
+        self.assertEqual(await aio.gather(thread, thread), [request_thread, request_thread])
+
+    def test_uvicorn_connection_budget(self):
+        with self.settings(
+            DB_CONN_MODE='persistent', GUNICORN_WORKER_CLASS='uvicorn', GUNICORN_WORKERS=2,
+            GUNICORN_WORKER_CONNECTIONS=50, ASYNC_QUERY_THREADS=4
+        ):
+            self.assertEqual(dbpool.connection_budget(), {'workers': 2, 'per_worker': 54, 'total': 108})
+
+    def test_query_stats_middleware_is_not_adapted(self):
+        # Django logs on django.request whenever it wraps a sync-only middleware for ASGI
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    @override_settings(QUERY_STATS_HEADERS=True)
+    async def test_async_views_report_their_queries(self):
+        await sync_to_async(self.async_client.force_login)(self.member)
+        url = reverse('booking:check_class_availability', args=[self.fitness_class.pk])
+        response = await self.async_client.get(url)
+        self.assertGreater(response.asgi_request.query_stats.count, 0)
+        self.assertEqual(response['X-DB-Query-Count'], str(response.asgi_request.query_stats.count))
+
+    def test_query_stats_only_count_their_own_request(self):
+        other = middleware.QueryStats()
+        # Another request in flight on the same connection
+        other.attach()
+        try:
+            with middleware.QueryStats().record() as stats:
+                User.objects.count()
+        finally:
+            other.detach()
+        self.assertEqual((stats.count, other.count), (1, 0))
+
+    def test_pool_thread_queries_count_towards_the_request(self):
+        stats = middleware.QueryStats()
+        token = middleware._active_stats.set(stats)
+        try:
+            with mock.patch.object(aio, 'close_old_connections'):
+                self.assertEqual(aio._on_pool_thread(User.objects.count, stats), 1)
+        finally:
+            middleware._active_stats.reset(token)
+        self.assertEqual(stats.count, 1)
+
+
+class ProfileLifecycleTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='regular', password='testpass123')
+
+    def test_created_on_first_use(self):
+        self.assertFalse(Profile.objects.filter(user=self.member).exists())
+        user = User.objects.get(pk=self.member.pk)
+        profile = Profile.for_user(user)
+        self.assertEqual(profile.user_id, user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(Profile.for_user(user), profile)
+        self.assertEqual(Profile.for_user(User.objects.get(pk=user.pk)), profile)
+        self.assertEqual(Profile.objects.count(), 1)
+
+    def test_saves_only_changed_fields(self):
+        Profile.objects.create(user=self.member, phone_number='555-0100')
+        profile = Profile.objects.get(user=self.member)
+        with self.assertNumQueries(0):
+            profile.save()
+
+        profile.emergency_contact = 'Pat'
+        with CaptureQueriesContext(connection) as queries:
+            profile.save()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"emergency_contact"', queries[0]['sql'])
+        self.assertNotIn('"phone_number"', queries[0]['sql'])
+        with self.assertNumQueries(0):
+            profile.save()
+
+    def test_login_and_user_save_leave_profile_alone(self):
+        user = User.objects.get(pk=self.member.pk)
+        Profile.for_user(user)
+        login = benchmarks.login_writes(user)
+        self.assertEqual((login['writes'], login['tables']), (1, {'auth_user': 1}))
+
+        user.first_name = 'Regular'
+        with self.assertNumQueries(1):
+            user.save(update_fields=['first_name'])
+
+
+class IndexAdvisorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seeding.seed(**indexadvisor.SNAPSHOT_DATASET, batch_size=500, prefix='plan')
+
+    def test_plans_match_snapshot(self):
+        snapshot = indexadvisor.load_snapshot()
+        if snapshot is None:
+            self.skipTest(f'No plan snapshot for {connection.vendor}')
+        indexadvisor.refresh_statistics()
+        report = indexadvisor.advise()
+        self.assertEqual(indexadvisor.compare(report, snapshot), {})
+        self.assertEqual(report['proposals'], [])
+        self.assertEqual(set(report['queries']), set(indexadvisor.QUERIES))
+
+    def test_parses_sqlite_plans(self):
+        steps = indexadvisor.parse_sqlite(
+            '3 0 0 SCAN booking_booking\n'
+            '8 0 0 SEARCH booking_fitnessclass USING INTEGER PRIMARY KEY (rowid=?)\n'
+            '12 0 0 SCAN booking_fitnessclass USING INDEX booking_fit_upcoming_idx\n'
+            '40 0 0 USE TEMP B-TREE FOR ORDER BY'
+        )
+        self.assertEqual(
+            [(step['node'], step['relation'], step['index'], step['full_scan']) for step in steps],
+            [
+                ('SCAN', 'booking_booking', None, True),
+                ('SEARCH', 'booking_fitnessclass', 'PRIMARY KEY', False),
+                ('SCAN', 'booking_fitnessclass', 'booking_fit_upcoming_idx', False),
+                ('USE TEMP B-TREE FOR ORDER BY', None, None, False),
+            ]
+        )
+
+    def test_parses_postgresql_plans(self):
+        output = json.dumps([{
+            'Plan': {
+                'Node Type': 'Nested Loop',
+                'Shared Hit Blocks': 12,
+                'Shared Read Blocks': 3,
+                'Plans': [
+                    {'Node Type': 'Seq Scan', 'Relation Name': 'booking_booking'},
+                    {
+                        'Node Type': 'Index Scan',
+                        'Relation Name': 'booking_fitnessclass',
+                        'Index Name': 'booking_fitnessclass_pkey',
+                    },
+                ],
+            },
+            'Execution Time': 1.5,
+        }])
+        steps, totals = indexadvisor.parse_postgresql(output)
+        self.assertEqual(
+            indexadvisor.shape({'steps': steps}),
+            ['Nested Loop', 'Seq Scan booking_booking', 'Index Scan booking_fitnessclass booking_fitnessclass_pkey']
+        )
+        self.assertEqual([step['full_scan'] for step in steps], [False, True, False])
+        self.assertEqual(totals, {'execution_ms': 1.5, 'buffers_hit': 12, 'buffers_read': 3})
+
+    def test_proposes_missing_indexes_for_full_scans(self):
+        full_scan = {
+            'steps': [{'node': 'Seq Scan', 'relation': 'booking_booking', 'index': None, 'full_scan': True}],
+            'full_scans': ['booking_booking'],
+            'execution_ms': None, 'buffers_hit': None, 'buffers_read': None,
+        }
+        with mock.patch.object(indexadvisor, 'explain', return_value=full_scan):
+            report = indexadvisor.advise(['class_roster', 'admin_bookings'])
+        # booking_created_idx exists, so only the roster's partial index is proposed
+        self.assertEqual([proposal['index'] for proposal in report['proposals']], ['booking_live_class_idx'])
+        self.assertEqual(report['proposals'][0]['queries'], ['class_roster'])
+        self.assertIn('CREATE INDEX "booking_live_class_idx"', report['proposals'][0]['sql'])
+
+    def test_command_checks_snapshot(self):
+        if indexadvisor.load_snapshot() is None:
+            self.skipTest(f'No plan snapshot for {connection.vendor}')
+        out, err = io.StringIO(), io.StringIO()
+        call_command('advise_indexes', current_db=True, check=True, stdout=out, stderr=err)
+        self.assertIn('instructor_upcoming', json.loads(out.getvalue())['queries'])
+        with mock.patch.object(indexadvisor, 'load_snapshot', return_value={'class_listing': ['SCAN x']}):
+            with self.assertRaises(CommandError):
+                call_command('advise_indexes', current_db=True, check=True, stdout=out, stderr=err)
+
+
+class CalendarFeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='regular', password='testpass123')
+        cls.instructor = User.objects.create_user(
+            username='coach', password='testpass123', first_name='Feed', last_name='Coach', is_staff=True
+        )
+        start = timezone.now() + timedelta(days=2)
+        cls.fitness_class = FitnessClass.objects.create(
+            name='Spin, Sweat; Repeat',
+            description='Bring water\nand a towel',
+            instructor='Feed Coach',
+            class_type='cycling',
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            capacity=5,
+            price=10.00,
+            location='Studio C'
+        )
+        cls.other_class = FitnessClass.objects.create(
+            name='Other Yoga',
+            description='Someone else teaches this',
+            instructor='Someone Else',
+            class_type='yoga',
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            capacity=5,
+            price=10.00,
+            location='Studio A'
+        )
+        cls.booking = Booking.objects.create(user=cls.member, fitness_class=cls.fitness_class)
+
+    def setUp(self):
+        cache.clear()
+        readcache.read_cache.clear_local()
+
+    def feed_url(self, user, feed):
+        return reverse('booking:calendar_feed', args=[ical.feed_token(user, feed)])
+
+    def get_feed(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body.decode()
+
+    def test_member_feed(self):
+        response, body = self.get_feed(self.feed_url(self.member, ical.MEMBER))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/calendar'))
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:fitness-class-{self.fitness_class.pk}@', body)
+        self.assertIn('SUMMARY:Spin\\, Sweat\\; Repeat\r\n', body)
+        self.assertIn('Bring water\\nand a towel', body)
+        self.assertIn(f'DTSTART:{self.fitness_class.start_time:%Y%m%dT%H%M%SZ}', body)
+        self.assertNotIn('Other Yoga', body)
+
+    def test_instructor_feed_lists_their_classes(self):
+        response, body = self.get_feed(self.feed_url(self.instructor, ical.INSTRUCTOR))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Spin\\, Sweat', body)
+        self.assertNotIn('Other Yoga', body)
+        self.assertIn('STATUS:CONFIRMED', body)
+
+    def test_bad_tokens_are_not_found(self):
+        token = ical.feed_token(self.member, ical.MEMBER)
+        for url in (
+            reverse('booking:calendar_feed', args=[token[:-1] + ('A' if token[-1] != 'A' else 'B')]),
+            reverse('booking:calendar_feed', args=['not-a-token']),
+            # Members are not instructors
+            self.feed_url(self.member, ical.INSTRUCTOR),
+            # Validly signed, but not the member's current feed key
+            reverse('booking:calendar_feed', args=[ical._signer.sign(f'{self.member.pk}:{ical.MEMBER}:old')]),
+        ):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_reset_revokes_feed_urls(self):
+        old_url = self.feed_url(self.member, ical.MEMBER)
+        self.assertEqual(self.client.get(old_url).status_code, 200)
+
+        self.client.force_login(self.member)
+        response = self.client.post(reverse('booking:reset_calendar_feed'), {'next': 'https://evil.example/'})
+        self.assertRedirects(response, reverse('booking:my_bookings'), fetch_redirect_response=False)
+
+        self.assertEqual(self.client.get(old_url).status_code, 404)
+        new_url = self.feed_url(User.objects.get(pk=self.member.pk), ical.MEMBER)
+        self.assertNotEqual(new_url, old_url)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+
+    async def test_asgi_feed_streams_and_caches(self):
+        url = await sync_to_async(self.feed_url)(self.member, ical.MEMBER)
+        response = await self.async_client.get(url)
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.endswith('END:VCALENDAR\r\n'))
+        cached = await self.async_client.get(url)
+        self.assertEqual(cached.content.decode(), body)
+
+    def test_long_lines_are_folded(self):
+        line = 'DESCRIPTION:' + 'é' * 100
+        folded = ical.fold(line)
+        self.assertTrue(all(len(part.encode()) <= 75 for part in folded.split('\r\n')))
+        self.assertEqual(folded.replace('\r\n ', '').rstrip('\r\n'), line)
+
+    def test_cached_feed_and_not_modified(self):
+        url = self.feed_url(self.member, ical.MEMBER)
+        response, body = self.get_feed(url)
+        self.assertTrue(response.streaming)
+        self.assertIn('private', response['Cache-Control'])
+
+        # Served from the read cache: only the owner lookup queries
+        with self.assertNumQueries(1):
+            response, cached = self.get_feed(url)
+        self.assertFalse(response.streaming)
+        self.assertEqual(cached, body)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_booking_and_class_changes_refresh_feeds(self):
+        member_url = self.feed_url(self.member, ical.MEMBER)
+        instructor_url = self.feed_url(self.instructor, ical.INSTRUCTOR)
+        etag = self.client.get(member_url)['ETag']
+        instructor_etag = self.client.get(instructor_url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.cancel()
+        response, body = self.get_feed(member_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('BEGIN:VEVENT', body)
+        # Another member's booking leaves the instructor feed alone
+        self.assertEqual(self.client.get(instructor_url, HTTP_IF_NONE_MATCH=instructor_etag).status_code, 304)
+
+        self.fitness_class.is_active = False
+        self.fitness_class.save()
+        response, body = self.get_feed(instructor_url, HTTP_IF_NONE_MATCH=instructor_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('STATUS:CANCELLED', body)
+
+    @override_settings(TEMPLATES=STUB_TEMPLATES)
+    def test_feed_url_in_page_context(self):
+        self.client.force_login(self.instructor)
+        response = self.client.get(reverse('booking:manage_classes'))
+        self.assertEqual(
+            response.context['calendar_feed_url'],
+            f'http://testserver{self.feed_url(self.instructor, ical.INSTRUCTOR)}'
+        )
+
+
+class QueryBudgetMixin:
+    """Adds assertQueryBudget() for pinning how many queries a request may run"""
+
+    def assertQueryBudget(self, budget, url, method='get', **kwargs):
+        with self.assertLogs('booking.queries', level='INFO'), \
+                CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        if len(queries) > budget:
+            self.fail(
+                f'{method.upper()} {url} ran {len(queries)} queries, budget is {budget}:\n'
+                + '\n'.join(query['sql'] for query in queries.captured_queries)
+            )
+        # The middleware sees the same statements as the test connection
+        self.assertEqual(response.wsgi_request.query_stats.count, len(queries))
+        return response
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    # url name: (method, budget). Budgets include the session and user
+    # lookups and the session save of the first request after a login.
+    # Views run in this order against the same data, so earlier ones can
+    # change what later ones see.
+    VIEW_BUDGETS = {
+        'home': ('get', 2),
+        'class_detail': ('get', 8),
+        'register': ('get', 0),
+        'book_class': ('post', 16),
+        'my_bookings': ('get', 8),
+        'cancel_booking': ('get', 7),
+        'profile': ('get', 7),
+        'update_profile': ('get', 6),
+        'manage_classes': ('get', 8),
+        'add_class': ('get', 5),
+        'edit_class': ('get', 7),
+        'cancel_following_classes': ('post', 14),
+        'class_attendance': ('get', 7),
+        'export_attendance': ('get', 6),
+        'export_roster': ('get', 5),
+        'class_list_api': ('get', 1),
+        'my_bookings_api': ('get', 6),
+        'check_class_availability': ('get', 7),
+        'class_availability_api': ('get', 7),
+        'quick_book_class': ('post', 14),
+        'quick_cancel_booking': ('post', 12),
+        'bulk_attendance_api': ('post', 9),
+        # Only up to the response: seat counts and feed rows are read while streaming
+        'class_seat_stream': ('get', 0),
+        'calendar_feed': ('get', 1),
+        'reset_calendar_feed': ('post', 7),
+        'read_cache_stats_api': ('get', 5),
+        'db_pool_stats_api': ('get', 5),
+        'account_inactive': ('get', 0),
+        'terms': ('get', 0),
+        'privacy': ('get', 0),
+    }
+    ADMIN_BUDGETS = {
+        'booking_fitnessclass': 10,
+        'booking_booking': 11,
+        'booking_waitlistentry': 8,
+        'booking_outboxemail': 8,
+    }
+    # booking.views routes left out of VIEW_BUDGETS, and why
+    UNBUDGETED = {
+        # Redirects to an "admin  " namespace that is not installed
+        'admin  -logout',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username='budget_admin', password='testpass123', is_staff=True, is_superuser=True
+        )
+        cls.members = [
+            User.objects.create_user(username=f'budget{i}', password='testpass123')
+            for i in range(4)
+        ]
+        # Registered members have a profile (register() creates it)
+        for user in [cls.staff, *cls.members]:
+            Profile.objects.create(user=user)
+        cls.classes = []
+        for i in range(4):
+            fitness_class = FitnessClass.objects.create(
+                name=f'Budget Class {i}',
+                description='Query budget check',
+                instructor='Budget Instructor',
+                class_type='hiit',
+                start_time=timezone.now() + timedelta(days=i + 1),
+                end_time=timezone.now() + timedelta(days=i + 1, hours=1),
+                capacity=10,
+                location='Studio B'
+            )
+            cls.classes.append(fitness_class)
+            for member in cls.members[1:]:
+                Booking.objects.create(user=member, fitness_class=fitness_class)
+            WaitlistEntry.objects.create(user=cls.members[0], fitness_class=fitness_class)
+        cls.booking = Booking.objects.filter(user=cls.members[1]).first()
+
+    def setUp(self):
+        cache.clear()
+
+    def request_for(self, name):
+        """(user, url args, extra client kwargs) used to exercise ``name``"""
+        fitness_class = self.classes[0]
+        member = self.members[1]
+        return {
+            'class_detail': (member, [fitness_class.pk], {}),
+            'book_class': (self.members[0], [fitness_class.pk], {}),
+            'my_bookings': (member, [], {}),
+            'cancel_booking': (member, [self.booking.pk], {}),
+            'profile': (member, [], {}),
+            'update_profile': (member, [], {}),
+            'manage_classes': (self.staff, [], {}),
+            'add_class': (self.staff, [], {}),
+            'edit_class': (self.staff, [fitness_class.pk], {}),
+            'cancel_following_classes': (self.staff, [self.classes[3].pk], {}),
+            'class_attendance': (self.staff, [fitness_class.pk], {}),
+            'export_attendance': (self.staff, [fitness_class.pk], {}),
+            'export_roster': (self.staff, [], {}),
+            'my_bookings_api': (member, [], {}),
+            'check_class_availability': (member, [fitness_class.pk], {}),
+            'class_availability_api': (member, [], {
+                'data': {'ids': ','.join(str(c.pk) for c in self.classes)},
+            }),
+            # book_class has already booked members[0] into the first class
+            'quick_book_class': (self.members[0], [self.classes[1].pk], {}),
+            'quick_cancel_booking': (member, [self.booking.pk], {}),
+            'bulk_attendance_api': (self.staff, [fitness_class.pk], {
+                'data': {'present': [self.booking.pk]},
+                'content_type': 'application/json',
+            }),
+            'class_seat_stream': (None, [], {'data': {'ids': str(fitness_class.pk)}}),
+            'calendar_feed': (None, [ical.feed_token(member, ical.MEMBER)], {}),
+            'reset_calendar_feed': (member, [], {}),
+            'read_cache_stats_api': (self.staff, [], {}),
+            'db_pool_stats_api': (self.staff, [], {}),
+        }.get(name, (None, [], {}))
+
+    @override_settings(TEMPLATES=STUB_TEMPLATES, LIVE_SEATS_ENABLED=True)
+    def test_booking_views_stay_within_budget(self):
+        for name, (method, budget) in self.VIEW_BUDGETS.items():
+            with self.subTest(view=name):
+                user, args, kwargs = self.request_for(name)
+                self.client.logout()
+                if user is not None:
+                    self.client.force_login(user)
+                response = self.assertQueryBudget(budget, reverse(f'booking:{name}', args=args), method, **kwargs)
+                self.assertLess(response.status_code, 400)
+
+    def test_every_booking_view_has_a_budget(self):
+        view_names = {
+            pattern.name for pattern in booking_urls.urlpatterns
+            if isinstance(pattern, URLPattern) and pattern.callback.__module__ == views.__name__
+        }
+        self.assertEqual(view_names - self.UNBUDGETED - set(self.VIEW_BUDGETS), set())
+
+    def test_admin_changelists_stay_within_budget(self):
+        self.client.force_login(self.staff)
+        for model, budget in self.ADMIN_BUDGETS.items():
+            with self.subTest(model=model):
+                response = self.assertQueryBudget(budget, reverse(f'admin:{model}_changelist'))
+                self.assertEqual(response.status_code, 200)
+
+    def test_headers_follow_setting(self):
+        url = reverse('booking:class_list_api')
+        with self.settings(QUERY_STATS_HEADERS=True, QUERY_STATS_SQL_HEADER=False):
+            response = self.assertQueryBudget(1, url)
+        self.assertEqual(response['X-DB-Query-Count'], '1')
+        self.assertIn('X-DB-Time-Ms', response)
+        self.assertNotIn('X-DB-Slowest-SQL', response)
+        # Run the listing query again rather than serve it from the read cache
+        cache.clear()
+        readcache.read_cache.clear_local()
+        with self.settings(QUERY_STATS_HEADERS=True, QUERY_STATS_SQL_HEADER=True):
+            response = self.assertQueryBudget(1, url)
+        self.assertTrue(response['X-DB-Slowest-SQL'].startswith('SELECT '))
+        self.assertNotIn('\n', response['X-DB-Slowest-SQL'])
+        self.assertLessEqual(len(response['X-DB-Slowest-SQL']), middleware.SQL_PREVIEW_LENGTH)
+        with self.settings(QUERY_STATS_HEADERS=False):
+            response = self.assertQueryBudget(1, url)
+        self.assertNotIn('X-DB-Query-Count', response)
+
+
+class BenchmarkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = seeding.seed(members=30, classes=40, bookings=300, seed=7, batch_size=50)
+
+    def test_seeded_data_is_consistent(self):
+        self.assertEqual(self.dataset['members'], 30)
+        self.assertEqual(Booking.objects.count(), self.dataset['bookings'])
+        self.assertEqual(Profile.objects.count(), 30)
+        self.assertFalse(OutboxEmail.objects.exists())
+        for fitness_class in FitnessClass.objects.all():
+            self.assertEqual(fitness_class.booked_count, fitness_class.bookings.filter(cancelled=False).count())
+            self.assertLessEqual(fitness_class.booked_count, fitness_class.capacity)
+
+    def test_report_has_percentiles_and_query_counts(self):
+        report = benchmarks.run(views=['home', 'check_class_availability'], iterations=5, warmup=1)
+        self.assertEqual(report['meta']['dataset']['classes'], 40)
+        result = report['views']['check_class_availability']
+        self.assertEqual((result['requests'], result['errors']), (5, 0))
+        self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+        self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+        self.assertGreater(result['queries_p50'], 0)
+        self.assertGreater(result['peak_memory_kb'], 0)
+        # Signing in updates last_login and nothing else outside the session
+        self.assertEqual(report['login']['tables'], {'auth_user': 1})
+
+    @override_settings(QUERY_STATS_HEADERS=True)
+    def test_counts_match_the_request_query_stats(self):
+        member_id = Booking.objects.values_list('user_id', flat=True).first()
+        class_id = FitnessClass.objects.values_list('pk', flat=True).first()
+        response, _elapsed, query_count, _db_time = benchmarks._request(
+            Client(), {}, member_id, 'get', reverse('booking:class_detail', args=[class_id])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(query_count, int(response['X-DB-Query-Count']))
+
+
+class SeedCommandTest(TestCase):
+    def seed(self, prefix, seed=3):
+        out = io.StringIO()
+        call_command(
+            'seed_fitness', members=25, classes=30, bookings=200, seed=seed,
+            batch_size=40, prefix=prefix, anchor=date(2026, 1, 15), stdout=out
+        )
+        return out.getvalue()
+
+    def schedule(self, prefix):
+        return list(
+            Booking.objects.filter(user__username__startswith=prefix)
+            .order_by('pk')
+            .values_list('user__username', 'fitness_class__name', 'fitness_class__start_time', 'cancelled', 'attended')
+        )
+
+    def test_bulk_seeding_skips_signals_and_emails(self):
+        # One INSERT per batch: no per-user profile signal, no per-booking save()
+        with CaptureQueriesContext(connection) as queries:
+            output = self.seed('alpha')
+        self.assertIn('Created 25 members, 30 classes', output)
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT')]
+        booking_inserts = [sql for sql in inserts if sql.startswith('INSERT INTO "booking_booking"')]
+        self.assertEqual(len(booking_inserts), -(-Booking.objects.count() // 40))
+        self.assertEqual(Profile.objects.count(), 25)
+        self.assertFalse(OutboxEmail.objects.exists())
+        self.assertEqual(
+            set(FitnessClass.objects.values_list('class_type', flat=True)),
+            {code for code, _label in FitnessClass.CLASS_TYPES}
+        )
+        now = timezone.now()
+        self.assertTrue(Booking.objects.filter(cancelled=True).exists())
+        self.assertFalse(Booking.objects.filter(attended=True, cancelled=True).exists())
+        self.assertFalse(Booking.objects.filter(attended=True, fitness_class__start_time__gt=now).exists())
+
+    def test_same_seed_same_data(self):
+        self.seed('alpha')
+        self.seed('beta')
+        first = [row[1:] for row in self.schedule('alpha')]
+        second = [row[1:] for row in self.schedule('beta')]
+        self.assertEqual(first, second)
+
+    def test_rates_are_validated(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_fitness', cancellation_rate=1.5, stdout=io.StringIO())
+
+
+class ClassDetailConditionalTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='regular', password='testpass123')
+        cls.other = User.objects.create_user(username='other', password='testpass123')
+        start = timezone.now() + timedelta(days=2)
+        cls.fitness_class = FitnessClass.objects.create(
+            name='Evening Yoga',
+            description='Slow flow',
+            instructor='Conditional Instructor',
+            class_type='yoga',
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            capacity=10,
+            price=10.00,
+            location='Studio A'
+        )
+        cls.similar = FitnessClass.objects.create(
+            name='Morning Yoga',
+            description='Fast flow',
+            instructor='Conditional Instructor',
+            class_type='yoga',
+            start_time=start + timedelta(days=1),
+            end_time=start + timedelta(days=1, hours=1),
+            capacity=10,
+            price=10.00,
+            location='Studio B'
+        )
+        cls.url = reverse('booking:class_detail', args=[cls.fitness_class.pk])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.member)
+
+    def test_validators_and_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        # Validators only: session, user and own booking (the class comes
+        # from the read cache; the session was refreshed moments ago)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_follows_bookings_user_and_schedule(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url)['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book_class(self.other, self.fitness_class)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        self.client.force_login(self.other)
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+        self.client.force_login(self.member)
+
+        # Another class changing changes the similar-classes list
+        self.similar.name = 'Sunrise Yoga'
+        self.similar.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Sunrise Yoga')
+
+    def test_shared_fragment_is_cached(self):
+        self.assertContains(self.client.get(self.url), 'Morning Yoga')
+        self.client.force_login(self.other)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Morning Yoga')
+        self.assertContains(response, 'Book this class')
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'start_time" >=' in query['sql']
+        ])
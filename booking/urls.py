@@ -72,7 +72,26 @@ urlpatterns = [
     path('manage-classes/', views.manage_classes, name='manage_classes'),
     path('add-class/', views.add_class, name='add_class'),
     path('edit-class/<int:pk>/', views.edit_class, name='edit_class'),
+    path('edit-class/<int:pk>/cancel-following/', views.cancel_following_classes, name='cancel_following_classes'),
     path('class-attendance/<int:pk>/', views.class_attendance, name='class_attendance'),
+    path('class-attendance/<int:pk>/export/', views.export_attendance, name='export_attendance'),
+    path('roster/export/', views.export_roster, name='export_roster'),
+    
+    # Calendar subscriptions (signed token, no session)
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
+    path('calendar/reset/', views.reset_calendar_feed, name='reset_calendar_feed'),
+    
+    # AJAX/API endpoints
+    path('api/classes/', views.class_list_api, name='class_list_api'),
+    path('api/my-bookings/', views.my_bookings_api, name='my_bookings_api'),
+    path('api/classes/availability/', views.class_availability_api, name='class_availability_api'),
+    path('api/classes/availability/stream/', views.class_seat_stream, name='class_seat_stream'),
+    path('api/classes/<int:class_id>/availability/', views.check_class_availability, name='check_class_availability'),
+    path('api/classes/<int:class_id>/book/', views.quick_book_class, name='quick_book_class'),
+    path('api/bookings/<int:booking_id>/cancel/', views.quick_cancel_booking, name='quick_cancel_booking'),
+    path('api/classes/<int:pk>/attendance/', views.bulk_attendance_api, name='bulk_attendance_api'),
+    path('api/cache-stats/', views.read_cache_stats_api, name='read_cache_stats_api'),
+    path('api/db-pool-stats/', views.db_pool_stats_api, name='db_pool_stats_api'),
     
     # Additional auth-related
     path('account-inactive/', views.account_inactive, name='account_inactive'),
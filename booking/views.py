@@ -3,93 +3,141 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.utils import timezone
-from django.http import JsonResponse
-from django.db.models import Count, Q
-from datetime import timedelta
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.db.models import Count
+from datetime import datetime, time, timedelta
 from .models import FitnessClass, Booking, Profile
 from .forms import FitnessClassForm, ProfileForm, CustomUserCreationForm
+from .exceptions import BookingError, ClassNotBookableError, AlreadyBookedError
+from . import services
+from .search import search_classes
+from . import leaderboard, stats
+from .pagination import KeysetPage, paginate
+from . import aio, availability, conditional, dbpool, exports, ical, live, readcache, recurrence
 from django.shortcuts import render
 from django.views.decorators.csrf import requires_csrf_token
 from django.contrib.auth import logout
 from django.views.decorators.csrf import csrf_protect
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition, require_POST
+import asyncio
+import json
 import os
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.utils.dateparse import parse_date
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.text import slugify
 from django.contrib.auth import login
 from django.shortcuts import render, redirect
 
-def home(request):
-    """Display all upcoming fitness classes with filtering options"""
-    now = timezone.now()
+# Keyset ordering shared by the class listings; id breaks start_time ties
+CLASS_LISTING_ORDER = ('start_time', 'id')
+
+def _upcoming_classes(request):
+    """Upcoming active classes filtered by the listing's query-string options"""
     query = request.GET.get('q')
     class_type = request.GET.get('type')
-    
-    classes = FitnessClass.objects.filter(
-        start_time__gte=now,
-        is_active=True
-    ).order_by('start_time')
-    
-    if query:
-        classes = classes.filter(
-            Q(name__icontains=query) | 
-            Q(instructor__icontains=query) |
-            Q(description__icontains=query)
-        )
-    
-    if class_type:
-        classes = classes.filter(class_type=class_type)
-    
-    # Get popular classes (most bookings)
-    popular_classes = FitnessClass.objects.filter(
-        start_time__gte=now,
-        is_active=True
-    ).annotate(
-        num_bookings=Count('bookings')
-    ).order_by('-num_bookings')[:3]
-    
-    return render(request, 'booking/home.html', {
-        'classes': classes,
+    cursor = request.GET.get('cursor')
+    built = []
+    
+    def build():
+        classes = FitnessClass.objects.filter(
+            start_time__gte=timezone.now(),
+            is_active=True
+        ).defer('search_vector')
+        
+        if class_type:
+            classes = classes.filter(class_type=class_type)
+        
+        ordering = CLASS_LISTING_ORDER
+        if query:
+            # Indexed full-text search, best matches first
+            classes = search_classes(classes, query)
+            ordering = ('-rank',) + CLASS_LISTING_ORDER
+        
+        built.append(True)
+        return paginate(classes, ordering, cursor)
+    
+    # Which classes a page shows only changes with the schedule; their seat
+    # counts are filled in per class, so a booking retires just its class's
+    page = readcache.get_or_set(
+        'listing',
+        json.dumps([query, class_type, cursor]),
+        [readcache.SCHEDULE],
+        build
+    )
+    return KeysetPage(
+        availability.with_current_seats(page.items, loaded=bool(built)),
+        page.next_cursor,
+        page.prev_cursor
+    )
+
+async def home(request):
+    """Display upcoming fitness classes with filtering options, one page at a time"""
+    # The listing page and the popular classes (served from the cached
+    # leaderboard) are independent, so they load side by side
+    page, popular_classes = await aio.gather(
+        lambda: _upcoming_classes(request),
+        leaderboard.get_popular_classes
+    )
+    
+    # Keep the search/filter parameters on the next/previous page links
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    
+    return await aio.render(request, 'booking/home.html', {
+        'classes': page.items,
+        'page': page,
+        'query_prefix': f'{params.urlencode()}&' if params else '',
         'popular_classes': popular_classes,
         'class_types': FitnessClass.CLASS_TYPES,
-        'search_query': query,
-        'selected_type': class_type
+        'search_query': request.GET.get('q'),
+        'selected_type': request.GET.get('type')
     })
 
-def class_detail(request, pk):
+async def class_detail(request, pk):
     """Show details for a specific fitness class with related classes"""
-    fitness_class = get_object_or_404(FitnessClass, pk=pk)
-    is_booked = False
-    user_has_booking = False
-    
-    if request.user.is_authenticated:
-        is_booked = Booking.objects.filter(
-            user=request.user,
-            fitness_class=fitness_class,
-            cancelled=False
-        ).exists()
-        
-        # Check if user has any booking for this class (including cancelled)
-        user_has_booking = Booking.objects.filter(
-            user=request.user,
-            fitness_class=fitness_class
-        ).exists()
-    
-    # Get similar classes (same type)
+    fitness_class = await sync_to_async(conditional.get_class)(pk)
+    version = await sync_to_async(conditional.schedule_version)()
+    fragment_version = conditional.fragment_version(fitness_class, version)
+    fragment_cached = await sync_to_async(conditional.fragment_cached)(pk, fragment_version)
+    user = await aio.get_user(request)
+    
+    # Get similar classes (same type); only queried when the cached
+    # fragment that lists them has expired
     similar_classes = FitnessClass.objects.filter(
         class_type=fitness_class.class_type,
         start_time__gte=timezone.now(),
         is_active=True
     ).exclude(pk=pk).order_by('start_time')[:3]
     
-    return render(request, 'booking/class_detail.html', {
-        'fitness_class': fitness_class,
-        'is_booked': is_booked,
-        'user_has_booking': user_has_booking,
-        'spots_remaining': fitness_class.spots_remaining,
-        'similar_classes': similar_classes
-    })
+    lookups = [lambda: conditional.booking_state(user, pk)]
+    if not fragment_cached:
+        lookups.append(lambda: list(similar_classes))
+    booking_cancelled, *similar = await aio.gather(*lookups)
+    if similar:
+        similar_classes = similar[0]
+    
+    etag, last_modified = await sync_to_async(conditional.validators)(
+        request, fitness_class, version, booking_cancelled
+    )
+    response = aio.not_modified(request, etag, last_modified)
+    if response is None:
+        response = await aio.render(request, 'booking/class_detail.html', {
+            'fitness_class': fitness_class,
+            'is_booked': booking_cancelled is False,
+            # Any booking for this class, including cancelled ones
+            'user_has_booking': booking_cancelled is not None,
+            'spots_remaining': fitness_class.spots_remaining,
+            'similar_classes': similar_classes,
+            'fragment_version': fragment_version,
+            'fragment_timeout': settings.CLASS_DETAIL_CACHE_TIMEOUT,
+            'live_seats': settings.LIVE_SEATS_ENABLED
+        })
+    return aio.finish(request, response, etag, last_modified, private=True, no_cache=True)
 
 def register(request):
     """Handle user registration with profile creation"""
@@ -98,7 +146,7 @@ def register(request):
         if form.is_valid():
             user = form.save()
             
-            # Create profile for the user
+            # A new user has no profile yet (see Profile.for_user); one INSERT
             Profile.objects.create(
                 user=user,
                 phone_number=form.cleaned_data.get('phone_number'),
@@ -110,76 +158,75 @@ def register(request):
             login(request, user)
             
             messages.success(request, 'Registration successful!')
-            return redirect('home')  # Ensure this matches your URL pattern
+            return redirect('booking:home')
     else:
         form = CustomUserCreationForm()
     return render(request, 'booking/register.html', {'form': form})
 
-def home(request):
-    """Simple home page view"""
-    return render(request, 'booking/home.html')
-
 @login_required
 def book_class(request, class_id):
-    """Handle class bookings with waitlist functionality"""
+    """Handle class bookings through the transactional booking service"""
     fitness_class = get_object_or_404(FitnessClass, pk=class_id)
     
-    # Validate the booking
-    if fitness_class.start_time < timezone.now():
-        messages.error(request, 'Cannot book a class that has already occurred.')
-        return redirect('class_detail', pk=class_id)
-    
-    if fitness_class.is_full():
-        messages.warning(request, 'This class is full, but you have been added to the waitlist.')
-        # Implement waitlist logic here
-        return redirect('class_detail', pk=class_id)
-    
-    existing_booking = Booking.objects.filter(
-        user=request.user,
-        fitness_class=fitness_class
-    ).first()
-    
-    if existing_booking:
-        if existing_booking.cancelled:
-            existing_booking.cancelled = False
-            existing_booking.save()
-            messages.success(request, 'Your previously cancelled booking has been reinstated!')
-        else:
-            messages.warning(request, 'You have already booked this class!')
-        return redirect('my_bookings')
-    
-    # Create the booking
-    Booking.objects.create(user=request.user, fitness_class=fitness_class)
-    messages.success(request, f'Successfully booked {fitness_class.name}!')
+    try:
+        booking, reinstated, entry = services.book_or_waitlist(request.user, fitness_class)
+    except ClassNotBookableError as exc:
+        messages.error(request, exc.message)
+        return redirect('booking:class_detail', pk=class_id)
+    except AlreadyBookedError as exc:
+        messages.warning(request, exc.message)
+        return redirect('booking:my_bookings')
+    
+    if entry is not None:
+        messages.warning(
+            request,
+            f'This class is full, but you have been added to the waitlist (position {entry.position}).'
+        )
+        return redirect('booking:class_detail', pk=class_id)
     
-    # Send confirmation email (implement email functionality)
-    # send_booking_confirmation(request.user, fitness_class)
+    if reinstated:
+        messages.success(request, 'Your previously cancelled booking has been reinstated!')
+    else:
+        messages.success(request, f'Successfully booked {fitness_class.name}!')
     
-    return redirect('my_bookings')
+    return redirect('booking:my_bookings')
 
-@login_required
-def my_bookings(request):
+@aio.login_required
+async def my_bookings(request):
     """Show user's upcoming bookings with cancellation deadlines"""
     now = timezone.now()
     bookings = Booking.objects.filter(
         user=request.user,
         cancelled=False,
         fitness_class__start_time__gte=now
-    ).select_related('fitness_class').order_by('fitness_class__start_time')
+    ).select_related('fitness_class')
+    past_bookings = Booking.objects.filter(
+        user=request.user,
+        fitness_class__start_time__lt=now
+    ).select_related('fitness_class')
+    
+    page, past_page, calendar_feed_url = await aio.gather(
+        lambda: paginate(bookings, ('fitness_class__start_time', 'id'), request.GET.get('cursor')),
+        lambda: paginate(
+            past_bookings,
+            ('-fitness_class__start_time', '-id'),
+            request.GET.get('past_cursor'),
+            per_page=10
+        ),
+        lambda: ical.feed_url(request, request.user, ical.MEMBER)
+    )
     
     # Calculate cancellation deadlines (24 hours before class)
-    for booking in bookings:
+    for booking in page:
         booking.cancellation_deadline = booking.fitness_class.start_time - timedelta(hours=24)
         booking.can_cancel = now < booking.cancellation_deadline
     
-    past_bookings = Booking.objects.filter(
-        user=request.user,
-        fitness_class__start_time__lt=now
-    ).select_related('fitness_class').order_by('-fitness_class__start_time')[:10]
-    
-    return render(request, 'booking/my_bookings.html', {
-        'bookings': bookings,
-        'past_bookings': past_bookings
+    return await aio.render(request, 'booking/my_bookings.html', {
+        'bookings': page.items,
+        'page': page,
+        'past_bookings': past_page.items,
+        'past_page': past_page,
+        'calendar_feed_url': calendar_feed_url
     })
 
 @login_required
@@ -190,7 +237,7 @@ def cancel_booking(request, booking_id):
     
     if timezone.now() > cancellation_deadline:
         messages.error(request, 'Cancellation deadline has passed (24 hours before class).')
-        return redirect('my_bookings')
+        return redirect('booking:my_bookings')
     
     if request.method == 'POST':
         reason = request.POST.get('reason', '')
@@ -200,7 +247,7 @@ def cancel_booking(request, booking_id):
         # Send cancellation email (implement email functionality)
         # send_cancellation_notification(request.user, booking.fitness_class, reason)
         
-        return redirect('my_bookings')
+        return redirect('booking:my_bookings')
     
     return render(request, 'booking/cancel_booking.html', {
         'booking': booking,
@@ -211,19 +258,9 @@ def cancel_booking(request, booking_id):
 def profile(request):
     """Display user profile with booking statistics"""
     user = request.user
-    now = timezone.now()
     
-    # Get booking stats
-    total_bookings = Booking.objects.filter(user=user).count()
-    upcoming_bookings = Booking.objects.filter(
-        user=user,
-        cancelled=False,
-        fitness_class__start_time__gte=now
-    ).count()
-    attended_classes = Booking.objects.filter(
-        user=user,
-        attended=True
-    ).count()
+    # Booking counters come from the per-member stats cache (one aggregate on a miss)
+    member_stats = stats.get_member_stats(user.pk)
     
     # Get recently attended classes
     recent_classes = Booking.objects.filter(
@@ -233,23 +270,23 @@ def profile(request):
     
     return render(request, 'booking/profile.html', {
         'user': user,
-        'total_bookings': total_bookings,
-        'upcoming_bookings': upcoming_bookings,
-        'attended_classes': attended_classes,
+        'total_bookings': member_stats['total_bookings'],
+        'upcoming_bookings': member_stats['upcoming_bookings'],
+        'attended_classes': member_stats['attended_classes'],
         'recent_classes': recent_classes
     })
 
 @login_required
 def update_profile(request):
     """Update user profile information with picture upload"""
-    profile = request.user.profile
+    profile = Profile.for_user(request.user)
     
     if request.method == 'POST':
         form = ProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
             form.save()
             messages.success(request, 'Profile updated successfully!')
-            return redirect('profile')
+            return redirect('booking:profile')
     else:
         form = ProfileForm(instance=profile)
     
@@ -260,33 +297,44 @@ def update_profile(request):
 @user_passes_test(lambda u: u.is_staff)
 def manage_classes(request):
     """View for instructors to manage their classes with stats"""
-    instructor = request.user.get_full_name() or request.user.username
+    instructor = ical.instructor_name(request.user)
     now = timezone.now()
     
+    # Live booking totals come from the denormalized booked_count column
     upcoming_classes = FitnessClass.objects.filter(
         instructor=instructor,
         start_time__gte=now
-    ).annotate(
-        num_bookings=Count('bookings', filter=Q(bookings__cancelled=False))
-    ).order_by('start_time')
+    )
+    upcoming_page = paginate(upcoming_classes, CLASS_LISTING_ORDER, request.GET.get('cursor'))
     
     past_classes = FitnessClass.objects.filter(
         instructor=instructor,
         start_time__lt=now
-    ).annotate(
-        num_attended=Count('bookings', filter=Q(bookings__attended=True))
-    ).order_by('-start_time')
+    )
+    past_page = paginate(past_classes, ('-start_time', '-id'), request.GET.get('past_cursor'))
+    
+    # Count attendance for this page only rather than grouping the whole history
+    attended = dict(
+        Booking.objects.filter(
+            fitness_class__in=[cls.pk for cls in past_page],
+            attended=True
+        ).values_list('fitness_class').annotate(total=Count('id')).order_by()
+    )
     
     # Calculate attendance percentage for past classes
-    for cls in past_classes:
+    for cls in past_page:
+        cls.num_attended = attended.get(cls.pk, 0)
         if cls.capacity > 0:
             cls.attendance_percentage = (cls.num_attended / cls.capacity) * 100
         else:
             cls.attendance_percentage = 0
     
     return render(request, 'booking/manage_classes.html', {
-        'upcoming_classes': upcoming_classes,
-        'past_classes': past_classes
+        'upcoming_classes': upcoming_page.items,
+        'upcoming_page': upcoming_page,
+        'past_classes': past_page.items,
+        'past_page': past_page,
+        'calendar_feed_url': ical.feed_url(request, request.user, ical.INSTRUCTOR)
     })
 
 @login_required
@@ -298,14 +346,20 @@ def add_class(request):
         if form.is_valid():
             fitness_class = form.save(commit=False)
             fitness_class.instructor = request.user.get_full_name() or request.user.username
-            fitness_class.save()
             
-            # Handle recurring classes (implement as needed)
-            # if form.cleaned_data.get('is_recurring'):
-            #     create_recurring_classes(fitness_class)
-            
-            messages.success(request, 'Class added successfully!')
-            return redirect('manage_classes')
+            if form.occurrences:
+                # One bulk insert for the whole series
+                recurrence.create_series(
+                    fitness_class,
+                    form.recurrence_rule,
+                    form.occurrences,
+                    form.cleaned_data['repeat_exceptions']
+                )
+                messages.success(request, f'{len(form.occurrences)} classes added successfully!')
+            else:
+                fitness_class.save()
+                messages.success(request, 'Class added successfully!')
+            return redirect('booking:manage_classes')
     else:
         form = FitnessClassForm()
     
@@ -318,15 +372,25 @@ def edit_class(request, pk):
     fitness_class = get_object_or_404(FitnessClass, pk=pk)
     
     if request.method == 'POST':
+        # Form validation writes the edits onto the instance
+        original_start = fitness_class.start_time
         form = FitnessClassForm(request.POST, request.FILES, instance=fitness_class)
         if form.is_valid():
+            if form.cleaned_data.get('apply_to') == 'following':
+                try:
+                    updated = recurrence.update_following(fitness_class, form.changed_data, original_start)
+                except ValidationError as error:
+                    messages.error(request, error.messages[0])
+                else:
+                    messages.success(request, f'{updated} classes in the series updated successfully!')
+                    return redirect('booking:manage_classes')
             # Prevent changing class time if bookings exist
-            if 'start_time' in form.changed_data and fitness_class.bookings.exists():
+            elif 'start_time' in form.changed_data and fitness_class.bookings.exists():
                 messages.error(request, 'Cannot change class time after bookings have been made.')
             else:
                 form.save()
                 messages.success(request, 'Class updated successfully!')
-                return redirect('manage_classes')
+                return redirect('booking:manage_classes')
     else:
         form = FitnessClassForm(instance=fitness_class)
     
@@ -336,6 +400,19 @@ def edit_class(request, pk):
         'has_bookings': fitness_class.bookings.exists()
     })
 
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+@require_POST
+def cancel_following_classes(request, pk):
+    """Cancel a class and every later class in its series"""
+    fitness_class = get_object_or_404(FitnessClass, pk=pk)
+    classes, bookings = recurrence.cancel_following(
+        fitness_class,
+        request.POST.get('reason') or None
+    )
+    messages.success(request, f'{classes} classes and {bookings} bookings cancelled.')
+    return redirect('booking:manage_classes')
+
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def class_attendance(request, pk):
@@ -348,40 +425,297 @@ def class_attendance(request, pk):
     
     if request.method == 'POST':
         if 'export' in request.POST:
-            # Implement CSV export functionality
-            # return export_attendance_csv(bookings)
-            pass
+            return _attendance_export(request, fitness_class, request.POST.get('format'))
         else:
-            # Handle attendance updates
-            for booking in bookings:
-                attended = request.POST.get(f'attended_{booking.id}') == 'on'
-                booking.attended = attended
-                booking.save()
+            # Handle attendance updates as two set-based UPDATEs
+            present_ids = [
+                int(key[len('attended_'):])
+                for key, value in request.POST.items()
+                if key.startswith('attended_') and key[len('attended_'):].isdigit() and value == 'on'
+            ]
+            services.mark_attendance(fitness_class, present_ids)
             messages.success(request, 'Attendance updated successfully!')
-            return redirect('class_attendance', pk=pk)
+            return redirect('booking:class_attendance', pk=pk)
     
     return render(request, 'booking/class_attendance.html', {
         'fitness_class': fitness_class,
         'bookings': bookings
     })
 
+def _attendance_export(request, fitness_class, export_format):
+    filename = f"attendance-{slugify(fitness_class.name) or fitness_class.pk}-{timezone.localtime(fitness_class.start_time):%Y%m%d}"
+    return exports.export_response(
+        request,
+        exports.attendance_rows(fitness_class),
+        filename,
+        export_format,
+        sheet_name='Attendance'
+    )
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def export_attendance(request, pk):
+    """Stream one class's attendance sheet as CSV (default) or ?format=xlsx"""
+    fitness_class = get_object_or_404(FitnessClass, pk=pk)
+    return _attendance_export(request, fitness_class, request.GET.get('format'))
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def export_roster(request):
+    """Stream every booking for classes starting between ?start and ?end (inclusive dates)"""
+    today = timezone.localdate()
+    try:
+        start = parse_date(request.GET['start']) if request.GET.get('start') else today - timedelta(days=30)
+        end = parse_date(request.GET['end']) if request.GET.get('end') else today
+    except ValueError:
+        start = end = None
+    if start is None or end is None or start > end:
+        return HttpResponseBadRequest('start and end must be YYYY-MM-DD dates with start <= end')
+    
+    start_at = timezone.make_aware(datetime.combine(start, time.min))
+    end_at = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    return exports.export_response(
+        request,
+        exports.roster_rows(start_at, end_at),
+        f'roster-{start:%Y%m%d}-{end:%Y%m%d}',
+        request.GET.get('format'),
+        sheet_name='Roster'
+    )
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=ical.feed_etag)
+def calendar_feed(request, token):
+    """A member's bookings or an instructor's classes as an iCalendar feed"""
+    return ical.feed_response(request, ical.feed_state(request, token))
+
+@login_required
+@require_POST
+def reset_calendar_feed(request):
+    """Revoke the user's calendar feed URLs by issuing a new feed key"""
+    Profile.for_user(request.user).reset_calendar_feed_key()
+    messages.success(request, 'Your calendar links have been reset. Subscribe again with the new link.')
+    next_url = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+        next_url = 'booking:my_bookings'
+    return redirect(next_url)
+
 # AJAX/API endpoints
+def class_list_api(request):
+    """JSON page of upcoming classes with cursor tokens for the next/previous page"""
+    page = _upcoming_classes(request)
+    return JsonResponse({
+        'results': [
+            {
+                'id': fitness_class.pk,
+                'name': fitness_class.name,
+                'instructor': fitness_class.instructor,
+                'class_type': fitness_class.class_type,
+                'start_time': fitness_class.start_time,
+                'end_time': fitness_class.end_time,
+                'location': fitness_class.location,
+                'spots_remaining': fitness_class.spots_remaining,
+            }
+            for fitness_class in page
+        ],
+        'next': page.next_cursor,
+        'previous': page.prev_cursor
+    })
+
 @login_required
-def check_class_availability(request, class_id):
+def my_bookings_api(request):
+    """JSON page of the user's upcoming bookings, cursor-paginated like my_bookings"""
+    bookings = Booking.objects.filter(
+        user=request.user,
+        cancelled=False,
+        fitness_class__start_time__gte=timezone.now()
+    ).select_related('fitness_class')
+    page = paginate(bookings, ('fitness_class__start_time', 'id'), request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [
+            {
+                'id': booking.pk,
+                'class_id': booking.fitness_class_id,
+                'class_name': booking.fitness_class.name,
+                'start_time': booking.fitness_class.start_time,
+                'location': booking.fitness_class.location,
+            }
+            for booking in page
+        ],
+        'next': page.next_cursor,
+        'previous': page.prev_cursor
+    })
+
+@aio.login_required
+async def check_class_availability(request, class_id):
     """JSON endpoint for checking class availability"""
+    seats, booked = await aio.gather(
+        lambda: availability.seats_for_ids([class_id]),
+        lambda: availability.booked_class_ids(request.user, [class_id])
+    )
+    rows = availability.availability(request.user, seats, booked)
+    if not rows:
+        raise Http404('No fitness class matches the given query.')
+    
+    row = rows[0]
+    return JsonResponse({
+        'available': row['available'],
+        'is_booked': row['is_booked'],
+        'spots_remaining': row['spots_remaining']
+    })
+
+def _requested_class_ids(request):
+    """Distinct class ids from ?ids=1,2,3; raises ValueError on junk or too many"""
+    raw_ids = ','.join(request.GET.getlist('ids'))
+    try:
+        class_ids = list(dict.fromkeys(int(value) for value in raw_ids.split(',') if value.strip()))
+    except ValueError:
+        raise ValueError('ids must be comma-separated integers')
+    if len(class_ids) > availability.MAX_CLASSES:
+        raise ValueError(f'At most {availability.MAX_CLASSES} classes per request')
+    return class_ids
+
+def class_availability_api(request):
+    """
+    Availability and the user's booking status for many classes in one call:
+    ?ids=1,2,3 for specific classes, otherwise every active class starting
+    between ?start and ?end (inclusive dates, default the coming week)
+    """
+    if request.GET.get('ids'):
+        try:
+            class_ids = _requested_class_ids(request)
+        except ValueError as exc:
+            return HttpResponseBadRequest(str(exc))
+        seats = availability.seats_for_ids(class_ids)
+        missing = [pk for pk in class_ids if pk not in seats]
+    else:
+        today = timezone.localdate()
+        try:
+            start = parse_date(request.GET['start']) if request.GET.get('start') else today
+            end = parse_date(request.GET['end']) if request.GET.get('end') else today + timedelta(days=6)
+        except ValueError:
+            start = end = None
+        if start is None or end is None or start > end:
+            return HttpResponseBadRequest('start and end must be YYYY-MM-DD dates with start <= end')
+        seats = availability.seats_for_window(
+            timezone.make_aware(datetime.combine(start, time.min)),
+            timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        )
+        missing = []
+    
+    return JsonResponse({
+        'results': availability.availability(request.user, seats),
+        'missing': missing
+    })
+
+async def _seat_events(class_ids):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.LIVE_SEATS_STREAM_TIMEOUT
+    # Subscribe before reading the current counts so no change falls between
+    async with live.get_broker().subscribe(class_ids) as subscription:
+        seats = await sync_to_async(availability.seats_for_ids)(class_ids)
+        yield f'retry: {live.RETRY_MS}\n\n' + ''.join(
+            live.sse_event(live.seat_message(pk, spots)) for pk, spots in seats.items()
+        )
+        # Streams end on a deadline and the browser reconnects: a client that
+        # went away is noticed at the latest then
+        while (remaining := deadline - loop.time()) > 0:
+            messages = await subscription.get(min(settings.LIVE_SEATS_HEARTBEAT, remaining))
+            if messages:
+                yield ''.join(live.sse_event(message) for message in messages)
+            else:
+                yield ': keepalive\n\n'
+
+async def class_seat_stream(request):
+    """
+    Server-Sent Events for ?ids=1,2,3: each class's seat count now, then again
+    whenever it changes. Only served where LIVE_SEATS_ENABLED (uvicorn workers):
+    under WSGI the stream is buffered until it ends and holds a worker throughout.
+    """
+    if not settings.LIVE_SEATS_ENABLED:
+        return HttpResponse('Live seat counts are not available on this server', status=501)
+    try:
+        class_ids = _requested_class_ids(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    if not class_ids:
+        return HttpResponseBadRequest('ids is required')
+    
+    response = StreamingHttpResponse(_seat_events(class_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+@require_POST
+def quick_book_class(request, class_id):
+    """Book a class via AJAX using the same service as book_class"""
     fitness_class = get_object_or_404(FitnessClass, pk=class_id)
-    is_booked = Booking.objects.filter(
-        user=request.user,
-        fitness_class=fitness_class,
-        cancelled=False
-    ).exists()
+    
+    try:
+        booking, reinstated, entry = services.book_or_waitlist(request.user, fitness_class)
+    except BookingError as exc:
+        return JsonResponse({
+            'success': False,
+            'message': str(exc.message),
+            'spots_remaining': fitness_class.spots_remaining
+        }, status=409)
+    
+    if entry is not None:
+        return JsonResponse({
+            'success': False,
+            'waitlisted': True,
+            'message': 'Class is full; added to the waitlist',
+            'waitlist_position': entry.position,
+            'spots_remaining': 0
+        }, status=202)
     
     return JsonResponse({
-        'available': not fitness_class.is_full(),
-        'is_booked': is_booked,
+        'success': True,
+        'message': 'Booking reinstated' if reinstated else 'Class booked',
+        'booking_id': booking.pk,
         'spots_remaining': fitness_class.spots_remaining
     })
 
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def read_cache_stats_api(request):
+    """This worker's read-model cache hit/miss counts"""
+    return JsonResponse(readcache.stats())
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def db_pool_stats_api(request):
+    """This worker's database connection usage: open, idle and in-use connections and wait times"""
+    return JsonResponse({
+        alias: dbpool.stats(alias) for alias in settings.DATABASES
+    })
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+@require_POST
+def bulk_attendance_api(request, pk):
+    """
+    JSON check-in endpoint for the front-desk tablets.
+
+    Expects ``{"present": [booking ids], "absent": [booking ids]}``; only the
+    listed bookings change.
+    """
+    fitness_class = get_object_or_404(FitnessClass, pk=pk)
+    try:
+        payload = json.loads(request.body or b'{}')
+        present_ids = [int(pk) for pk in payload.get('present', [])]
+        absent_ids = [int(pk) for pk in payload.get('absent', [])]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'message': 'Invalid attendance payload'}, status=400)
+    
+    marked_present, marked_absent = services.mark_attendance(fitness_class, present_ids, absent_ids)
+    return JsonResponse({
+        'success': True,
+        'marked_present': marked_present,
+        'marked_absent': marked_absent
+    })
+
 @login_required
 def quick_cancel_booking(request, booking_id):
     """Handle quick cancellation via AJAX"""
@@ -421,5 +755,3 @@ def csrf_failure(request, reason=""):
 def custom_admin_logout(request):
     logout(request)
     return redirect('admin  :login')
-def home(request):
-    return render(request, 'booking/home.html')
@@ -76,7 +76,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'booking.middleware.QueryStatsMiddleware',  # Outermost app middleware so session/auth queries count
+    'booking.sessions.CoalescingSessionMiddleware',  # SessionMiddleware with coalesced expiry refreshes
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -122,6 +123,41 @@ DATABASES = {
     }
 }
 
+# Connection reuse (booking.dbpool). ``persistent``: each worker thread keeps
+# a health-checked connection for DB_CONN_MAX_AGE seconds (sync/gthread
+# workers). ``pool``: greenlets share DB_POOL_MAX_CONNS connections per
+# process (gevent workers). Keep GUNICORN_WORKERS x (GUNICORN_THREADS +
+# ASYNC_QUERY_THREADS, or DB_POOL_MAX_CONNS) under Postgres max_connections;
+# dbpool.connection_budget() does the sum. Under uvicorn workers
+# (ASGI) connections default to per-request; see gunicorn.conf.py.
+DB_CONN_MODE = os.getenv('DB_CONN_MODE', 'persistent')
+DB_POOL_MAX_CONNS = int(os.getenv('DB_POOL_MAX_CONNS', '10'))
+GUNICORN_WORKER_CLASS = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+GUNICORN_WORKERS = int(os.getenv('GUNICORN_WORKERS', '4'))
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '1'))
+GUNICORN_WORKER_CONNECTIONS = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '200'))
+# Threads per process running the async views' independent queries side by
+# side (booking.aio.gather); 1 runs them one after another
+ASYNC_QUERY_THREADS = int(os.getenv('ASYNC_QUERY_THREADS', '4'))
+if DB_CONN_MODE == 'pool':
+    DATABASES['default'].update({
+        'ENGINE': 'booking.dbpool',
+        # The pool owns connection lifetime; Django hands each one back per request
+        'CONN_MAX_AGE': 0,
+    })
+    DATABASES['default']['OPTIONS'].update({
+        'MAX_CONNS': DB_POOL_MAX_CONNS,
+        'REUSE_CONNS': int(os.getenv('DB_POOL_REUSE_CONNS', str(DB_POOL_MAX_CONNS))),
+    })
+else:
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv(
+            'DB_CONN_MAX_AGE',
+            '0' if GUNICORN_WORKER_CLASS == 'uvicorn' else '60'
+        )),
+        'CONN_HEALTH_CHECKS': True,
+    })
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -165,6 +201,103 @@ EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 
+# Email outbox (drained by `python manage.py send_queued_emails`)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', '100'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('EMAIL_OUTBOX_RETRY_BASE_SECONDS', '60'))
+
+# Caches: shared through Redis when REDIS_URL is set (docker-compose), so
+# every worker sees the same entries; per-process memory otherwise
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'fitness',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Read-model cache (booking.readcache): the shared tier's cache alias, the
+# size and entry lifetime of the in-process LRU tier in front of it, and the
+# default lifetime in the shared tier (seconds)
+READ_CACHE_ALIAS = os.getenv('READ_CACHE_ALIAS', 'default')
+READ_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv('READ_CACHE_LOCAL_MAX_ENTRIES', '2000'))
+READ_CACHE_LOCAL_TIMEOUT = int(os.getenv('READ_CACHE_LOCAL_TIMEOUT', '30'))
+READ_CACHE_TIMEOUT = int(os.getenv('READ_CACHE_TIMEOUT', '60'))
+
+# Home page "popular classes" leaderboard cache lifetime (seconds)
+POPULAR_CLASSES_CACHE_TIMEOUT = int(os.getenv('POPULAR_CLASSES_CACHE_TIMEOUT', '60'))
+
+# class_detail fragment cache lifetime, and how stale its "similar classes"
+# list may get before conditional GETs stop returning 304 (seconds)
+CLASS_DETAIL_CACHE_TIMEOUT = int(os.getenv('CLASS_DETAIL_CACHE_TIMEOUT', '300'))
+
+# How long seat counts are served from the read cache (seconds); bookings
+# retire them early through versioned keys
+AVAILABILITY_CACHE_TIMEOUT = int(os.getenv('AVAILABILITY_CACHE_TIMEOUT', '60'))
+
+# Live seat counts (booking.live): whether class pages open the stream (only
+# under uvicorn workers; WSGI buffers the whole stream and pins a worker
+# until it ends), the broker class, the Redis URL that RedisBroker publishes
+# through, seconds between keepalive comments and seconds before a stream
+# ends and the browser reconnects
+LIVE_SEATS_ENABLED = os.getenv('LIVE_SEATS_ENABLED', 'False') == 'True'
+LIVE_SEATS_BROKER = os.getenv('LIVE_SEATS_BROKER', 'booking.live.LocalBroker')
+LIVE_SEATS_REDIS_URL = os.getenv('LIVE_SEATS_REDIS_URL', '')
+LIVE_SEATS_HEARTBEAT = int(os.getenv('LIVE_SEATS_HEARTBEAT', '15'))
+LIVE_SEATS_STREAM_TIMEOUT = int(os.getenv('LIVE_SEATS_STREAM_TIMEOUT', '300'))
+
+# Upper bound on how long a member's cached profile statistics live (seconds)
+MEMBER_STATS_CACHE_TIMEOUT = int(os.getenv('MEMBER_STATS_CACHE_TIMEOUT', '3600'))
+
+# iCalendar feeds (booking.ical): how many days of past classes they keep,
+# how long a built feed stays in the read cache (seconds) and the domain
+# part of event UIDs
+CALENDAR_FEED_PAST_DAYS = int(os.getenv('CALENDAR_FEED_PAST_DAYS', '30'))
+CALENDAR_FEED_CACHE_TIMEOUT = int(os.getenv('CALENDAR_FEED_CACHE_TIMEOUT', '86400'))
+CALENDAR_FEED_UID_DOMAIN = os.getenv('CALENDAR_FEED_UID_DOMAIN', 'fitness-booking')
+
+# Class reminders (`python manage.py send_booking_reminders`)
+BOOKING_REMINDER_CHUNK_SIZE = int(os.getenv('BOOKING_REMINDER_CHUNK_SIZE', '1000'))
+
+# Per-request query instrumentation (booking.middleware.QueryStatsMiddleware):
+# X-DB-* response headers in debug/staging (the slowest SQL only in debug),
+# a log line per request always, raised to WARNING above these thresholds
+QUERY_STATS_HEADERS = os.getenv('QUERY_STATS_HEADERS', str(DEBUG)) == 'True'
+QUERY_STATS_SQL_HEADER = os.getenv('QUERY_STATS_SQL_HEADER', str(DEBUG)) == 'True'
+QUERY_STATS_WARN_COUNT = int(os.getenv('QUERY_STATS_WARN_COUNT', '50'))
+QUERY_STATS_WARN_MS = int(os.getenv('QUERY_STATS_WARN_MS', '500'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'booking.queries': {
+            'handlers': ['console'],
+            'level': os.getenv('QUERY_STATS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -199,8 +332,19 @@ if not DEBUG:
 ADMIN_URL = os.getenv('ADMIN_URL', 'fitness-admin/')
 
 # Session settings
-SESSION_COOKIE_AGE = 3600  # 1 hour session duration
-SESSION_SAVE_EVERY_REQUEST = True  # Extend session on activity
+# cached_db needs a cache every worker shares; plain db otherwise.
+# booking.sessions.signed_cookies keeps sessions out of the database entirely.
+SESSION_ENGINE = os.getenv(
+    'SESSION_ENGINE',
+    'booking.sessions.cached_db' if REDIS_URL else 'booking.sessions.db'
+)
+SESSION_COOKIE_AGE = 3600  # 1 hour session duration, sliding on activity
+# Saved only when changed, or to extend the expiry once this share of
+# SESSION_COOKIE_AGE has passed (booking.sessions.CoalescingSessionMiddleware)
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_FRACTION = float(os.getenv('SESSION_REFRESH_FRACTION', '0.1'))
+# Rows per DELETE when `manage.py clearsessions` purges expired sessions
+SESSION_CLEANUP_BATCH_SIZE = int(os.getenv('SESSION_CLEANUP_BATCH_SIZE', '1000'))
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True  # Session ends when browser closes
 SESSION_COOKIE_SAMESITE = 'Lax'  # Allows top-level redirects
 
@@ -0,0 +1,15 @@
+"""
+Gunicorn worker for the ASGI profile (GUNICORN_WORKER_CLASS=uvicorn).
+"""
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    """
+    UvicornWorker that caps in-flight requests at gunicorn's
+    worker_connections, which also caps the Postgres connections they hold
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.limit_concurrency = self.cfg.worker_connections
@@ -0,0 +1,54 @@
+"""
+Gunicorn settings, read from the environment.
+
+GUNICORN_WORKER_CLASS is ``sync`` (default), ``gthread``, ``gevent`` or
+``uvicorn``. Postgres connections per worker follow the worker class:
+
+* sync: one persistent connection
+* gthread: one per thread (GUNICORN_THREADS)
+* gevent: set DB_CONN_MODE=pool so greenlets share DB_POOL_MAX_CONNS
+* uvicorn: serve fitness_project.asgi:application (docker-compose.asgi.yml).
+  Each in-flight request, at most GUNICORN_WORKER_CONNECTIONS, may hold a
+  connection. Connections are closed after each request (DB_CONN_MAX_AGE=0),
+  because every ASGI request runs its ORM calls on a fresh thread and a
+  persistent one would leak
+
+Outside pool mode, add ASYNC_QUERY_THREADS under every worker class: the
+async views run under WSGI workers too, and each booking.aio query thread
+keeps its own connection. GUNICORN_WORKERS times that figure must stay
+under Postgres max_connections.
+/api/db-pool-stats/ reports the resulting budget.
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+if worker_class == 'uvicorn':
+    worker_class = 'fitness_project.workers.UvicornWorker'
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+# Concurrent requests (greenlets) per gevent worker; in-flight requests per
+# uvicorn worker
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '200'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# Recycle workers now and then so a leak cannot grow forever
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = max_requests // 10
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 would otherwise block the whole worker on every query
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def when_ready(server):
+    if worker_class == 'gevent' and os.getenv('DB_CONN_MODE') != 'pool':
+        server.log.warning(
+            'gevent workers without DB_CONN_MODE=pool open a Postgres connection per greenlet'
+        )
+    if worker_class.endswith('UvicornWorker') and os.getenv('DB_CONN_MAX_AGE', '0') != '0':
+        server.log.warning(
+            'uvicorn workers with DB_CONN_MAX_AGE set leak a Postgres connection per request'
+        )